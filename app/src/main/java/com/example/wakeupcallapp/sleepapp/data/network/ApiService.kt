@@ -46,6 +46,7 @@ interface ApiService {
     @POST("survey/generate-pdf")
     @Streaming
     suspend fun downloadReport(
-        @Header("Authorization") token: String
+        @Header("Authorization") token: String,
+        @Query("wait") waitSeconds: Int = 45  // server renders asynchronously; wait for the PDF itself
     ): Response<okhttp3.ResponseBody>
 }
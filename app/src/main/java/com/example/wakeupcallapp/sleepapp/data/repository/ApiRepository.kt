@@ -178,6 +178,11 @@ class ApiRepository {
             android.util.Log.d("ApiRepository", "📡 Response successful: ${response.isSuccessful}")
             android.util.Log.d("ApiRepository", "📡 Response body null: ${response.body() == null}")
             
+            if (response.code() == 202) {
+                // Still rendering on the server after the wait window; a retry picks up the same job
+                return@withContext Result.failure(Exception("Report is still being generated, please try again"))
+            }
+            
             if (response.isSuccessful && response.body() != null) {
                 val responseBody = response.body()!!
                 
@@ -2,108 +2,84 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import pickle
 import numpy as np
-import pandas as pd
 from datetime import datetime, timedelta
 import os
 import sqlite3
 import secrets
+import threading
+import itertools
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 from recommendation_engine import RecommendationEngine
-
-# Try joblib first (more compatible with scikit-learn models), fall back to pickle
-try:
-    import joblib
-    USE_JOBLIB = True
-except ImportError:
-    USE_JOBLIB = False
-    print("⚠️ joblib not installed, using pickle (may have compatibility issues with newer Python versions)")
+import database
+import schema
+import migrations
+import daily_metrics
+import survey_outputs
+from token_cache import TokenCache, read_generation, bump_generation
+from token_sweeper import TokenSweeper
+from features import FEATURES, NUM_COLS, feature_dict, google_fit_features, predict_features, survey_features
+from scoring import ModelScorer, PredictionCache, file_fingerprint
+from compiled_model import CompiledForest, check_parity
+from lookup_table import GoogleFitLookupTable, flags_mask
+from reports import ReportJobs, report_job_id, stream_zip
+from survey_scoring import (calculate_berlin_score, calculate_ess_score, calculate_stopbang_score,
+                            overall_risk_level, score_records, score_rows)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = secrets.token_hex(32)
 CORS(app)  # Enable CORS for Android app to access the API
 
 # Database setup
-DATABASE = 'wakeup_call.db'
+DATABASE = os.environ.get('WAKEUPCALL_DATABASE', 'wakeup_call.db')
+db_pool = database.ConnectionPool(DATABASE)
+database.init_app(app, db_pool)
 
 def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get database connection (pooled; shared for the rest of the request)"""
+    return database.get_connection(db_pool)
 
 def init_db():
-    """Initialize database with users table"""
+    """Bring the database schema up to date (see migrations.py)"""
     conn = get_db()
-    cursor = conn.cursor()
-    
-    # Users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            first_name TEXT NOT NULL,
-            last_name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Auth tokens table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS auth_tokens (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            token TEXT UNIQUE NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            expires_at TIMESTAMP NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    # User survey data table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_surveys (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            -- Demographics
-            age INTEGER,
-            sex TEXT,
-            height_cm REAL,
-            weight_kg REAL,
-            neck_circumference_cm REAL,
-            bmi REAL,
-            -- Medical history
-            hypertension INTEGER,
-            diabetes INTEGER,
-            depression INTEGER DEFAULT 0,
-            smokes INTEGER,
-            alcohol INTEGER,
-            -- Survey scores
-            ess_score INTEGER,
-            berlin_score INTEGER,
-            stopbang_score INTEGER,
-            -- ML prediction
-            osa_probability REAL,
-            risk_level TEXT,
-            -- Google Fit data
-            daily_steps INTEGER,
-            average_daily_steps INTEGER,
-            sleep_duration_hours REAL,
-            weekly_steps_json TEXT,
-            weekly_sleep_json TEXT,
-            completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    conn.commit()
+    applied = migrations.migrate(conn)
     conn.close()
+    for version, name in applied:
+        print(f"   Applied migration {version:03d} {name}")
     print("✅ Database initialized successfully!")
 
 # Initialize database on startup
 init_db()
 
+# Validated-token cache for require_auth
+TOKEN_CACHE_SIZE = 10000
+TOKEN_REVOCATION_POLL_SECONDS = 2.0
+
+
+def read_revocation_generation():
+    """Shared revocation counter (bumped by logouts in any worker)"""
+    conn = get_db()
+    generation = read_generation(conn)
+    conn.close()
+    return generation
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE, read_revocation_generation, TOKEN_REVOCATION_POLL_SECONDS)
+
+# Expired-token cleanup and per-user token cap, on a background thread
+TOKEN_SWEEP_INTERVAL = 3600  # seconds
+TOKEN_SWEEP_BATCH_SIZE = 500
+MAX_TOKENS_PER_USER = 10
+
+
+def revoke_cached_tokens(tokens, generation):
+    token_cache.evict(*tokens, generation=generation)
+
+
+token_sweeper = TokenSweeper(db_pool, TOKEN_SWEEP_INTERVAL, TOKEN_SWEEP_BATCH_SIZE,
+                             MAX_TOKENS_PER_USER, on_revoke=revoke_cached_tokens)
+
 def require_auth(f):
     """Decorator to require authentication token (supports guest mode)"""
     @wraps(f)
@@ -129,14 +105,16 @@ def require_auth(f):
             }
             return f(*args, **kwargs)
         
+        cached_user = token_cache.get(token)
+        if cached_user is not None:
+            request.current_user = cached_user
+            return f(*args, **kwargs)
+        
+        # Taken before the read so a logout racing it keeps the token out of the cache
+        cache_epoch = token_cache.epoch()
         conn = get_db()
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT u.id, u.email, u.first_name, u.last_name 
-            FROM users u 
-            JOIN auth_tokens t ON u.id = t.user_id 
-            WHERE t.token = ? AND t.expires_at > ?
-        ''', (token, datetime.now()))
+        cursor.execute(schema.AUTH_USER_BY_TOKEN, (token, datetime.now()))
         
         user = cursor.fetchone()
         conn.close()
@@ -152,15 +130,34 @@ def require_auth(f):
             'last_name': user[3],
             'is_guest': False
         }
+        token_cache.put(token, request.current_user, user[4], epoch=cache_epoch)
         
         return f(*args, **kwargs)
     
     return decorated_function
 
-# Load the trained model pipeline
-# Using final_lgbm_pipeline.pkl which contains the complete pipeline
+# Accounts allowed to use the /admin endpoints (comma-separated emails)
+ADMIN_EMAILS = {email.strip().lower() for email in os.environ.get('WAKEUPCALL_ADMIN_EMAILS', '').split(',')
+                if email.strip()}
+
+
+def require_admin(f):
+    """Decorator to require an authenticated admin account (see ADMIN_EMAILS)"""
+    @require_auth
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        user = request.current_user
+        if user.get('is_guest') or user['email'].lower() not in ADMIN_EMAILS:
+            return jsonify({'error': 'Admin access required', 'success': False}), 403
+        return f(*args, **kwargs)
+    
+    return decorated_function
+
+# Trained model pipeline, loaded on first use by get_model() (or in the gunicorn
+# master before forking, see gunicorn.conf.py) so importing app stays cheap
 model = None
 scaler = None
+model_version = ''
 
 # Model paths - prioritize lightgbm_sleep_apnea_model.pkl
 MODEL_PATHS = [
@@ -172,84 +169,140 @@ MODEL_PATHS = [
     os.path.join(os.path.dirname(__file__), '..', 'model', 'final_lgbm_pipeline.pkl'),  # fallback
 ]
 
+# Inference engine: 'lightgbm' scores through the pickled model, 'compiled' evaluates
+# the trees flattened into NumPy arrays (see compiled_model.py; no lightgbm needed at serve time)
+INFERENCE_ENGINE = os.environ.get('WAKEUPCALL_INFERENCE_ENGINE', 'lightgbm').lower()
+COMPILED_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'lightgbm_sleep_apnea_model.compiled.npz')
+
 SCALER_PATHS = [
     os.path.join(os.path.dirname(__file__), 'scaler.pkl'),  # backend folder
     os.path.join(os.path.dirname(__file__), '..', 'model', 'scaler.pkl'),  # model folder
 ]
 
-# Load model
-for model_path in MODEL_PATHS:
-    if os.path.exists(model_path):
+
+def load_model():
+    """
+    Load the model and optional scaler from disk (imports joblib and, through
+    unpickling, lightgbm/sklearn). Returns (model, scaler, model_version).
+    """
+    # Try joblib first (more compatible with scikit-learn models), fall back to pickle
+    try:
+        import joblib
+        use_joblib = True
+    except ImportError:
+        use_joblib = False
+        print("⚠️ joblib not installed, using pickle (may have compatibility issues with newer Python versions)")
+
+    model = None
+    scaler = None
+
+    # Load a previously compiled model if it is newer than the pickle it came from
+    if INFERENCE_ENGINE == 'compiled' and os.path.exists(COMPILED_MODEL_PATH) and (
+            not os.path.exists(MODEL_PATHS[0])
+            or os.path.getmtime(COMPILED_MODEL_PATH) >= os.path.getmtime(MODEL_PATHS[0])):
         try:
-            if USE_JOBLIB:
-                loaded_data = joblib.load(model_path)
-            else:
-                with open(model_path, 'rb') as f:
-                    loaded_data = pickle.load(f)
-            
-            # Check if it's a dict with model and scaler
-            if isinstance(loaded_data, dict):
-                model = loaded_data.get('model')
-                if not scaler:  # Only use dict scaler if separate file not found
-                    scaler = loaded_data.get('scaler')
-                print(f"✅ Model loaded from dictionary: {model_path}")
-            else:
-                # It's just the model object (pipeline)
-                model = loaded_data
-                print(f"✅ Model loaded from: {model_path}")
-            
-            if model is not None:
-                break
+            model = CompiledForest.load(COMPILED_MODEL_PATH)
+            print(f"✅ Compiled model loaded from: {COMPILED_MODEL_PATH}")
         except Exception as e:
-            print(f"⚠️ Error loading model from {model_path}: {e}")
-            # Try with pickle and latin1 encoding for compatibility
-            if 'WakeUpCall_3Class5Fold' in model_path:
-                try:
-                    print(f"   Attempting compatibility mode for {os.path.basename(model_path)}...")
+            print(f"⚠️ Error loading compiled model from {COMPILED_MODEL_PATH}: {e}")
+
+    # Load model
+    for model_path in MODEL_PATHS:
+        if model is not None:
+            break
+        if os.path.exists(model_path):
+            try:
+                if use_joblib:
+                    loaded_data = joblib.load(model_path)
+                else:
                     with open(model_path, 'rb') as f:
-                        loaded_data = pickle.load(f, encoding='latin1')
+                        loaded_data = pickle.load(f)
+
+                # Check if it's a dict with model and scaler
+                if isinstance(loaded_data, dict):
+                    model = loaded_data.get('model')
+                    if not scaler:  # Only use dict scaler if separate file not found
+                        scaler = loaded_data.get('scaler')
+                    print(f"✅ Model loaded from dictionary: {model_path}")
+                else:
+                    # It's just the model object (pipeline)
                     model = loaded_data
-                    print(f"✅ Model loaded with compatibility mode: {model_path}")
+                    print(f"✅ Model loaded from: {model_path}")
+
+                if model is not None:
                     break
-                except Exception as e2:
-                    print(f"   Compatibility mode also failed: {e2}")
+            except Exception as e:
+                print(f"⚠️ Error loading model from {model_path}: {e}")
+                # Try with pickle and latin1 encoding for compatibility
+                if 'WakeUpCall_3Class5Fold' in model_path:
+                    try:
+                        print(f"   Attempting compatibility mode for {os.path.basename(model_path)}...")
+                        with open(model_path, 'rb') as f:
+                            loaded_data = pickle.load(f, encoding='latin1')
+                        model = loaded_data
+                        print(f"✅ Model loaded with compatibility mode: {model_path}")
+                        break
+                    except Exception as e2:
+                        print(f"   Compatibility mode also failed: {e2}")
 
-# Load scaler separately (optional, for backwards compatibility with old models)
-for scaler_path in SCALER_PATHS:
-    if os.path.exists(scaler_path):
+    # Model version (content hash of the loaded file) - part of every prediction cache key
+    version = ''
+    if model is not None:
+        version = file_fingerprint(COMPILED_MODEL_PATH if isinstance(model, CompiledForest) else model_path)
+
+    # Compile the loaded model for NumPy inference, verifying parity on a fixed input grid
+    if INFERENCE_ENGINE == 'compiled' and model is not None and not isinstance(model, CompiledForest):
         try:
-            if USE_JOBLIB:
-                scaler = joblib.load(scaler_path)
+            compiled = CompiledForest.from_model(model)
+            max_diff = check_parity(model, compiled)
+            if max_diff > 1e-6:
+                print(f"⚠️ Compiled model parity check failed (max diff {max_diff:.2e}), using LightGBM")
             else:
-                with open(scaler_path, 'rb') as f:
-                    scaler = pickle.load(f)
-            print(f"✅ Scaler loaded from: {scaler_path}")
-            break
+                model = compiled
+                model.save(COMPILED_MODEL_PATH)
+                print(f"✅ Model compiled for NumPy inference (parity max diff {max_diff:.2e})")
         except Exception as e:
-            print(f"⚠️ Error loading scaler from {scaler_path}: {e}")
-
-if model is None:
-    print("⚠️ Model file not found. Expected one of:")
-    for p in MODEL_PATHS:
-        print(f"   - {p}")
-    print("Please ensure lgbm_model.pkl exists in backend or model folder!")
-else:
-    print("✅ Model loaded successfully!")
-
-if scaler is None:
-    print("⚠️ Scaler file not found. Expected one of:")
-    for p in SCALER_PATHS:
-        print(f"   - {p}")
-    print("Please ensure scaler.pkl exists in backend or model folder!")
-else:
-    print("✅ Scaler loaded successfully!")
+            print(f"⚠️ Could not compile model, using LightGBM: {e}")
+
+    # Load scaler separately (optional, for backwards compatibility with old models)
+    for scaler_path in SCALER_PATHS:
+        if os.path.exists(scaler_path):
+            try:
+                if use_joblib:
+                    scaler = joblib.load(scaler_path)
+                else:
+                    with open(scaler_path, 'rb') as f:
+                        scaler = pickle.load(f)
+                print(f"✅ Scaler loaded from: {scaler_path}")
+                break
+            except Exception as e:
+                print(f"⚠️ Error loading scaler from {scaler_path}: {e}")
+
+    if model is None:
+        print("⚠️ Model file not found. Expected one of:")
+        for p in MODEL_PATHS:
+            print(f"   - {p}")
+        print("Please ensure lgbm_model.pkl exists in backend or model folder!")
+    else:
+        print("✅ Model loaded successfully!")
+
+    if scaler is None:
+        print("⚠️ Scaler file not found. Expected one of:")
+        for p in SCALER_PATHS:
+            print(f"   - {p}")
+        print("Please ensure scaler.pkl exists in backend or model folder!")
+    else:
+        print("✅ Scaler loaded successfully!")
+
+    return model, scaler, version
+
 
 def generate_ml_recommendation(osa_probability, risk_level, age, bmi, neck_cm, hypertension, diabetes, smokes, alcohol, ess_score, berlin_score, stopbang_score, sleep_duration=7.0, daily_steps=5000):
     """Generate personalized recommendations using comprehensive recommendation engine"""
     
-    # Use the new RecommendationEngine
+    # Use the new RecommendationEngine; the pipe-separated API text is cached per rule mask
     sex = 1  # Default to male (conservative for OSA risk)
-    recommendations = RecommendationEngine.generate_recommendations(
+    return RecommendationEngine.generate_api_text(
         age=age,
         sex=sex,
         bmi=bmi,
@@ -265,9 +318,6 @@ def generate_ml_recommendation(osa_probability, risk_level, age, bmi, neck_cm, h
         daily_steps=daily_steps,
         risk_level=risk_level
     )
-    
-    # Format for API response (pipe-separated)
-    return RecommendationEngine.format_for_api(recommendations)
 
 def calculate_top_risk_factors(input_features, osa_probability):
     """Calculate top risk factors based on actual survey data and thresholds"""
@@ -348,152 +398,117 @@ def calculate_top_risk_factors(input_features, osa_probability):
     
     return formatted_factors
 
-# Feature list (must match WakeUpCall_3Class5Fold_Pipeline.pkl training order)
-# Based on new model with 33 engineered features - 27 input features
-# Includes Age_Group, Depression, and individual STOP/BANG items
-FEATURES = [
-    'Age', 'Age_Group', 'Sex', 'Height', 'Weight', 'BMI', 'Neck_Circumference',
-    'Smokes', 'Alcohol', 'Snoring', 'Sleepiness',
-    'Epworth_Score', 'Berlin_Score',
-    'Hypertension', 'Diabetes', 'Depression',
-    'STOP_Snore', 'STOP_Tired', 'STOP_ObsApnea', 'STOP_Pressure',
-    'BANG_Age', 'BANG_BMI', 'BANG_Neck', 'BANG_Gender',
-    'STOPBANG'
-]
+# Prediction cache (LRU + TTL) in front of model scoring
+PREDICTION_CACHE_SIZE = 4096
+PREDICTION_CACHE_TTL = 3600  # seconds
+prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL)
 
-# Columns to scale (numerical features) - pipeline handles scaling internally
-NUM_COLS = [
-    'Age', 'Height', 'Weight', 'BMI', 'Neck_Circumference', 'Epworth_Score', 'STOPBANG'
-]
+# Shared scorer (single predict_proba pass per request)
+scorer = None
 
+# /predict-from-google-fit mode: 'model' scores every request, 'table' answers from the
+# precomputed lookup table (build it with `python lookup_table.py build`)
+GOOGLE_FIT_MODE = os.environ.get('WAKEUPCALL_GOOGLE_FIT_MODE', 'model').lower()
+GOOGLE_FIT_TABLE_PATH = os.environ.get(
+    'WAKEUPCALL_GOOGLE_FIT_TABLE', os.path.join(os.path.dirname(__file__), 'google_fit_table.npy'))
+google_fit_table = None
 
-def calculate_age_group(age):
-    """Calculate age group from age (used for model input)"""
-    if age < 30:
-        return 0
-    elif age < 50:
-        return 1
-    else:
-        return 2
 
+def load_google_fit_table(version):
+    """Open the lookup table for this model version, or None (falls back to the model)"""
+    if GOOGLE_FIT_MODE != 'table':
+        return None
+    try:
+        table = GoogleFitLookupTable.load(GOOGLE_FIT_TABLE_PATH, version)
+        print(f"✅ Google Fit lookup table loaded (max deviation {table.meta.get('max_deviation')})")
+        return table
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Google Fit lookup table unavailable, scoring with the model: {e}")
+        return None
 
-def calculate_bang_items(age, bmi, neck_circumference, sex):
-    """
-    Calculate individual BANG items from anthropometric data.
-    Returns dict with BANG_Age, BANG_BMI, BANG_Neck, BANG_Gender
-    """
-    return {
-        'BANG_Age': 1 if age > 50 else 0,
-        'BANG_BMI': 1 if bmi > 35 else 0,
-        'BANG_Neck': 1 if neck_circumference > 40 else 0,
-        'BANG_Gender': 1 if sex == 1 else 0  # 1=Male
-    }
 
+def set_model(new_model, version=''):
+    """Install a newly loaded model: rebuilds the scorer and invalidates cached predictions"""
+    global model, model_version, scorer, google_fit_table, _model_loaded
+    model = new_model
+    _model_loaded = True
+    model_version = version
+    if new_model is None:
+        scorer = None
+        google_fit_table = None
+        prediction_cache.clear()
+    else:
+        scorer = ModelScorer(new_model, FEATURES, model_version=version, cache=prediction_cache)
+        google_fit_table = load_google_fit_table(version)
 
-# ============ SURVEY CALCULATION UTILITIES ============
 
-def calculate_ess_score(responses):
-    """
-    Calculate Epworth Sleepiness Scale (ESS) score from survey responses.
-    responses: list of 8 integers (0-3 for each question)
-    Returns: (score, category)
-    """
-    score = sum(responses)
-    
-    if score <= 5:
-        category = "Low daytime sleepiness (normal)"
-    elif score <= 10:
-        category = "High daytime sleepiness (normal)"
-    elif score in [11, 12]:
-        category = "Mild excessive daytime sleepiness"
-    elif score in range(13, 16):
-        category = "Moderate excessive daytime sleepiness"
-    elif score in range(16, 25):
-        category = "Severe excessive daytime sleepiness"
-    else:
-        category = "Invalid"
-    
-    return score, category
+_model_lock = threading.Lock()
+_model_loaded = False
 
 
-def calculate_berlin_score(category1_items, category2_items, category3_sleepy, bmi):
+def get_model():
     """
-    Calculate Berlin Questionnaire score.
-    Returns: (positive_categories_count, risk_category)
+    The prediction model (None if no model file could be loaded), loaded on the
+    first call. Endpoints that score go through this; / and /auth/* never do,
+    so they answer without joblib/lightgbm/sklearn being imported.
     """
-    positive_categories = 0
-    
-    # Category 1: Snoring and breathing (items 2-6)
-    cat1_score = sum(1 for v in category1_items.values() if v)
-    if cat1_score >= 2:
-        positive_categories += 1
-    
-    # Category 2: Daytime sleepiness (items 7-9)
-    cat2_score = sum(1 for v in category2_items.values() if v)
-    if cat2_score >= 2:
-        positive_categories += 1
-    
-    # Category 3: Sleepiness or BMI > 30
-    if category3_sleepy or bmi > 30:
-        positive_categories += 1
-    
-    risk_category = "High Risk" if positive_categories >= 2 else "Low Risk"
-    
-    return positive_categories, risk_category
+    global scaler
+    if not _model_loaded:
+        with _model_lock:
+            if not _model_loaded:
+                loaded_model, scaler, version = load_model()
+                set_model(loaded_model, version)
+    return model
 
 
-def calculate_stopbang_score(snoring, tired, observed, pressure, age, neck_circumference, bmi, male):
-    """
-    Calculate STOP-BANG score.
-    Returns: (total_score, risk_category)
-    """
-    total_score = 0
-    stop_score = 0
-    
-    # STOP questions
-    if snoring:
-        total_score += 1
-        stop_score += 1
-    if tired:
-        total_score += 1
-        stop_score += 1
-    if observed:
-        total_score += 1
-        stop_score += 1
-    if pressure:
-        total_score += 1
-        stop_score += 1
-    
-    # BANG questions
-    if age > 50:
-        total_score += 1
-    if neck_circumference >= 40.0:
-        total_score += 1
-    if bmi > 35:
-        total_score += 1
-    if male:
-        total_score += 1
-    
-    # Determine risk level according to README.md
-    if total_score >= 5:
-        risk_category = "High Risk"
-    elif stop_score >= 2 and (male or bmi > 35 or neck_circumference >= 40.0):
-        risk_category = "High Risk"
-    elif total_score in range(3, 5):
-        risk_category = "Intermediate Risk"
-    else:
-        risk_category = "Low Risk"
-    
-    return total_score, risk_category
+def model_state():
+    """'loaded', 'failed' (no model file could be loaded) or 'not_loaded' (get_model() not called yet)"""
+    if not _model_loaded:
+        return 'not_loaded'
+    return 'loaded' if model is not None else 'failed'
 
 
 @app.route('/', methods=['GET'])
 def home():
-    """Health check endpoint"""
+    """Health check endpoint (reports the model state without loading it)"""
+    state = model_state()
     return jsonify({
         'status': 'running',
         'message': 'WakeUp Call OSA Prediction API',
-        'model_loaded': model is not None,
+        'model_loaded': state == 'loaded',
+        'model_state': state,
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+def count_auth_tokens():
+    """Current auth_tokens table size"""
+    conn = get_db()
+    rows = conn.execute('SELECT COUNT(*) FROM auth_tokens').fetchone()[0]
+    conn.close()
+    return rows
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Runtime counters for monitoring"""
+    return jsonify({
+        'model': {
+            'loaded': model is not None,
+            'state': model_state(),
+            'version': model_version,
+            'engine': type(model).__name__ if model is not None else None
+        },
+        'prediction_cache': prediction_cache.stats(),
+        'db_pool': db_pool.stats(),
+        'token_cache': token_cache.stats(),
+        'report_jobs': report_jobs.stats(),
+        'auth_tokens': dict(token_sweeper.stats(), rows=count_auth_tokens()),
+        'google_fit': {
+            'mode': 'table' if google_fit_table is not None else 'model',
+            'configured_mode': GOOGLE_FIT_MODE,
+            'table': google_fit_table.info() if google_fit_table is not None else None
+        },
         'timestamp': datetime.now().isoformat()
     })
 
@@ -569,6 +584,7 @@ def signup():
             ''', (user_id, token, expires_at))
             
             conn.commit()
+            token_sweeper.after_login(user_id)
             
             return jsonify({
                 'success': True,
@@ -655,13 +671,12 @@ def login():
         ''', (user[0], token, expires_at))
         
         # Check if user has completed survey
-        cursor.execute('''
-            SELECT COUNT(*) FROM user_surveys WHERE user_id = ?
-        ''', (user[0],))
+        cursor.execute(schema.HAS_SURVEY_SQL, (user[0],))
         has_survey = cursor.fetchone()[0] > 0
         
         conn.commit()
         conn.close()
+        token_sweeper.after_login(user[0])
         
         return jsonify({
             'success': True,
@@ -694,8 +709,10 @@ def logout():
         conn = get_db()
         cursor = conn.cursor()
         cursor.execute('DELETE FROM auth_tokens WHERE token = ?', (token,))
+        generation = bump_generation(conn) if cursor.rowcount else None
         conn.commit()
         conn.close()
+        token_cache.evict(token, generation=generation)
         
         return jsonify({
             'success': True,
@@ -742,27 +759,26 @@ def get_latest_survey():
         conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT id, age, sex, height_cm, weight_kg, neck_circumference_cm, bmi,
-                   hypertension, diabetes, depression, smokes, alcohol,
-                   ess_score, berlin_score, stopbang_score, osa_probability, risk_level, completed_at,
-                   sleep_duration_hours, daily_steps
-            FROM user_surveys
-            WHERE user_id = ?
-            ORDER BY completed_at DESC
-            LIMIT 1
-        ''', (user_id,))
+        cursor.execute(schema.LATEST_SURVEY_SQL.format(columns='''
+                   s.id, s.age, s.sex, s.height_cm, s.weight_kg, s.neck_circumference_cm, s.bmi,
+                   s.hypertension, s.diabetes, s.depression, s.smokes, s.alcohol,
+                   s.ess_score, s.berlin_score, s.stopbang_score, s.osa_probability, s.risk_level, s.completed_at,
+                   s.sleep_duration_hours, s.daily_steps, s.derived_version, s.derived_json'''), (user_id,))
         
         survey = cursor.fetchone()
-        conn.close()
         
         if not survey:
+            conn.close()
             return jsonify({
                 'success': False,
                 'message': 'No survey data found',
                 'data': None
             }), 404
         
+        # Recommendation, score categories and top risk factors are derived once, at submit time
+        outputs = survey_outputs.load_outputs(conn, survey)
+        conn.close()
+        
         # Extract survey data
         survey_id = survey[0]
         age = survey[1]
@@ -782,73 +798,13 @@ def get_latest_survey():
         osa_probability = survey[15]
         risk_level = survey[16]
         # completed_at = survey[17]
-        sleep_duration = survey[18] if len(survey) > 18 and survey[18] else 7.0
-        daily_steps = survey[19] if len(survey) > 19 and survey[19] else 5000
-        
-        # Determine score categories
-        if ess_score < 8:
-            ess_category = "Normal"
-        elif ess_score < 12:
-            ess_category = "Mild"
-        elif ess_score < 16:
-            ess_category = "Moderate"
-        else:
-            ess_category = "Severe"
         
-        berlin_category = "High Risk" if berlin_score >= 2 else "Low Risk"
-        
-        if stopbang_score < 3:
-            stopbang_category = "Low Risk"
-        elif stopbang_score < 5:
-            stopbang_category = "Intermediate Risk"
-        else:
-            stopbang_category = "High Risk"
-        
-        # Generate comprehensive recommendations using the recommendation engine
-        recommendation = generate_ml_recommendation(
-            osa_probability, risk_level, age, bmi, neck_cm,
-            hypertension, diabetes, smokes, alcohol,
-            ess_score, berlin_score, stopbang_score,
-            sleep_duration, daily_steps
-        )
-        
-        # Calculate top risk factors
-        top_factors = []
-        if bmi >= 30:
-            top_factors.append({
-                'factor': f'High BMI ({bmi:.1f})',
-                'detail': 'Obesity significantly increases OSA risk',
-                'impact': 'High',
-                'priority': '1'
-            })
-        if stopbang_score >= 5:
-            top_factors.append({
-                'factor': f'High STOP-BANG Score ({stopbang_score})',
-                'detail': 'Multiple OSA risk factors present',
-                'impact': 'High',
-                'priority': '2'
-            })
-        if ess_score >= 11:
-            top_factors.append({
-                'factor': f'Excessive Daytime Sleepiness (ESS: {ess_score})',
-                'detail': 'Significant sleepiness during daytime',
-                'impact': 'Medium',
-                'priority': '3'
-            })
-        if age >= 50:
-            top_factors.append({
-                'factor': f'Age ({age} years)',
-                'detail': 'OSA risk increases with age',
-                'impact': 'Medium',
-                'priority': '4'
-            })
-        if hypertension:
-            top_factors.append({
-                'factor': 'Hypertension',
-                'detail': 'High blood pressure linked to OSA',
-                'impact': 'Medium',
-                'priority': '5'
-            })
+        categories = outputs['categories']
+        ess_category = categories['ess']
+        berlin_category = categories['berlin']
+        stopbang_category = categories['stopbang']
+        recommendation = survey_outputs.recommendation_text(outputs)
+        top_factors = outputs['top_risk_factors']
         
         # Use already extracted demographics
         
@@ -907,6 +863,175 @@ def get_latest_survey():
         }), 500
 
 
+SURVEY_HISTORY_PAGE_SIZE = 20
+SURVEY_HISTORY_MAX_PAGE_SIZE = 100
+
+
+@app.route('/survey/history', methods=['GET'])
+@require_auth
+def get_survey_history():
+    """
+    Past survey submissions for the authenticated user, newest first
+
+    Query params:
+        limit: page size (default 20, max 100)
+        before: survey_id cursor - return surveys older than this one (use next_before from the previous page)
+    """
+    try:
+        if request.current_user.get('is_guest', False):
+            return jsonify({
+                'success': False,
+                'message': 'Guest users do not have saved survey data',
+                'data': None,
+                'is_guest': True
+            }), 404
+
+        try:
+            limit = min(int(request.args.get('limit', SURVEY_HISTORY_PAGE_SIZE)), SURVEY_HISTORY_MAX_PAGE_SIZE)
+            before = int(request.args.get('before', 2 ** 62))
+        except ValueError:
+            return jsonify({'error': 'limit and before must be integers', 'success': False}), 400
+
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute(schema.SURVEY_HISTORY_SQL, (request.current_user['id'], before, max(limit, 1)))
+        rows = cursor.fetchall()
+        conn.close()
+
+        surveys = [{
+            'survey_id': row['id'],
+            'completed_at': row['completed_at'],
+            'scores': {
+                'ess': row['ess_score'],
+                'berlin': row['berlin_score'],
+                'stopbang': row['stopbang_score']
+            },
+            'osa_probability': round(row['osa_probability'], 3) if row['osa_probability'] is not None else None,
+            'risk_level': row['risk_level'],
+            'bmi': row['bmi']
+        } for row in rows]
+
+        return jsonify({
+            'success': True,
+            'data': surveys,
+            'count': len(surveys),
+            'next_before': surveys[-1]['survey_id'] if len(surveys) == max(limit, 1) else None
+        }), 200
+
+    except Exception as e:
+        return jsonify({
+            'error': str(e),
+            'success': False
+        }), 500
+
+
+@app.route('/metrics/summary', methods=['GET'])
+@require_auth
+def get_metrics_summary():
+    """
+    7/30/90-day step and sleep aggregates for the authenticated user (computed in SQL from daily_metrics)
+
+    Query params:
+        as_of: last day of the windows, YYYY-MM-DD (default today)
+    """
+    try:
+        if request.current_user.get('is_guest', False):
+            return jsonify({'error': 'Guest users do not have saved metrics', 'success': False}), 404
+
+        as_of = None
+        if 'as_of' in request.args:
+            as_of = daily_metrics.normalize_date(request.args['as_of'])
+            if as_of is None:
+                return jsonify({'error': 'as_of must be a YYYY-MM-DD date', 'success': False}), 400
+            as_of = datetime.strptime(as_of, '%Y-%m-%d').date()
+
+        conn = get_db()
+        summary = daily_metrics.window_aggregates(conn, request.current_user['id'], as_of)
+        conn.close()
+
+        return jsonify({
+            'success': True,
+            'data': summary
+        }), 200
+
+    except Exception as e:
+        return jsonify({
+            'error': str(e),
+            'success': False
+        }), 500
+
+
+MAX_SYNC_RECORDS = 1000
+
+
+@app.route('/metrics/sync', methods=['POST'])
+@require_auth
+def sync_metrics():
+    """
+    Incremental Google Fit / Health Connect upload: send only days on or after the
+    cursor returned by the previous sync (today's value can still change)
+
+    Expected JSON input:
+    {
+        "cursor": "2024-05-01",  # from the previous response; omit on first sync
+        "records": [{"date": "2024-05-01", "steps": 8123, "sleep_hours": 6.5}, ...],
+        # or the same maps submit_survey accepts:
+        "weekly_steps_data": {"2024-05-01": 8123},
+        "weekly_sleep_data": {"2024-05-01": 6.5}
+    }
+    """
+    try:
+        if request.current_user.get('is_guest', False):
+            return jsonify({'error': 'Guest users cannot sync metrics', 'success': False}), 403
+
+        data = request.get_json() or {}
+        user_id = request.current_user['id']
+
+        cursor_date = None
+        if data.get('cursor'):
+            cursor_date = daily_metrics.normalize_date(data['cursor'])
+            if cursor_date is None:
+                return jsonify({'error': 'cursor must be a YYYY-MM-DD date', 'success': False}), 400
+
+        records = list(data.get('records') or [])
+        for day, steps in (data.get('weekly_steps_data') or {}).items():
+            records.append({'date': day, 'steps': steps})
+        for day, hours in (data.get('weekly_sleep_data') or {}).items():
+            records.append({'date': day, 'sleep_hours': hours})
+        if len(records) > MAX_SYNC_RECORDS:
+            return jsonify({
+                'error': f'Too many records ({len(records)}); send at most {MAX_SYNC_RECORDS} per sync',
+                'success': False
+            }), 413
+
+        rows, rejected = daily_metrics.rows_from_records(user_id, records)
+        # Days before the cursor were already synced
+        fresh_rows = [row for row in rows if cursor_date is None or row[1] >= cursor_date]
+
+        conn = get_db()
+        daily_metrics.apply_daily_rows(conn, user_id, fresh_rows)
+        conn.commit()
+        aggregates = daily_metrics.rollup(conn, user_id)
+        conn.close()
+
+        return jsonify({
+            'success': True,
+            'cursor': aggregates['latest_date'],
+            'accepted': len(fresh_rows),
+            'skipped_before_cursor': len(rows) - len(fresh_rows),
+            'rejected': len(rejected),
+            'aggregates': aggregates
+        }), 200
+
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid record: {str(e)}', 'success': False}), 400
+    except Exception as e:
+        return jsonify({
+            'error': str(e),
+            'success': False
+        }), 500
+
+
 @app.route('/survey/submit', methods=['POST'])
 @require_auth
 def submit_survey():
@@ -1041,14 +1166,8 @@ def submit_survey():
             sleep_duration = max(4.0, min(10.0, sleep_duration))
             print(f"   Sleep duration estimated: {sleep_duration:.1f}h")
         
-        # Convert Google Fit data to JSON strings for storage
-        import json
-        weekly_steps_json = json.dumps(weekly_steps_data) if weekly_steps_data else '{}'
-        weekly_sleep_json = json.dumps(weekly_sleep_data) if weekly_sleep_data else '{}'
-        
-        # Estimate additional features
-        sleepiness = 1 if ess_score > 10 else 0
-        snoring_binary = 1 if snoring else 0
+        # Per-day Google Fit data goes to daily_metrics (one row per user and date)
+        daily_metric_rows = daily_metrics.rows_from_daily_maps(user_id, weekly_steps_data, weekly_sleep_data)
         
         # Estimate activity level from steps (1-5 scale)
         if daily_steps < 3000:
@@ -1072,81 +1191,29 @@ def submit_survey():
         # Convert Berlin score to binary (0 = low risk, 1 = high risk)
         berlin_score_binary = 1 if berlin_score >= 2 else 0
         
-        # Calculate derived features for new 27-feature model
-        age_group = calculate_age_group(age)
-        bang_items = calculate_bang_items(age, bmi, neck_cm, sex)
-        
-        # STOP items from survey responses
-        stop_snore = 1 if snoring else 0
-        stop_tired = 1 if tired else 0
-        stop_obs_apnea = 1 if observed else 0
-        stop_pressure = 1 if pressure else 0
-        
-        # Build feature dictionary for ML model (25 features for new WakeUpCall_3Class5Fold_Pipeline.pkl)
-        input_features = {
-            'Age': age,
-            'Age_Group': age_group,
-            'Sex': sex,  # Already binary: 1=male, 0=female
-            'Height': height_cm,
-            'Weight': weight_kg,
-            'BMI': round(bmi, 1),
-            'Neck_Circumference': neck_cm,
-            'Smokes': smokes,
-            'Alcohol': alcohol,
-            'Snoring': snoring_binary,
-            'Sleepiness': sleepiness,
-            'Epworth_Score': ess_score,
-            'Berlin_Score': berlin_score_binary,
-            'Hypertension': hypertension,
-            'Diabetes': diabetes,
-            'Depression': depression,
-            'STOP_Snore': stop_snore,
-            'STOP_Tired': stop_tired,
-            'STOP_ObsApnea': stop_obs_apnea,
-            'STOP_Pressure': stop_pressure,
-            'BANG_Age': bang_items['BANG_Age'],
-            'BANG_BMI': bang_items['BANG_BMI'],
-            'BANG_Neck': bang_items['BANG_Neck'],
-            'BANG_Gender': bang_items['BANG_Gender'],
-            'STOPBANG': stopbang_score
-        }
+        # Model input (25 features) from the shared feature pipeline
+        feature_row = survey_features([data])[0]
+        input_features = feature_dict(feature_row)
         
         # Make prediction if model is loaded
         osa_probability = 0.0
         risk_level = "Unknown"
         recommendation = ""
         
-        if model is not None:
+        if get_model() is not None:
             try:
                 # DEBUG: Print input features
                 print(f"🔍 DEBUG: Input features for ML model:")
                 for feature, value in input_features.items():
                     print(f"  {feature}: {value}")
                 
-                # Create DataFrame with correct feature order
-                X_input = pd.DataFrame([{f: input_features[f] for f in FEATURES}])
-                print(f"🔍 DEBUG: DataFrame shape: {X_input.shape}")
-                print(f"🔍 DEBUG: DataFrame columns: {list(X_input.columns)}")
-                print(f"🔍 DEBUG: DataFrame values: {X_input.iloc[0].tolist()}")
-                
                 # Get prediction - 3-class model (Low, Intermediate, High)
-                y_proba = model.predict_proba(X_input)[0]
-                y_pred = model.predict(X_input)[0]
-                
-                # Map prediction to risk level
-                risk_levels = ["Low Risk", "Intermediate Risk", "High Risk"]
-                if isinstance(y_pred, (int, np.integer)):
-                    risk_level = risk_levels[int(y_pred)]
-                    predicted_class_idx = int(y_pred)
-                else:
-                    risk_level = str(y_pred)
-                    predicted_class_idx = list(model.classes_).index(y_pred)
-                
-                # Get high risk probability for backward compatibility
-                osa_probability = float(y_proba[2]) if len(y_proba) > 2 else float(y_proba[predicted_class_idx])
-                certainty = float(y_proba[predicted_class_idx]) * 100
+                result = scorer.score_row(feature_row)
+                risk_level = result.risk_level
+                osa_probability = result.osa_probability
+                certainty = result.certainty * 100
                 
-                print(f"🔍 DEBUG: Class probabilities: Low={y_proba[0]:.3f}, Intermediate={y_proba[1]:.3f}, High={y_proba[2]:.3f}")
+                print(f"🔍 DEBUG: Class probabilities: {result.class_probabilities()}")
                 print(f"🔍 DEBUG: Prediction: {risk_level}, Certainty: {certainty:.2f}%")
                 
                 # Generate personalized recommendation
@@ -1201,92 +1268,49 @@ def submit_survey():
                 'is_guest': True
             }), 201
         
+        # Dashboard/report outputs derived from the values saved below (see survey_outputs.py)
+        outputs = survey_outputs.derive_outputs({
+            'age': age, 'bmi': bmi, 'neck_circumference_cm': neck_cm,
+            'hypertension': hypertension, 'diabetes': diabetes, 'smokes': smokes, 'alcohol': alcohol,
+            'ess_score': ess_score, 'berlin_score': berlin_score_binary, 'stopbang_score': stopbang_score,
+            'risk_level': risk_level, 'sleep_duration_hours': sleep_duration, 'daily_steps': daily_steps
+        })
+        
         # Save to database with all demographics and medical history
-        # Check if user already has a survey - if yes, UPDATE instead of INSERT
+        # Surveys are append-only; latest_surveys points at the newest one per user
         conn = get_db()
         cursor = conn.cursor()
         
         try:
-            # Check for existing survey
-            cursor.execute('SELECT id FROM user_surveys WHERE user_id = ?', (user_id,))
-            existing_survey = cursor.fetchone()
-            
-            if existing_survey:
-                # UPDATE existing survey
-                survey_id = existing_survey[0]
-                print(f"🔄 Updating survey for user {user_id}:")
-                print(f"   Age: {age}, Sex: {demo.get('sex', 'male')}, BMI: {bmi:.1f}")
-                print(f"   ESS: {ess_score}, Berlin: {berlin_score_binary}, STOP-BANG: {stopbang_score}")
-                print(f"   OSA Probability: {osa_probability:.3f}, Risk: {risk_level}")
-                
-                cursor.execute('''
-                    UPDATE user_surveys 
-                    SET age = ?, sex = ?, height_cm = ?, weight_kg = ?, neck_circumference_cm = ?, bmi = ?,
-                        hypertension = ?, diabetes = ?, depression = ?, smokes = ?, alcohol = ?,
-                        ess_score = ?, berlin_score = ?, stopbang_score = ?, 
-                        osa_probability = ?, risk_level = ?,
-                        daily_steps = ?, average_daily_steps = ?, sleep_duration_hours = ?,
-                        weekly_steps_json = ?, weekly_sleep_json = ?,
-                        snoring_level = ?, snoring_frequency = ?, snoring_bothers_others = ?,
-                        tired_during_day = ?, tired_after_sleep = ?, feels_sleepy_daytime = ?,
-                        nodded_off_driving = ?, physical_activity_time = ?,
-                        ess_sitting_reading = ?, ess_watching_tv = ?, ess_public_sitting = ?,
-                        ess_passenger_car = ?, ess_lying_down_afternoon = ?, ess_talking = ?,
-                        ess_after_lunch = ?, ess_traffic_stop = ?,
-                        completed_at = CURRENT_TIMESTAMP
-                    WHERE user_id = ?
-                ''', (age, demo.get('sex', 'male'), height_cm, weight_kg, neck_cm, bmi,
-                      hypertension, diabetes, depression, smokes, alcohol,
-                      ess_score, berlin_score_binary, stopbang_score, osa_probability, risk_level,
-                      daily_steps, average_daily_steps, sleep_duration, weekly_steps_json, weekly_sleep_json,
-                      snoring_level, snoring_frequency, snoring_bothers_others,
-                      tired_during_day, tired_after_sleep, feels_sleepy_daytime,
-                      nodded_off_driving, physical_activity_time,
-                      ess_sitting_reading, ess_watching_tv, ess_public_sitting,
-                      ess_passenger_car, ess_lying_down_afternoon, ess_talking,
-                      ess_after_lunch, ess_traffic_stop,
-                      user_id))
-                
-                rows_affected = cursor.rowcount
-                print(f"✅ Updated existing survey (ID: {survey_id}, rows affected: {rows_affected}) for user {user_id}")
-                
-                # Verify the update by reading back
-                cursor.execute('''
-                    SELECT age, ess_score, berlin_score, stopbang_score, osa_probability, risk_level 
-                    FROM user_surveys WHERE user_id = ?
-                ''', (user_id,))
-                verify = cursor.fetchone()
-                if verify:
-                    print(f"🔍 Verification - DB now has: Age={verify[0]}, ESS={verify[1]}, Berlin={verify[2]}, STOP-BANG={verify[3]}, OSA={verify[4]:.3f}, Risk={verify[5]}")
-            else:
-                # INSERT new survey
-                cursor.execute('''
-                    INSERT INTO user_surveys 
-                    (user_id, age, sex, height_cm, weight_kg, neck_circumference_cm, bmi,
-                     hypertension, diabetes, depression, smokes, alcohol,
-                     ess_score, berlin_score, stopbang_score, osa_probability, risk_level,
-                     daily_steps, average_daily_steps, sleep_duration_hours,
-                     weekly_steps_json, weekly_sleep_json,
-                     snoring_level, snoring_frequency, snoring_bothers_others,
-                     tired_during_day, tired_after_sleep, feels_sleepy_daytime,
-                     nodded_off_driving, physical_activity_time,
-                     ess_sitting_reading, ess_watching_tv, ess_public_sitting,
-                     ess_passenger_car, ess_lying_down_afternoon, ess_talking,
-                     ess_after_lunch, ess_traffic_stop)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                            ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (user_id, age, demo.get('sex', 'male'), height_cm, weight_kg, neck_cm, bmi,
-                      hypertension, diabetes, depression, smokes, alcohol,
-                      ess_score, berlin_score_binary, stopbang_score, osa_probability, risk_level,
-                      daily_steps, average_daily_steps, sleep_duration, weekly_steps_json, weekly_sleep_json,
-                      snoring_level, snoring_frequency, snoring_bothers_others,
-                      tired_during_day, tired_after_sleep, feels_sleepy_daytime,
-                      nodded_off_driving, physical_activity_time,
-                      ess_sitting_reading, ess_watching_tv, ess_public_sitting,
-                      ess_passenger_car, ess_lying_down_afternoon, ess_talking,
-                      ess_after_lunch, ess_traffic_stop))
-                survey_id = cursor.lastrowid
-                print(f"✅ Created new survey (ID: {survey_id}) for user {user_id}")
+            cursor.execute('''
+                INSERT INTO survey_history
+                (user_id, age, sex, height_cm, weight_kg, neck_circumference_cm, bmi,
+                 hypertension, diabetes, depression, smokes, alcohol,
+                 ess_score, berlin_score, stopbang_score, osa_probability, risk_level,
+                 daily_steps, average_daily_steps, sleep_duration_hours,
+                 snoring_level, snoring_frequency, snoring_bothers_others,
+                 tired_during_day, tired_after_sleep, feels_sleepy_daytime,
+                 nodded_off_driving, physical_activity_time,
+                 ess_sitting_reading, ess_watching_tv, ess_public_sitting,
+                 ess_passenger_car, ess_lying_down_afternoon, ess_talking,
+                 ess_after_lunch, ess_traffic_stop, derived_version, derived_json)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                        ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, age, demo.get('sex', 'male'), height_cm, weight_kg, neck_cm, bmi,
+                  hypertension, diabetes, depression, smokes, alcohol,
+                  ess_score, berlin_score_binary, stopbang_score, osa_probability, risk_level,
+                  daily_steps, average_daily_steps, sleep_duration,
+                  snoring_level, snoring_frequency, snoring_bothers_others,
+                  tired_during_day, tired_after_sleep, feels_sleepy_daytime,
+                  nodded_off_driving, physical_activity_time,
+                  ess_sitting_reading, ess_watching_tv, ess_public_sitting,
+                  ess_passenger_car, ess_lying_down_afternoon, ess_talking,
+                  ess_after_lunch, ess_traffic_stop,
+                  survey_outputs.OUTPUTS_VERSION, survey_outputs.serialize(outputs)))
+            survey_id = cursor.lastrowid
+            cursor.execute(schema.LATEST_SURVEY_UPSERT, (user_id, survey_id))
+            daily_metrics.apply_daily_rows(conn, user_id, daily_metric_rows)
+            print(f"✅ Saved survey (ID: {survey_id}) for user {user_id}")
             
             conn.commit()
         except Exception as db_error:
@@ -1367,7 +1391,7 @@ def predict_osa_risk():
         "STOPBANG": 3  # Total STOP-BANG score (0-8)
     }
     """
-    if model is None:
+    if get_model() is None:
         return jsonify({
             'error': 'Model not loaded. Please check model file.',
             'success': False
@@ -1377,90 +1401,28 @@ def predict_osa_risk():
         # Get JSON data from request
         data = request.get_json()
         
-        # Calculate derived fields if not provided
-        age = data.get('Age', 30)
-        sex = data.get('Sex', 0)
-        height = data.get('Height', 170)
-        weight = data.get('Weight', 70)
-        neck = data.get('Neck_Circumference', 35)
-        
-        # Calculate BMI if not provided
-        if 'BMI' not in data and height > 0:
-            bmi = weight / ((height / 100) ** 2)
-            data['BMI'] = round(bmi, 1)
-        
-        # Calculate Age_Group if not provided
-        if 'Age_Group' not in data:
-            data['Age_Group'] = calculate_age_group(age)
-        
-        # Add Height/Weight if not present
-        if 'Height' not in data:
-            data['Height'] = height
-        if 'Weight' not in data:
-            data['Weight'] = weight
-        
-        # Calculate BANG items if not provided (derived from age, bmi, neck, sex)
-        bmi = data.get('BMI', 25)
-        bang_items = calculate_bang_items(age, bmi, neck, sex)
-        for key, value in bang_items.items():
-            if key not in data:
-                data[key] = value
-        
-        # Default Depression to 0 if not provided
-        if 'Depression' not in data:
-            data['Depression'] = 0
-        
-        # Handle legacy STOPBANG_Total field (rename to STOPBANG)
-        if 'STOPBANG_Total' in data and 'STOPBANG' not in data:
-            data['STOPBANG'] = data['STOPBANG_Total']
-        
-        # Default STOP items if not provided (derive from related fields)
-        if 'STOP_Snore' not in data:
-            data['STOP_Snore'] = data.get('Snoring', 0)
-        if 'STOP_Tired' not in data:
-            data['STOP_Tired'] = data.get('Sleepiness', 0)
-        if 'STOP_ObsApnea' not in data:
-            data['STOP_ObsApnea'] = 0  # Can't derive, default to 0
-        if 'STOP_Pressure' not in data:
-            data['STOP_Pressure'] = data.get('Hypertension', 0)
-        
-        # Validate all required features are present
-        missing_features = [f for f in FEATURES if f not in data]
-        if missing_features:
+        # Derived fields are filled in by the feature pipeline; reject records still missing some
+        X, errors = predict_features([data])
+        if errors:
             return jsonify({
-                'error': f'Missing required features: {missing_features}',
+                'error': errors[0],
                 'success': False
             }), 400
-        
-        # Create DataFrame with correct feature order
-        X_input = pd.DataFrame([{f: data[f] for f in FEATURES}])
+        features = feature_dict(X[0])
         
         # Pipeline handles scaling internally - no separate scaling needed
         
         # Get prediction - 3-class model (Low, Intermediate, High)
-        y_proba = model.predict_proba(X_input)[0]
-        y_pred = model.predict(X_input)[0]
-        
-        # Map prediction to risk level
-        risk_levels = ["Low Risk", "Intermediate Risk", "High Risk"]
-        if isinstance(y_pred, (int, np.integer)):
-            risk_level = risk_levels[int(y_pred)]
-        else:
-            risk_level = str(y_pred)
-        
-        # Get probability/certainty for the predicted class
-        predicted_class_idx = int(y_pred) if isinstance(y_pred, (int, np.integer)) else list(model.classes_).index(y_pred)
-        certainty = float(y_proba[predicted_class_idx])
-        
-        # Also get probability for high risk (for backwards compatibility)
-        high_risk_prob = float(y_proba[2]) if len(y_proba) > 2 else certainty
+        result = scorer.score_row(X[0])
+        risk_level = result.risk_level
+        high_risk_prob = result.osa_probability
         
         # Generate comprehensive recommendations
         recommendation = generate_ml_recommendation(
             high_risk_prob, risk_level, 
-            data['Age'], data['BMI'], data['Neck_Circumference'],
-            data['Hypertension'], data['Diabetes'], data['Smokes'], data['Alcohol'],
-            data['Epworth_Score'], data['Berlin_Score'], data.get('STOPBANG', data.get('STOPBANG_Total', 0)),
+            features['Age'], features['BMI'], features['Neck_Circumference'],
+            features['Hypertension'], features['Diabetes'], features['Smokes'], features['Alcohol'],
+            features['Epworth_Score'], features['Berlin_Score'], features['STOPBANG'],
             data.get('Sleep_Duration', 7.0), data.get('Daily_Steps', 5000)
         )
         
@@ -1469,22 +1431,18 @@ def predict_osa_risk():
             'success': True,
             'prediction': {
                 'osa_probability': round(float(high_risk_prob), 3),
-                'certainty': round(certainty * 100, 2),
-                'osa_class': int(predicted_class_idx),
+                'certainty': round(result.certainty * 100, 2),
+                'osa_class': result.class_index,
                 'risk_level': risk_level,
-                'class_probabilities': {
-                    'low': round(float(y_proba[0]), 4),
-                    'intermediate': round(float(y_proba[1]), 4) if len(y_proba) > 1 else 0,
-                    'high': round(float(y_proba[2]), 4) if len(y_proba) > 2 else 0
-                },
+                'class_probabilities': result.class_probabilities(),
                 'recommendation': recommendation
             },
             'input_summary': {
-                'age': data['Age'],
-                'age_group': data['Age_Group'],
-                'bmi': data['BMI'],
-                'stopbang_score': data.get('STOPBANG', data.get('STOPBANG_Total', 0)),
-                'epworth_score': data['Epworth_Score'],
+                'age': features['Age'],
+                'age_group': features['Age_Group'],
+                'bmi': features['BMI'],
+                'stopbang_score': features['STOPBANG'],
+                'epworth_score': features['Epworth_Score'],
                 'sleep_duration': data.get('Sleep_Duration', 7.0),
                 'daily_steps': data.get('Daily_Steps', 5000)
             },
@@ -1498,6 +1456,175 @@ def predict_osa_risk():
         }), 500
 
 
+# Batch scoring limits for /predict/batch and /survey/calculate/batch
+BATCH_CHUNK_SIZE = 5000  # Rows per model call
+MAX_BATCH_ROWS = 200000  # Rows per HTTP request (signed-in accounts)
+MAX_GUEST_BATCH_ROWS = 1000  # Rows per HTTP request in guest mode
+MAX_BATCH_BYTES_PER_ROW = 1024  # Request body budget per allowed row
+
+
+def batch_row_limit():
+    """Row cap for the current (authenticated) batch request."""
+    return MAX_GUEST_BATCH_ROWS if request.current_user.get('is_guest', False) else MAX_BATCH_ROWS
+
+
+def batch_too_large(max_rows):
+    return jsonify({
+        'error': f'Batch too large (max {max_rows} rows, {max_rows * MAX_BATCH_BYTES_PER_ROW} bytes)',
+        'success': False
+    }), 413
+
+
+def read_batch_records(max_rows):
+    """
+    Read feature records for /predict/batch from the request body.
+    Accepts a JSON array, {"records": [...]} or NDJSON (one record per line).
+    Returns (records, errors) where errors maps row index -> message for unparseable lines.
+
+    At most max_rows * MAX_BATCH_BYTES_PER_ROW bytes are read: a larger
+    Content-Length, or a chunked body that grows past it, raises
+    RequestEntityTooLarge. NDJSON parsing stops after max_rows + 1 records, so
+    an over-long batch is rejected without reading the rest.
+    """
+    import json
+    content_type = request.mimetype or ''
+    errors = {}
+
+    max_bytes = max_rows * MAX_BATCH_BYTES_PER_ROW
+    if request.content_length is not None and request.content_length > max_bytes:
+        raise RequestEntityTooLarge()
+
+    if content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+        records = []
+        remaining = max_bytes
+        while len(records) <= max_rows:
+            line = request.stream.readline(remaining + 1)
+            if not line:
+                break
+            remaining -= len(line)
+            if remaining < 0:
+                raise RequestEntityTooLarge()
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError as e:
+                errors[len(records)] = f'Invalid JSON: {e}'
+                records.append(None)
+        return records, errors
+
+    if not request.is_json:
+        raise ValueError('Expected a JSON array of records, {"records": [...]}, or an NDJSON body')
+    body = request.stream.read(max_bytes + 1)
+    if len(body) > max_bytes:
+        raise RequestEntityTooLarge()
+    try:
+        data = json.loads(body)
+    except ValueError as e:
+        raise ValueError(f'Invalid JSON: {e}')
+    if isinstance(data, dict):
+        data = data.get('records')
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array of records, {"records": [...]}, or an NDJSON body')
+    return data, errors
+
+
+@app.route('/predict/batch', methods=['POST'])
+@require_auth
+def predict_osa_risk_batch():
+    """
+    Score many feature records in one call (nightly re-scoring, backfills)
+
+    Accepts a JSON array of records in the same format as /predict, an object
+    {"records": [...]}, or an NDJSON stream (Content-Type: application/x-ndjson).
+    Rows are validated individually and scored through the model in chunks of
+    BATCH_CHUNK_SIZE; invalid rows are reported with their index and do not fail the batch.
+    Requires a token; guest tokens may send at most MAX_GUEST_BATCH_ROWS rows.
+    """
+    if get_model() is None:
+        return jsonify({
+            'error': 'Model not loaded. Please check model file.',
+            'success': False
+        }), 500
+
+    max_rows = batch_row_limit()
+    try:
+        records, errors = read_batch_records(max_rows)
+    except RequestEntityTooLarge:
+        return batch_too_large(max_rows)
+    except Exception as e:
+        return jsonify({
+            'error': str(e),
+            'success': False
+        }), 400
+
+    if len(records) > max_rows:
+        return batch_too_large(max_rows)
+
+    try:
+        # Build every row's features in one pass; rows that cannot be scored are reported
+        X, feature_errors = predict_features(records)
+        for i, message in feature_errors.items():
+            errors.setdefault(i, message)
+        valid_idx = [i for i in range(len(records)) if i not in errors]
+        X_all = X[valid_idx]
+
+        # Score valid rows in vectorized chunks
+        class_labels = scorer.class_labels
+        proba_chunks = [
+            scorer.predict_proba(X_all[start:start + BATCH_CHUNK_SIZE])
+            for start in range(0, len(X_all), BATCH_CHUNK_SIZE)
+        ]
+        y_proba = np.vstack(proba_chunks) if proba_chunks else np.empty((0, len(class_labels)))
+
+        predicted_idx = y_proba.argmax(axis=1)
+        certainty = y_proba[np.arange(len(y_proba)), predicted_idx]
+        high_risk_prob = y_proba[:, 2] if y_proba.shape[1] > 2 else certainty
+
+        n_classes = y_proba.shape[1]
+        proba_rounded = y_proba.round(4).tolist()
+
+        results = [None] * len(records)
+        for i, cls, prob, cert, p in zip(
+                valid_idx, predicted_idx.tolist(), high_risk_prob.round(3).tolist(),
+                (certainty * 100).round(2).tolist(), proba_rounded):
+            results[i] = {
+                'index': i,
+                'success': True,
+                'osa_probability': prob,
+                'certainty': cert,
+                'osa_class': cls,
+                'risk_level': class_labels[cls],
+                'class_probabilities': {
+                    'low': p[0],
+                    'intermediate': p[1] if n_classes > 1 else 0,
+                    'high': p[2] if n_classes > 2 else 0
+                }
+            }
+        for i, message in errors.items():
+            results[i] = {
+                'index': i,
+                'success': False,
+                'error': message
+            }
+
+        return jsonify({
+            'success': True,
+            'count': len(records),
+            'scored': len(valid_idx),
+            'failed': len(errors),
+            'results': results,
+            'timestamp': datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        return jsonify({
+            'error': str(e),
+            'success': False
+        }), 500
+
+
 @app.route('/survey/calculate', methods=['POST'])
 def calculate_survey_scores():
     """
@@ -1548,15 +1675,7 @@ def calculate_survey_scores():
         )
         
         # Calculate overall risk
-        high_risk_count = 0
-        if "Severe" in ess_category or "Moderate" in ess_category:
-            high_risk_count += 1
-        if berlin_category == "High Risk":
-            high_risk_count += 1
-        if stopbang_category == "High Risk":
-            high_risk_count += 1
-        
-        overall_risk = "High" if high_risk_count >= 2 else ("Moderate" if high_risk_count >= 1 else "Low")
+        overall_risk = overall_risk_level(ess_category, berlin_category, stopbang_category)
         
         return jsonify({
             'success': True,
@@ -1585,6 +1704,59 @@ def calculate_survey_scores():
         }), 500
 
 
+@app.route('/survey/calculate/batch', methods=['POST'])
+@require_auth
+def calculate_survey_scores_batch():
+    """
+    Score many surveys in one call (research exports, backfills)
+
+    Accepts the same inputs as /predict/batch (a JSON array, {"records": [...]} or
+    NDJSON) with records in the /survey/calculate format. All rows are scored
+    together as arrays (survey_scoring.score_records); invalid rows are reported
+    with their index and do not fail the batch. Same auth and limits as /predict/batch.
+    """
+    max_rows = batch_row_limit()
+    try:
+        records, errors = read_batch_records(max_rows)
+    except RequestEntityTooLarge:
+        return batch_too_large(max_rows)
+    except Exception as e:
+        return jsonify({
+            'error': str(e),
+            'success': False
+        }), 400
+
+    if len(records) > max_rows:
+        return batch_too_large(max_rows)
+
+    try:
+        scores, score_errors = score_records(records)
+        for i, message in score_errors.items():
+            errors.setdefault(i, message)
+
+        results = []
+        for i, row in enumerate(score_rows(scores)):
+            if i in errors:
+                results.append({'index': i, 'success': False, 'error': errors[i]})
+            else:
+                results.append({'index': i, 'success': True, 'survey_scores': row})
+
+        return jsonify({
+            'success': True,
+            'count': len(records),
+            'scored': len(records) - len(errors),
+            'failed': len(errors),
+            'results': results,
+            'timestamp': datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        return jsonify({
+            'error': str(e),
+            'success': False
+        }), 500
+
+
 @app.route('/predict-from-google-fit', methods=['POST'])
 def predict_from_google_fit():
     """
@@ -1611,7 +1783,7 @@ def predict_from_google_fit():
         "observed_apnea": false
     }
     """
-    if model is None:
+    if get_model() is None:
         return jsonify({
             'error': 'Model not loaded. Please train the model first.',
             'success': False
@@ -1620,102 +1792,21 @@ def predict_from_google_fit():
     try:
         data = request.get_json()
         
-        # Calculate BMI
-        height = data['height_cm']
-        weight = data['weight_kg']
-        height_m = height / 100
-        bmi = weight / (height_m ** 2)
-        
-        # Convert sex to binary
-        sex = 1 if data['sex'].lower() == 'male' else 0
-        age = data['age']
-        neck = data['neck_circumference_cm']
-        
-        # Calculate Age Group
-        age_group = calculate_age_group(age)
-        
-        # Medical history fields
-        hypertension = 1 if data.get('hypertension', False) else 0
-        diabetes = 1 if data.get('diabetes', False) else 0
-        depression = 1 if data.get('depression', False) else 0
-        smokes = 1 if data.get('smokes', False) else 0
-        alcohol = 1 if data.get('alcohol', False) else 0
-        
-        # Calculate STOP items
-        stop_snore = 1 if data.get('snores', False) else 0
-        stop_tired = 1 if data.get('feels_sleepy', False) else 0
-        stop_obs_apnea = 1 if data.get('observed_apnea', False) else 0
-        stop_pressure = hypertension
-        
-        # Calculate BANG items using helper function
-        bang_items = calculate_bang_items(age, bmi, neck, sex)
-        
-        # Calculate total STOP-BANG score
-        stopbang_total = (stop_snore + stop_tired + stop_obs_apnea + stop_pressure +
-                        bang_items['BANG_Age'] + bang_items['BANG_BMI'] + 
-                        bang_items['BANG_Neck'] + bang_items['BANG_Gender'])
-        
-        # Snoring and Sleepiness flags
-        snoring = stop_snore
-        sleepiness = stop_tired
-        
-        # Estimate Epworth score (simplified)
-        epworth_score = 12 if data.get('feels_sleepy', False) else 6
-        
-        # Estimate Berlin score based on snoring and sleepiness
-        berlin_score = 1 if (data.get('snores', False) and data.get('feels_sleepy', False)) else 0
-        
-        # Build feature dictionary for new 27-feature model
-        input_features = {
-            'Age': age,
-            'Age_Group': age_group,
-            'Sex': sex,
-            'Height': height,
-            'Weight': weight,
-            'BMI': round(bmi, 1),
-            'Neck_Circumference': neck,
-            'Smokes': smokes,
-            'Alcohol': alcohol,
-            'Snoring': snoring,
-            'Sleepiness': sleepiness,
-            'Epworth_Score': epworth_score,
-            'Berlin_Score': berlin_score,
-            'Hypertension': hypertension,
-            'Diabetes': diabetes,
-            'Depression': depression,
-            'STOP_Snore': stop_snore,
-            'STOP_Tired': stop_tired,
-            'STOP_ObsApnea': stop_obs_apnea,
-            'STOP_Pressure': stop_pressure,
-            'BANG_Age': bang_items['BANG_Age'],
-            'BANG_BMI': bang_items['BANG_BMI'],
-            'BANG_Neck': bang_items['BANG_Neck'],
-            'BANG_Gender': bang_items['BANG_Gender'],
-            'STOPBANG': stopbang_total
-        }
-        
-        # Create DataFrame with correct feature order
-        X_input = pd.DataFrame([{f: input_features[f] for f in FEATURES}])
-        
-        # Pipeline handles scaling internally
+        # Model input from the shared feature pipeline (raises KeyError for missing fields)
+        feature_row = google_fit_features(data)
+        features = feature_dict(feature_row)
         
         # Get prediction - 3-class model (Low, Intermediate, High)
-        y_proba = model.predict_proba(X_input)[0]
-        y_pred = model.predict(X_input)[0]
-        
-        # Map prediction to risk level
-        risk_levels = ["Low Risk", "Intermediate Risk", "High Risk"]
-        if isinstance(y_pred, (int, np.integer)):
-            risk_level = risk_levels[int(y_pred)]
+        if google_fit_table is not None:
+            proba = google_fit_table.lookup(features['Age'], features['Sex'], features['Height'],
+                                            features['Weight'], features['Neck_Circumference'], flags_mask(data))
+            result = scorer.result_from_proba(proba)
+            prediction_mode = 'table'
         else:
-            risk_level = str(y_pred)
-        
-        # Get probability/certainty for the predicted class
-        predicted_class_idx = int(y_pred) if isinstance(y_pred, (int, np.integer)) else list(model.classes_).index(y_pred)
-        certainty = float(y_proba[predicted_class_idx])
-        
-        # Get high risk probability for backwards compatibility
-        high_risk_prob = float(y_proba[2]) if len(y_proba) > 2 else certainty
+            result = scorer.score_row(feature_row)
+            prediction_mode = 'model'
+        risk_level = result.risk_level
+        high_risk_prob = result.osa_probability
         
         # Generate recommendation based on risk level
         if risk_level == "Low Risk":
@@ -1729,23 +1820,20 @@ def predict_from_google_fit():
             'success': True,
             'prediction': {
                 'osa_probability': round(float(high_risk_prob), 3),
-                'certainty': round(certainty * 100, 2),
-                'osa_class': int(predicted_class_idx),
+                'certainty': round(result.certainty * 100, 2),
+                'osa_class': result.class_index,
                 'risk_level': risk_level,
-                'class_probabilities': {
-                    'low': round(float(y_proba[0]), 4),
-                    'intermediate': round(float(y_proba[1]), 4) if len(y_proba) > 1 else 0,
-                    'high': round(float(y_proba[2]), 4) if len(y_proba) > 2 else 0
-                },
+                'class_probabilities': result.class_probabilities(),
                 'recommendation': recommendation
             },
             'calculated_metrics': {
-                'bmi': round(bmi, 1),
-                'age_group': age_group,
-                'stopbang_score': stopbang_total,
-                'estimated_epworth_score': epworth_score,
-                'estimated_berlin_score': berlin_score
+                'bmi': features['BMI'],
+                'age_group': features['Age_Group'],
+                'stopbang_score': features['STOPBANG'],
+                'estimated_epworth_score': features['Epworth_Score'],
+                'estimated_berlin_score': features['Berlin_Score']
             },
+            'prediction_mode': prediction_mode,
             'timestamp': datetime.now().isoformat()
         })
         
@@ -1761,21 +1849,165 @@ def predict_from_google_fit():
         }), 500
 
 
+REPORT_CACHE_DIR = os.environ.get('WAKEUPCALL_REPORT_CACHE',
+                                  os.path.join(os.path.dirname(os.path.abspath(__file__)), 'report_cache'))
+REPORT_WORKERS = int(os.environ.get('WAKEUPCALL_REPORT_WORKERS', '2'))
+REPORT_MAX_WAIT = 45  # seconds; stays under the Android client's 60 s read timeout
+
+# Let a front-end proxy (nginx/Apache) send report files itself via X-Sendfile
+app.config['USE_X_SENDFILE'] = os.environ.get('WAKEUPCALL_X_SENDFILE', '0') == '1'
+
+report_jobs = ReportJobs(REPORT_CACHE_DIR, REPORT_WORKERS)
+
+
+def send_report(meta):
+    """
+    Serve a finished report from its file in the cache directory. Nothing is read
+    into memory: Content-Length comes from the file size and the body goes out
+    through the server's sendfile (wsgi.file_wrapper), or X-Sendfile when a proxy
+    serves the files. The job id is the ETag (it already covers the content), so
+    Range / If-Range requests let an interrupted download resume.
+    """
+    from flask import send_file
+    response = send_file(
+        report_jobs.pdf_path(meta['job_id']),
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=meta['filename'],
+        conditional=True,
+        etag=meta['job_id'],
+        last_modified=meta.get('finished_at')
+    )
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def report_job_response(meta, status_code=202):
+    return jsonify({
+        'success': meta['status'] != 'failed',
+        'job_id': meta['job_id'],
+        'status': meta['status'],
+        'error': meta.get('error'),
+        'status_url': f"/reports/{meta['job_id']}"
+    }), status_code
+
+
+def build_report_data(conn, user_id, user_name):
+    """
+    Report data for a user's latest survey as (survey_id, pdf_data), or None
+    without a survey. pdf_data is a plain dict the report workers render
+    (charts included as their inputs).
+    """
+    cursor = conn.cursor()
+    cursor.execute(schema.LATEST_SURVEY_SQL.format(columns='''
+               s.age, s.sex, s.height_cm, s.weight_kg, s.neck_circumference_cm, s.bmi,
+               s.hypertension, s.diabetes, s.smokes, s.alcohol,
+               s.ess_score, s.berlin_score, s.stopbang_score, s.osa_probability, s.risk_level,
+               s.daily_steps, s.average_daily_steps, s.sleep_duration_hours, s.id,
+               s.derived_version, s.derived_json'''), (user_id,))
+    
+    survey = cursor.fetchone()
+    if not survey:
+        return None
+    
+    # Recommendation derived at submit time (recomputed here only if stale)
+    outputs = survey_outputs.load_outputs(conn, survey)
+    
+    # Last 7 recorded days of Google Fit data, already in date order
+    weekly_steps_data, weekly_sleep_data = daily_metrics.recent_days(conn, user_id, 7)
+    
+    # Extract data
+    age, sex, height_cm, weight_kg, neck_cm, bmi = survey[0:6]
+    hypertension, diabetes, smokes, alcohol = survey[6:10]
+    ess_score, berlin_score, stopbang_score = survey[10:13]
+    osa_probability, risk_level = survey[13:15]
+    daily_steps, average_daily_steps, sleep_duration_hours = survey[15:18]
+    survey_id = survey[18]
+    
+    # Calculate ESS individual scores (divide total by 8 for average, then distribute)
+    avg_ess = ess_score / 8
+    ess_responses = [int(avg_ess)] * 8  # Simplified: use average for each question
+    
+    # Calculate STOP-BANG components
+    snoring = stopbang_score >= 1  # Simplified assumption
+    tiredness = ess_score >= 11
+    observed_apnea = False  # Not directly available
+    bmi_over_35 = bmi > 35
+    age_over_50 = age > 50
+    neck_large = neck_cm >= 40 if sex == 'Male' else neck_cm >= 35
+    gender_male = (sex == 'Male')
+    
+    recommendation = survey_outputs.recommendation_text(outputs)
+    
+    # Build data dictionary for PDF generator (charts are drawn by the report worker)
+    pdf_data = {
+        'patient': {
+            'name': user_name,
+            'age': age,
+            'sex': sex,
+            'height': f'{height_cm} cm',
+            'weight': f'{weight_kg} kg',
+            'bmi': bmi,
+            'neck_circumference': f'{neck_cm} cm'
+        },
+        'assessment': {
+            'risk_level': risk_level,
+            'osa_probability': int(osa_probability * 100),
+            'recommendation': recommendation
+        },
+        'stop_bang': {
+            'score': stopbang_score,
+            'snoring': snoring,
+            'tiredness': tiredness,
+            'observed_apnea': observed_apnea,
+            'high_blood_pressure': hypertension,
+            'bmi_over_35': bmi_over_35,
+            'age_over_50': age_over_50,
+            'neck_circumference_large': neck_large,
+            'gender_male': gender_male
+        },
+        'epworth_sleepiness_scale': {
+            'total_score': ess_score,
+            'sitting_reading': ess_responses[0] if ess_responses else 0,
+            'watching_tv': ess_responses[1] if ess_responses else 0,
+            'public_sitting': ess_responses[2] if ess_responses else 0,
+            'passenger_car': ess_responses[3] if ess_responses else 0,
+            'lying_down_pm': ess_responses[4] if ess_responses else 0,
+            'talking': ess_responses[5] if ess_responses else 0,
+            'after_lunch': ess_responses[6] if ess_responses else 0,
+            'traffic_stop': ess_responses[7] if ess_responses else 0
+        },
+        'google_fit': {
+            'daily_steps': daily_steps or 0,
+            'average_daily_steps': average_daily_steps or 0,
+            'sleep_duration_hours': sleep_duration_hours or 0
+        },
+        'lifestyle': {
+            'smoking': smokes,
+            'alcohol': alcohol
+        },
+        'medical_history': {
+            'hypertension': hypertension,
+            'diabetes': diabetes
+        },
+        'charts': {
+            'shap': {'age': age, 'stopbang_score': stopbang_score, 'neck_cm': neck_cm, 'ess_score': ess_score},
+            'weekly_steps': weekly_steps_data,
+            'weekly_sleep': weekly_sleep_data
+        }
+    }
+    return survey_id, pdf_data
+
+
 @app.route('/survey/generate-pdf', methods=['POST'])
 @require_auth
 def generate_pdf_report():
     """
-    Generate PDF report from survey data using ReportLab
-    Returns PDF file as binary response
+    Queue a PDF report of the latest survey for rendering.
+    Returns 202 with a job id to poll at GET /reports/<job_id>. With ?wait=<seconds>
+    the PDF is returned directly if it finishes in time (always, when cached).
     """
     try:
-        from pdf_generator import WakeUpCallPDFGenerator
-        from io import BytesIO
-        import matplotlib
-        matplotlib.use('Agg')
-        import matplotlib.pyplot as plt
-        from datetime import datetime
-        
         # Check if this is a guest user
         is_guest = request.current_user.get('is_guest', False)
         if is_guest:
@@ -1787,273 +2019,32 @@ def generate_pdf_report():
         
         user_id = request.current_user['id']
         user_name = f"{request.current_user['first_name']} {request.current_user['last_name']}"
+        wait = min(max(request.args.get('wait', 0, type=float), 0), REPORT_MAX_WAIT)
         
-        # Get latest survey data
         conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT age, sex, height_cm, weight_kg, neck_circumference_cm, bmi,
-                   hypertension, diabetes, smokes, alcohol,
-                   ess_score, berlin_score, stopbang_score, osa_probability, risk_level,
-                   daily_steps, average_daily_steps, sleep_duration_hours,
-                   weekly_steps_json, weekly_sleep_json
-            FROM user_surveys
-            WHERE user_id = ?
-            ORDER BY completed_at DESC
-            LIMIT 1
-        ''', (user_id,))
-        
-        survey = cursor.fetchone()
+        report = build_report_data(conn, user_id, user_name)
         conn.close()
         
-        if not survey:
+        if report is None:
             return jsonify({'error': 'No survey data found', 'success': False}), 404
+        survey_id, pdf_data = report
         
-        # Extract data
-        age, sex, height_cm, weight_kg, neck_cm, bmi = survey[0:6]
-        hypertension, diabetes, smokes, alcohol = survey[6:10]
-        ess_score, berlin_score, stopbang_score = survey[10:13]
-        osa_probability, risk_level = survey[13:15]
-        daily_steps, average_daily_steps, sleep_duration_hours = survey[15:18]
-        weekly_steps_json, weekly_sleep_json = survey[18:20]
-        
-        # Calculate ESS individual scores (divide total by 8 for average, then distribute)
-        avg_ess = ess_score / 8
-        ess_responses = [int(avg_ess)] * 8  # Simplified: use average for each question
-        
-        # Parse Google Fit JSON data
-        import json
-        weekly_steps_data = json.loads(weekly_steps_json) if weekly_steps_json else {}
-        weekly_sleep_data = json.loads(weekly_sleep_json) if weekly_sleep_json else {}
-        
-        # Generate charts for PDF
-        def generate_shap_chart():
-            # Calculate impact scores
-            age_impact = 0.75 if age >= 50 else 0.40
-            snoring_impact = 0.85 if stopbang_score >= 1 else 0.25
-            stopbang_impact = (stopbang_score / 8.0) * 0.9 + 0.1
-            
-            if neck_cm >= 43:
-                neck_impact = 0.90
-            elif neck_cm >= 40:
-                neck_impact = 0.70
-            elif neck_cm >= 37:
-                neck_impact = 0.50
-            else:
-                neck_impact = 0.30
-            
-            ess_impact = (ess_score / 24.0) * 0.9 + 0.1
-            
-            factors = [
-                ('Age', age_impact),
-                ('Snoring', snoring_impact),
-                ('STOP-BANG', stopbang_impact),
-                ('Neck Circ', neck_impact),
-                ('ESS Score', ess_impact)
-            ]
-            
-            # Sort by impact
-            factors.sort(key=lambda x: x[1], reverse=True)
-            
-            # Create bar chart
-            fig, ax = plt.subplots(figsize=(8, 5))
-            names = [f[0] for f in factors]
-            values = [f[1] * 100 for f in factors]
-            colors = ['#f44336' if v >= 70 else '#ff9800' if v >= 50 else '#4caf50' for v in values]
-            
-            ax.barh(names, values, color=colors)
-            ax.set_xlabel('Impact (%)', fontsize=12)
-            ax.set_title('SHAP Analysis - Risk Factor Impact', fontsize=14, fontweight='bold')
-            ax.set_xlim(0, 100)
-            
-            for i, v in enumerate(values):
-                ax.text(v + 2, i, f'{v:.0f}%', va='center', fontsize=10)
-            
-            plt.tight_layout()
-            
-            # Save to BytesIO
-            img_buffer = BytesIO()
-            plt.savefig(img_buffer, format='png', dpi=150, bbox_inches='tight')
-            img_buffer.seek(0)
-            plt.close()
-            
-            return img_buffer
-        
-        # Generate weekly steps chart
-        def generate_steps_chart(steps_data):
-            # Sort by date and take last 7 days
-            sorted_data = sorted(steps_data.items(), key=lambda x: x[0])[-7:]
-            dates = [d[5:] for d, _ in sorted_data]  # Extract MM-DD
-            steps = [s for _, s in sorted_data]
-            
-            fig, ax = plt.subplots(figsize=(8, 5))
-            colors = ['#4caf50' if s >= 8000 else '#ff9800' if s >= 5000 else '#f44336' for s in steps]
-            bars = ax.bar(dates, steps, color=colors)
-            
-            ax.set_xlabel('Date', fontsize=12)
-            ax.set_ylabel('Steps', fontsize=12)
-            ax.set_title('Weekly Step Count', fontsize=14, fontweight='bold')
-            ax.set_ylim(0, max(steps) * 1.2 if steps else 15000)
-            
-            # Add value labels on bars
-            for bar in bars:
-                height = bar.get_height()
-                ax.text(bar.get_x() + bar.get_width()/2., height,
-                       f'{int(height):,}',
-                       ha='center', va='bottom', fontsize=9)
-            
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-            
-            img_buffer = BytesIO()
-            plt.savefig(img_buffer, format='png', dpi=150, bbox_inches='tight')
-            img_buffer.seek(0)
-            plt.close()
-            
-            return img_buffer
-        
-        # Generate weekly sleep chart
-        def generate_sleep_chart(sleep_data):
-            # Sort by date and take last 7 days
-            sorted_data = sorted(sleep_data.items(), key=lambda x: x[0])[-7:]
-            dates = [d[5:] for d, _ in sorted_data]  # Extract MM-DD
-            hours = [h for _, h in sorted_data]
-            
-            fig, ax = plt.subplots(figsize=(8, 5))
-            colors = ['#4caf50' if h >= 7 else '#ff9800' if h >= 6 else '#f44336' for h in hours]
-            bars = ax.bar(dates, hours, color=colors)
-            
-            ax.set_xlabel('Date', fontsize=12)
-            ax.set_ylabel('Hours', fontsize=12)
-            ax.set_title('Weekly Sleep Duration', fontsize=14, fontweight='bold')
-            ax.set_ylim(0, 10)
-            ax.axhline(y=7, color='gray', linestyle='--', alpha=0.5, label='Recommended (7h)')
-            
-            # Add value labels on bars
-            for bar in bars:
-                height = bar.get_height()
-                ax.text(bar.get_x() + bar.get_width()/2., height,
-                       f'{height:.1f}h',
-                       ha='center', va='bottom', fontsize=9)
-            
-            ax.legend()
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-            
-            img_buffer = BytesIO()
-            plt.savefig(img_buffer, format='png', dpi=150, bbox_inches='tight')
-            img_buffer.seek(0)
-            plt.close()
-            
-            return img_buffer
-        
-        # Generate charts
-        steps_chart_buffer = generate_steps_chart(weekly_steps_data) if weekly_steps_data else None
-        sleep_chart_buffer = generate_sleep_chart(weekly_sleep_data) if weekly_sleep_data else None
-        shap_chart_buffer = generate_shap_chart()
-        
-        # Calculate STOP-BANG components
-        snoring = stopbang_score >= 1  # Simplified assumption
-        tiredness = ess_score >= 11
-        observed_apnea = False  # Not directly available
-        bmi_over_35 = bmi > 35
-        age_over_50 = age > 50
-        neck_large = neck_cm >= 40 if sex == 'Male' else neck_cm >= 35
-        gender_male = (sex == 'Male')
-        
-        # Generate comprehensive recommendations using the recommendation engine
-        sex_binary = 1 if sex == 'Male' else 0
-        recommendation = generate_ml_recommendation(
-            osa_probability, risk_level, age, bmi, neck_cm,
-            hypertension, diabetes, smokes, alcohol,
-            ess_score, berlin_score, stopbang_score,
-            sleep_duration_hours, daily_steps
-        )
-        
-        # Build data dictionary for PDF generator
-        pdf_data = {
-            'patient': {
-                'name': user_name,
-                'age': age,
-                'sex': sex,
-                'height': f'{height_cm} cm',
-                'weight': f'{weight_kg} kg',
-                'bmi': bmi,
-                'neck_circumference': f'{neck_cm} cm'
-            },
-            'assessment': {
-                'risk_level': risk_level,
-                'osa_probability': int(osa_probability * 100),
-                'recommendation': recommendation
-            },
-            'stop_bang': {
-                'score': stopbang_score,
-                'snoring': snoring,
-                'tiredness': tiredness,
-                'observed_apnea': observed_apnea,
-                'high_blood_pressure': hypertension,
-                'bmi_over_35': bmi_over_35,
-                'age_over_50': age_over_50,
-                'neck_circumference_large': neck_large,
-                'gender_male': gender_male
-            },
-            'epworth_sleepiness_scale': {
-                'total_score': ess_score,
-                'sitting_reading': ess_responses[0] if ess_responses else 0,
-                'watching_tv': ess_responses[1] if ess_responses else 0,
-                'public_sitting': ess_responses[2] if ess_responses else 0,
-                'passenger_car': ess_responses[3] if ess_responses else 0,
-                'lying_down_pm': ess_responses[4] if ess_responses else 0,
-                'talking': ess_responses[5] if ess_responses else 0,
-                'after_lunch': ess_responses[6] if ess_responses else 0,
-                'traffic_stop': ess_responses[7] if ess_responses else 0
-            },
-            'google_fit': {
-                'daily_steps': daily_steps or 0,
-                'average_daily_steps': average_daily_steps or 0,
-                'sleep_duration_hours': sleep_duration_hours or 0,
-                'weekly_steps_chart': steps_chart_buffer,
-                'weekly_sleep_chart': sleep_chart_buffer
-            },
-            'lifestyle': {
-                'smoking': smokes,
-                'alcohol': alcohol
-            },
-            'medical_history': {
-                'hypertension': hypertension,
-                'diabetes': diabetes
-            },
-            'shap_chart': shap_chart_buffer,
-            'generated_date': datetime.now().strftime("%Y-%m-%d %H:%M")
-        }
-        
-        # Generate PDF using ReportLab
-        print("📄 Generating PDF report using ReportLab...")
-        generator = WakeUpCallPDFGenerator()
-        pdf_buffer = generator.generate_pdf(pdf_data)
+        job_id = report_job_id(user_id, survey_id, pdf_data)
+        filename = f'WakeUpCall_Report_{user_name.replace(" ", "_")}.pdf'
+        meta = report_jobs.submit(job_id, user_id, pdf_data, filename)
+        print(f"📄 Report job {job_id}: {meta['status']}")
         
-        pdf_size = len(pdf_buffer.getvalue())
-        print(f"✅ PDF generated successfully: {pdf_size} bytes")
+        if wait:
+            meta = report_jobs.wait(job_id, wait)
+            if meta is None:
+                # Job state or PDF removed since submit (cache cleanup): queue the render again
+                meta = report_jobs.submit(job_id, user_id, pdf_data, filename)
+            if meta['status'] == 'ready':
+                print(f"📤 Sending PDF file to client ({meta.get('size')} bytes)...")
+                return send_report(meta)
         
-        pdf_buffer.seek(0)
+        return report_job_response(meta, 500 if meta['status'] == 'failed' else 202)
         
-        from flask import send_file
-        print(f"📤 Sending PDF file to client...")
-        response = send_file(
-            pdf_buffer,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=f'WakeUpCall_Report_{user_name.replace(" ", "_")}.pdf'
-        )
-        response.headers['Content-Length'] = pdf_size
-        print(f"✅ Response sent with Content-Length: {pdf_size}")
-        return response
-        
-    except ImportError as ie:
-        return jsonify({
-            'error': f'Missing required library: {str(ie)}. Install with: pip install python-docx matplotlib',
-            'success': False
-        }), 500
     except Exception as e:
         import traceback
         print(f"❌ PDF Generation Error: {str(e)}")
@@ -2064,8 +2055,154 @@ def generate_pdf_report():
         }), 500
 
 
+@app.route('/reports/<job_id>', methods=['GET'])
+@require_auth
+def get_report(job_id):
+    """
+    Poll a report job: the PDF once rendered, 202 while pending, 500 if it failed
+    """
+    meta = report_jobs.status(job_id)
+    if meta is None or meta['user_id'] != request.current_user['id']:
+        return jsonify({'error': 'Report not found', 'success': False}), 404
+    
+    if meta['status'] == 'ready':
+        return send_report(meta)
+    return report_job_response(meta, 500 if meta['status'] == 'failed' else 202)
+
+
+EXPORT_PAGE_SIZE = 200  # users read from the database per query
+EXPORT_MAX_USER_IDS = 10000
+
+
+def export_cohort(user_ids=None, risk_level=None, completed_after=None, completed_before=None, limit=None):
+    """
+    Yield (user_id, user_name) for users with a survey, in id order: the given
+    ids, or everyone matching the filter. Read a page at a time, with the
+    connection released in between, so a long export holds neither many rows
+    nor a read transaction. A user_ids list is queried a chunk of
+    EXPORT_PAGE_SIZE ids at a time, so each id is bound once and a query never
+    comes near SQLite's bound-variable limit (999 on older builds).
+    """
+    conditions, params = [], []
+    if risk_level:
+        conditions.append('s.risk_level = ?')
+        params.append(risk_level)
+    if completed_after:
+        conditions.append('l.completed_at >= ?')
+        params.append(completed_after)
+    if completed_before:
+        conditions.append('l.completed_at < ?')
+        params.append(completed_before)
+    sql = f'''
+        SELECT u.id, u.first_name, u.last_name
+        FROM latest_surveys l
+        JOIN users u ON u.id = l.user_id
+        JOIN survey_history s ON s.id = l.survey_id
+        WHERE {{}} {''.join(' AND ' + c for c in conditions)}
+        ORDER BY l.user_id
+        LIMIT ?
+    '''
+    
+    def read_page(where, args):
+        conn = db_pool.acquire()
+        try:
+            return conn.execute(sql.format(where), [*args, *params, EXPORT_PAGE_SIZE]).fetchall()
+        finally:
+            db_pool.release(conn)
+    
+    def pages():
+        if user_ids is not None:
+            ids = sorted(set(user_ids))
+            for start in range(0, len(ids), EXPORT_PAGE_SIZE):
+                chunk = ids[start:start + EXPORT_PAGE_SIZE]
+                yield read_page(f"u.id IN ({','.join('?' * len(chunk))})", chunk)
+            return
+        last_id = 0
+        while True:
+            rows = read_page('l.user_id > ?', [last_id])
+            yield rows
+            if len(rows) < EXPORT_PAGE_SIZE:
+                return
+            last_id = rows[-1][0]
+    
+    rows = (row for page in pages() for row in page)
+    for user_id, first_name, last_name in itertools.islice(rows, limit):
+        yield user_id, f"{first_name} {last_name}"
+
+
+def export_jobs(cohort):
+    """Report jobs (job_id, user_id, pdf_data, filename) for a cohort, built lazily."""
+    for user_id, user_name in cohort:
+        conn = db_pool.acquire()
+        try:
+            report = build_report_data(conn, user_id, user_name)
+        finally:
+            db_pool.release(conn)
+        if report is None:
+            continue
+        survey_id, pdf_data = report
+        filename = f'WakeUpCall_Report_{user_name.replace(" ", "_")}.pdf'
+        yield report_job_id(user_id, survey_id, pdf_data), user_id, pdf_data, filename
+
+
+def export_entries(jobs):
+    """
+    ZIP entries for an export: each PDF as its render finishes (read from the
+    report cache), then manifest.csv with one status line per user.
+    """
+    import csv
+    import io
+    import re
+    
+    manifest = io.StringIO()
+    writer = csv.writer(manifest)
+    writer.writerow(['user_id', 'status', 'file', 'error'])
+    for meta in report_jobs.render_many(jobs):
+        arcname = ''
+        if meta['status'] == 'ready':
+            arcname = f"{meta['user_id']}_{re.sub(r'[^A-Za-z0-9_.-]', '_', meta['filename'])}"
+            yield arcname, report_jobs.pdf_path(meta['job_id'])
+        writer.writerow([meta.get('user_id', ''), meta['status'], arcname, meta.get('error') or ''])
+    yield 'manifest.csv', manifest.getvalue().encode()
+
+
+@app.route('/admin/reports/export', methods=['POST'])
+@require_admin
+def export_reports():
+    """
+    Bulk PDF export: a ZIP of the latest report for each user in a cohort.
+    JSON body: {"user_ids": [...]} or {"filter": {"risk_level": ..., "completed_after": ...,
+    "completed_before": ...}}, optional "limit". Reports render in the report pool
+    (cached ones are reused) and the ZIP is streamed as each PDF finishes, so
+    memory stays flat whatever the cohort size.
+    """
+    data = request.get_json(silent=True) or {}
+    user_ids = data.get('user_ids')
+    filters = data.get('filter') or {}
+    limit = data.get('limit')
+    
+    if user_ids is None and not filters:
+        return jsonify({'error': 'Provide user_ids or a filter', 'success': False}), 400
+    if user_ids is not None and (not isinstance(user_ids, list) or len(user_ids) > EXPORT_MAX_USER_IDS
+                                 or not all(isinstance(i, int) for i in user_ids)):
+        return jsonify({'error': f'user_ids must be a list of at most {EXPORT_MAX_USER_IDS} integers',
+                        'success': False}), 400
+    unknown = set(filters) - {'risk_level', 'completed_after', 'completed_before'}
+    if unknown:
+        return jsonify({'error': f"Unknown filter fields: {', '.join(sorted(unknown))}", 'success': False}), 400
+    if limit is not None and (not isinstance(limit, int) or limit < 1):
+        return jsonify({'error': 'limit must be a positive integer', 'success': False}), 400
+    
+    cohort = export_cohort(user_ids, limit=limit, **filters)
+    print(f"📦 Report export started by {request.current_user['email']}")
+    response = app.response_class(stream_zip(export_entries(export_jobs(cohort))), mimetype='application/zip')
+    response.headers['Content-Disposition'] = (
+        f"attachment; filename=WakeUpCall_Reports_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip")
+    return response
+
+
 if __name__ == '__main__':
     print("🚀 Starting WakeUp Call OSA Prediction API...")
-    print(f"📊 Model loaded: {model is not None}")
+    print(f"📊 Model loaded: {get_model() is not None}")
     print(f"📏 Scaler loaded: {scaler is not None and hasattr(scaler, 'transform')} (not required for LightGBM)")
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,398 @@
+"""
+Micro-benchmarks for the WakeUp Call backend hot paths.
+
+Usage:
+    python benchmark.py scoring [--model lightgbm_sleep_apnea_model.pkl] [--iterations 2000]
+    python benchmark.py features [--rows 10000]
+    python benchmark.py recommendations [--rows 100000]
+    python benchmark.py db [--readers 8] [--seconds 5]
+    python benchmark.py charts [--iterations 20]
+    python benchmark.py pdf [--seconds 5] [--threads 1]
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODEL = os.path.join(BACKEND_DIR, 'lightgbm_sleep_apnea_model.pkl')
+
+
+def _timeit(fn, iterations):
+    """Run fn `iterations` times and return mean microseconds per call."""
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def _model_features(model):
+    """Feature names the model was trained on (falls back to generic names)."""
+    names = getattr(model, 'feature_name_', None) or getattr(model, 'feature_names_in_', None)
+    if names is None:
+        names = [f'f{i}' for i in range(model.n_features_in_)]
+    return list(names)
+
+
+def _sample_rows(features, n, seed=0):
+    """Deterministic feature dicts with plausible ranges for the survey inputs."""
+    rng = np.random.default_rng(seed)
+    ranges = {
+        'Age': (18, 80), 'Height': (150, 195), 'Weight': (45, 130), 'BMI': (18, 45),
+        'Neck_Circumference': (30, 48), 'Epworth_Score': (0, 24), 'STOPBANG': (0, 8),
+    }
+    rows = []
+    for _ in range(n):
+        row = {}
+        for f in features:
+            lo, hi = ranges.get(f, (0, 1))
+            row[f] = float(rng.integers(lo, hi + 1))
+        rows.append(row)
+    return rows
+
+
+def bench_scoring(args):
+    """Per-request and batch latency: DataFrame path, NumPy/booster fast path, compiled trees."""
+    from compiled_model import CompiledForest
+    from scoring import ModelScorer, load_model_file
+
+    model = load_model_file(args.model)
+    features = _model_features(model)
+    rows = _sample_rows(features, 256)
+
+    df_scorer = ModelScorer(model, features, fast_path=False)
+    fast_scorer = ModelScorer(model, features)
+    if not fast_scorer.uses_fast_path:
+        print("Model has no LightGBM booster (e.g. sklearn Pipeline); fast path unavailable.")
+
+    compiled_scorer = ModelScorer(CompiledForest.from_model(model), features)
+
+    scorers = (('dataframe', df_scorer), ('numpy-fast-path', fast_scorer), ('compiled', compiled_scorer))
+    for name, scorer in scorers:
+        i = iter(range(10 ** 9))
+        us = _timeit(lambda: scorer.score(rows[next(i) % len(rows)]), args.iterations)
+        print(f"{name:>18}: {us:9.1f} us/request")
+
+    X = np.array([[row[f] for f in features] for row in _sample_rows(features, 5000, seed=1)])
+    for name, scorer in scorers:
+        us = _timeit(lambda: scorer.predict_proba(X), 5)
+        print(f"{name:>18}: {len(X) / (us / 1e6):9.0f} rows/s (batch of {len(X)})")
+
+    # Sanity check: all paths must agree
+    for row in rows[:32]:
+        a = df_scorer.score(row).probabilities
+        for _, scorer in scorers[1:]:
+            b = scorer.score(row).probabilities
+            assert np.allclose(a, b, atol=1e-9), (a, b)
+    print("Outputs identical on 32 sample rows")
+
+
+def bench_features(args):
+    """Feature pipeline cost per row for single requests and whole batches."""
+    from features import FEATURES, predict_features, survey_features
+
+    records = [{f: v for f, v in row.items() if f not in ('Age_Group', 'BMI') and not f.startswith('BANG_')}
+               for row in _sample_rows(FEATURES, args.rows)]
+    payload = {
+        'demographics': {'age': 52, 'sex': 'male', 'height_cm': 175.0, 'weight_kg': 98.0,
+                         'neck_circumference_cm': 42.0},
+        'medical_history': {'hypertension': True, 'smokes': False},
+        'survey_responses': {'ess_responses': [2, 1, 2, 1, 2, 1, 2, 1],
+                             'stopbang_responses': {'snoring': True, 'tired': True}}
+    }
+    payloads = [payload] * args.rows
+
+    print(f"predict_features, 1 record:       {_timeit(lambda: predict_features(records[:1]), 2000):8.1f} us")
+    us = _timeit(lambda: predict_features(records), 5) / args.rows
+    print(f"predict_features, {args.rows} records: {us:8.2f} us/row")
+    print(f"survey_features, 1 payload:       {_timeit(lambda: survey_features(payloads[:1]), 2000):8.1f} us")
+    us = _timeit(lambda: survey_features(payloads), 5) / args.rows
+    print(f"survey_features, {args.rows} payloads: {us:8.2f} us/row")
+
+
+def bench_recommendations(args):
+    """Cohort recommendation throughput: per-user calls vs generate_recommendations_batch."""
+    from recommendation_engine import RecommendationEngine
+
+    rng = np.random.default_rng(0)
+    n = args.rows
+    columns = {
+        'age': rng.integers(18, 81, n), 'sex': rng.integers(0, 2, n),
+        'bmi': rng.uniform(18, 45, n).round(1), 'neck_cm': rng.uniform(30, 48, n).round(1),
+        'hypertension': rng.random(n) < 0.3, 'diabetes': rng.random(n) < 0.15,
+        'smokes': rng.random(n) < 0.2, 'alcohol': rng.random(n) < 0.3,
+        'ess_score': rng.integers(0, 25, n), 'berlin_score': rng.integers(0, 4, n),
+        'stopbang_score': rng.integers(0, 9, n), 'sleep_duration': rng.uniform(4, 10, n).round(1),
+        'daily_steps': rng.integers(0, 20000, n),
+        'risk_level': rng.choice(['Low Risk', 'Intermediate Risk', 'High Risk'], n),
+    }
+    users = [{name: values[i].item() for name, values in columns.items()} for i in range(n)]
+
+    def per_user():
+        return [RecommendationEngine.generate_api_text(**user) for user in users]
+
+    expected = per_user()
+    if RecommendationEngine.generate_recommendations_batch(columns, output='text') != expected:
+        raise SystemExit("❌ Batch recommendations differ from per-user recommendations")
+
+    seconds = _timeit(per_user, 3) / 1e6
+    print(f"per-user generate_api_text: {n / seconds:12,.0f} rows/s")
+    for output in ('masks', 'ids', 'text'):
+        seconds = _timeit(lambda: RecommendationEngine.generate_recommendations_batch(columns, output), 5) / 1e6
+        print(f"batch, output={output + ':':<7}       {n / seconds:12,.0f} rows/s")
+
+
+def _db_workload(path, connect, release, readers, seconds):
+    """One writer inserting surveys (like submit_survey) while `readers` threads read them back."""
+    stop = threading.Event()
+    write_ms, reads, errors = [], [0] * readers, [0]
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            conn = connect()
+            try:
+                conn.execute('INSERT INTO surveys (user_id, payload) VALUES (?, ?)', (i % 100, 'x' * 512))
+                conn.commit()
+            except sqlite3.OperationalError:
+                errors[0] += 1
+            finally:
+                release(conn)
+            write_ms.append((time.perf_counter() - start) * 1000)
+            i += 1
+
+    def reader(n):
+        i = 0
+        while not stop.is_set():
+            conn = connect()
+            try:
+                conn.execute('SELECT * FROM surveys WHERE user_id = ? ORDER BY completed_at DESC LIMIT 1',
+                             (i % 100,)).fetchone()
+                conn.execute('SELECT COUNT(*) FROM surveys').fetchone()
+                reads[n] += 1
+            except sqlite3.OperationalError:
+                errors[0] += 1
+            finally:
+                release(conn)
+            i += 1
+
+    threads = [threading.Thread(target=writer)]
+    threads += [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    w = np.array(write_ms)
+    return {
+        'writes/s': len(w) / seconds,
+        'write p50 ms': np.percentile(w, 50),
+        'write p99 ms': np.percentile(w, 99),
+        'write max ms': w.max(),
+        'reads/s': sum(reads) / seconds,
+        'errors': errors[0],
+    }
+
+
+SURVEYS_SCHEMA = '''
+    CREATE TABLE surveys (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        payload TEXT,
+        completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+def bench_db(args):
+    """Writer latency under concurrent readers: per-call connect (rollback journal) vs the WAL pool."""
+    import database
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'per_call.db')
+        conn = sqlite3.connect(path)
+        conn.execute(SURVEYS_SCHEMA)
+        conn.commit()
+        conn.close()
+        results['connect per call'] = _db_workload(
+            path, lambda: sqlite3.connect(path), lambda c: c.close(), args.readers, args.seconds)
+
+        pool = database.ConnectionPool(os.path.join(tmp, 'pooled.db'))
+        conn = pool.acquire()
+        conn.execute(SURVEYS_SCHEMA)
+        conn.commit()
+        pool.release(conn)
+        results['pool + WAL'] = _db_workload(
+            pool.path, pool.acquire, pool.release, args.readers, args.seconds)
+        pool.close_all()
+
+    print(f"1 writer, {args.readers} readers, {args.seconds}s per mode")
+    for name, r in results.items():
+        print(f"{name:>18}: " + ', '.join(
+            f"{k} {v:.1f}" if isinstance(v, float) else f"{k} {v}" for k, v in r.items()))
+
+
+SAMPLE_CHART_INPUTS = {
+    'shap': {'age': 55, 'stopbang_score': 5, 'neck_cm': 43, 'ess_score': 14},
+    'weekly_steps': {f'2024-01-0{d}': 4000 + d * 900 for d in range(1, 8)},
+    'weekly_sleep': {f'2024-01-0{d}': 5.5 + d * 0.3 for d in range(1, 8)},
+}
+
+
+def bench_charts(args):
+    """Chart rendering time and PDF size: ReportLab vector drawings vs matplotlib PNGs."""
+    import charts
+    from reports import render_report
+
+    report = {
+        'patient': {'name': 'Benchmark Patient', 'age': 55, 'sex': 'Male', 'bmi': 32.7},
+        'assessment': {'risk_level': 'High Risk', 'osa_probability': 82, 'recommendation': ''},
+        'stop_bang': {'score': 5},
+        'epworth_sleepiness_scale': {'total_score': 14},
+        'charts': SAMPLE_CHART_INPUTS,
+    }
+    print(f"{args.iterations} iterations per backend")
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in charts.BACKENDS:
+            try:
+                chart_us = _timeit(lambda: charts.report_charts(SAMPLE_CHART_INPUTS, backend), args.iterations)
+            except ImportError as e:
+                print(f"{backend:>11}: unavailable ({e})")
+                continue
+            charts.CHART_BACKEND = backend
+            path = os.path.join(tmp, f'{backend}.pdf')
+            pdf_us = _timeit(lambda: render_report(report, path), args.iterations)
+            print(f"{backend:>11}: charts {chart_us / 1000:8.2f} ms, "
+                  f"full report {pdf_us / 1000:8.2f} ms, PDF {os.path.getsize(path) / 1024:7.1f} KiB")
+
+
+def _sample_report():
+    """Report data as generate_pdf_report builds it, with real recommendation text."""
+    import charts
+    from recommendation_engine import RecommendationEngine
+
+    recommendation = RecommendationEngine.generate_api_text(
+        age=55, sex=1, bmi=32.7, neck_cm=43, hypertension=True, diabetes=False, smokes=True,
+        alcohol=False, ess_score=14, berlin_score=2, stopbang_score=5, sleep_duration=5.5,
+        daily_steps=4200, risk_level='High Risk')
+    return {
+        'patient': {'name': 'Benchmark Patient', 'age': 55, 'sex': 'Male', 'height': '175 cm',
+                    'weight': '100 kg', 'bmi': 32.7, 'neck_circumference': '43 cm'},
+        'assessment': {'risk_level': 'High Risk', 'osa_probability': 82,
+                       'recommendation': recommendation},
+        'stop_bang': {'score': 5, 'snoring': True, 'tiredness': True, 'bmi_over_35': False},
+        'epworth_sleepiness_scale': {'total_score': 14},
+        'lifestyle': {'smoking': True, 'alcohol': False},
+        'medical_history': {'hypertension': True, 'diabetes': False},
+        'shap_chart': charts.shap_drawing(**SAMPLE_CHART_INPUTS['shap']),
+        'generated_date': '2024-01-01 00:00',
+    }
+
+
+def _pdf_throughput(render, threads, seconds):
+    done = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def worker(n):
+        while time.perf_counter() < deadline:
+            render()
+            done[n] += 1
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start, cpu_start = time.perf_counter(), time.process_time()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    # PDFs/s, and CPU ms per PDF (steadier than wall time on a shared machine)
+    return sum(done) / (time.perf_counter() - start), (time.process_time() - cpu_start) * 1000 / sum(done)
+
+
+def bench_pdf(args):
+    """
+    PDFs/sec: the pre-ReportTemplate generator (pdf_generator_baseline, a new
+    one per report, ASCII85 streams) vs the shared generator. The modes alternate
+    for --rounds rounds of --seconds each; the median PDFs/s and CPU ms per PDF
+    of each mode are reported.
+    """
+    import charts
+    import pdf_generator_baseline
+    from pdf_generator import get_generator
+    from reportlab import rl_config
+
+    report = _sample_report()
+    use_a85 = rl_config.useA85
+
+    def fresh_report():
+        # Drawings are mutated while rendering, so each report gets its own
+        return dict(report, shap_chart=charts.shap_drawing(**SAMPLE_CHART_INPUTS['shap']))
+
+    modes = {
+        'baseline generator': (1, lambda: pdf_generator_baseline.WakeUpCallPDFGenerator().generate_pdf(fresh_report())),
+        'shared generator': (use_a85, lambda: get_generator().generate_pdf(fresh_report())),
+    }
+    rates = {name: [] for name in modes}
+    try:
+        for _ in range(args.rounds):
+            for name, (a85, render) in modes.items():
+                rl_config.useA85 = a85
+                render()  # warm-up
+                rates[name].append(_pdf_throughput(render, args.threads, args.seconds))
+    finally:
+        rl_config.useA85 = use_a85
+    print(f"{args.threads} thread(s), {args.rounds} rounds of {args.seconds}s per mode")
+    for name, values in rates.items():
+        rate, cpu_ms = np.median(values, axis=0)
+        print(f"{name:>22}: {rate:7.1f} PDFs/s, {cpu_ms:6.2f} CPU ms/PDF "
+              f"(median; PDFs/s range {min(v[0] for v in values):.1f}-{max(v[0] for v in values):.1f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('scoring', help='single-row scoring latency')
+    p.add_argument('--model', default=DEFAULT_MODEL)
+    p.add_argument('--iterations', type=int, default=2000)
+    p.set_defaults(func=bench_scoring)
+
+    p = sub.add_parser('features', help='feature pipeline cost for single records and batches')
+    p.add_argument('--rows', type=int, default=10000)
+    p.set_defaults(func=bench_features)
+
+    p = sub.add_parser('recommendations', help='cohort recommendation throughput, per-user vs batch')
+    p.add_argument('--rows', type=int, default=100000)
+    p.set_defaults(func=bench_recommendations)
+
+    p = sub.add_parser('db', help='SQLite writer latency under concurrent readers')
+    p.add_argument('--readers', type=int, default=8)
+    p.add_argument('--seconds', type=float, default=5)
+    p.set_defaults(func=bench_db)
+
+    p = sub.add_parser('charts', help='report chart rendering: vector drawings vs matplotlib')
+    p.add_argument('--iterations', type=int, default=20)
+    p.set_defaults(func=bench_charts)
+
+    p = sub.add_parser('pdf', help='report rendering throughput: baseline generator vs the current one')
+    p.add_argument('--seconds', type=float, default=5)
+    p.add_argument('--threads', type=int, default=1)
+    p.add_argument('--rounds', type=int, default=5)
+    p.set_defaults(func=bench_pdf)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+"""
+Report charts for WakeUpCallPDFGenerator.
+
+By default the charts are ReportLab Drawing flowables: vector bar charts placed
+straight into the PDF, with no figure setup or rasterization and a smaller
+file. Setting WAKEUPCALL_CHART_BACKEND=matplotlib renders the previous 150-dpi
+PNGs instead (BytesIO, embedded as Image); matplotlib is only imported then.
+Every chart function takes plain values so it can run in a report worker.
+"""
+
+import os
+
+from reportlab.graphics.shapes import Drawing, Group, Line, Rect, String
+from reportlab.lib import colors
+from reportlab.lib.units import inch
+
+
+CHART_BACKEND = os.environ.get('WAKEUPCALL_CHART_BACKEND', 'vector').lower()
+
+# Size the PDF gives each chart
+CHART_WIDTH = 5 * inch
+CHART_HEIGHT = 3 * inch
+
+RED = '#f44336'
+ORANGE = '#ff9800'
+GREEN = '#4caf50'
+
+
+def shap_factors(age, stopbang_score, neck_cm, ess_score):
+    """(name, impact 0-1) for the SHAP-style chart, highest impact first"""
+    age_impact = 0.75 if age >= 50 else 0.40
+    snoring_impact = 0.85 if stopbang_score >= 1 else 0.25
+    stopbang_impact = (stopbang_score / 8.0) * 0.9 + 0.1
+
+    if neck_cm >= 43:
+        neck_impact = 0.90
+    elif neck_cm >= 40:
+        neck_impact = 0.70
+    elif neck_cm >= 37:
+        neck_impact = 0.50
+    else:
+        neck_impact = 0.30
+
+    ess_impact = (ess_score / 24.0) * 0.9 + 0.1
+
+    factors = [
+        ('Age', age_impact),
+        ('Snoring', snoring_impact),
+        ('STOP-BANG', stopbang_impact),
+        ('Neck Circ', neck_impact),
+        ('ESS Score', ess_impact)
+    ]
+    factors.sort(key=lambda x: x[1], reverse=True)
+    return factors
+
+
+def shap_colors(values):
+    return [RED if v >= 70 else ORANGE if v >= 50 else GREEN for v in values]
+
+
+def steps_colors(steps):
+    return [GREEN if s >= 8000 else ORANGE if s >= 5000 else RED for s in steps]
+
+
+def sleep_colors(hours):
+    return [GREEN if h >= 7 else ORANGE if h >= 6 else RED for h in hours]
+
+
+# ---------------------------------------------------------------------------
+# Vector (ReportLab Drawing) charts
+# ---------------------------------------------------------------------------
+
+# Plot area inside the drawing
+PLOT_LEFT = 62
+PLOT_RIGHT = CHART_WIDTH - 30
+PLOT_BOTTOM = 40
+PLOT_TOP = CHART_HEIGHT - 28
+
+
+def _frame(title, x_label, y_label=None):
+    """Title, axis lines and axis labels shared by every chart"""
+    shapes = [
+        String(CHART_WIDTH / 2, CHART_HEIGHT - 14, title,
+               fontName='Helvetica-Bold', fontSize=11, textAnchor='middle'),
+        Line(PLOT_LEFT, PLOT_BOTTOM, PLOT_RIGHT, PLOT_BOTTOM, strokeWidth=0.6),
+        Line(PLOT_LEFT, PLOT_BOTTOM, PLOT_LEFT, PLOT_TOP, strokeWidth=0.6),
+        String((PLOT_LEFT + PLOT_RIGHT) / 2, 6, x_label, fontName='Helvetica', fontSize=9, textAnchor='middle'),
+    ]
+    if y_label:
+        label = String(0, 0, y_label, fontName='Helvetica', fontSize=9, textAnchor='middle')
+        # Rotated y-axis label
+        group = Group(label)
+        group.transform = (0, 1, -1, 0, 12, (PLOT_BOTTOM + PLOT_TOP) / 2)
+        shapes.append(group)
+    return shapes
+
+
+def _value_ticks(maximum, count=5):
+    """Rounded tick values from 0 up to about `maximum`"""
+    raw = maximum / count
+    magnitude = 10 ** (len(str(int(raw))) - 1) if raw >= 1 else 0.1
+    step = next(m * magnitude for m in (1, 2, 2.5, 5, 10) if m * magnitude >= raw)
+    ticks, value = [], 0
+    while value <= maximum + 1e-9:
+        ticks.append(value)
+        value += step
+    return ticks
+
+
+def _drawing(shapes):
+    drawing = Drawing(CHART_WIDTH, CHART_HEIGHT, *shapes)
+    drawing.hAlign = 'CENTER'
+    return drawing
+
+
+def shap_drawing(age, stopbang_score, neck_cm, ess_score):
+    """Horizontal bar chart of risk factor impact as a Drawing"""
+    factors = shap_factors(age, stopbang_score, neck_cm, ess_score)
+    names = [f[0] for f in factors]
+    values = [f[1] * 100 for f in factors]
+    shapes = _frame('SHAP Analysis - Risk Factor Impact', 'Impact (%)')
+    scale = (PLOT_RIGHT - PLOT_LEFT) / 100.0
+    for tick in range(0, 101, 20):
+        x = PLOT_LEFT + tick * scale
+        shapes.append(Line(x, PLOT_BOTTOM, x, PLOT_BOTTOM - 3, strokeWidth=0.6))
+        shapes.append(String(x, PLOT_BOTTOM - 12, str(tick), fontName='Helvetica', fontSize=8, textAnchor='middle'))
+
+    # Same order as matplotlib's barh: first (highest) factor at the bottom
+    slot = (PLOT_TOP - PLOT_BOTTOM) / len(factors)
+    bar_height = slot * 0.8
+    for i, (name, value, color) in enumerate(zip(names, values, shap_colors(values))):
+        y = PLOT_BOTTOM + i * slot + (slot - bar_height) / 2
+        shapes.append(Rect(PLOT_LEFT, y, value * scale, bar_height,
+                           fillColor=colors.HexColor(color), strokeColor=None))
+        shapes.append(String(PLOT_LEFT - 4, y + bar_height / 2 - 3, name,
+                             fontName='Helvetica', fontSize=8, textAnchor='end'))
+        shapes.append(String(PLOT_LEFT + value * scale + 3, y + bar_height / 2 - 3, f'{value:.0f}%',
+                             fontName='Helvetica', fontSize=8))
+    # New shapes per drawing: the renderer sets and deletes attributes on them while
+    # drawing, so shapes must never be shared between drawings rendered concurrently
+    return _drawing(shapes)
+
+
+def _column_drawing(title, y_label, labels, values, bar_colors, y_max, value_format, reference=None):
+    shapes = _frame(title, 'Date', y_label)
+    scale = (PLOT_TOP - PLOT_BOTTOM) / y_max
+    for tick in _value_ticks(y_max):
+        y = PLOT_BOTTOM + tick * scale
+        shapes.append(Line(PLOT_LEFT, y, PLOT_LEFT - 3, y, strokeWidth=0.6))
+        shapes.append(String(PLOT_LEFT - 5, y - 3, f'{tick:,g}', fontName='Helvetica', fontSize=8, textAnchor='end'))
+
+    slot = (PLOT_RIGHT - PLOT_LEFT) / max(len(values), 1)
+    bar_width = slot * 0.8
+    for i, (label, value, color) in enumerate(zip(labels, values, bar_colors)):
+        x = PLOT_LEFT + i * slot + (slot - bar_width) / 2
+        height = min(value, y_max) * scale
+        shapes.append(Rect(x, PLOT_BOTTOM, bar_width, height, fillColor=colors.HexColor(color), strokeColor=None))
+        shapes.append(String(x + bar_width / 2, PLOT_BOTTOM + height + 2, value_format(value),
+                             fontName='Helvetica', fontSize=7, textAnchor='middle'))
+        shapes.append(String(x + bar_width / 2, PLOT_BOTTOM - 11, label,
+                             fontName='Helvetica', fontSize=8, textAnchor='middle'))
+
+    if reference is not None:
+        value, text = reference
+        y = PLOT_BOTTOM + value * scale
+        shapes.append(Line(PLOT_LEFT, y, PLOT_RIGHT, y, strokeColor=colors.grey,
+                           strokeWidth=0.8, strokeDashArray=[4, 3]))
+        shapes.append(String(PLOT_RIGHT, PLOT_TOP + 2, f'--- {text}', fontName='Helvetica', fontSize=7,
+                             fillColor=colors.grey, textAnchor='end'))
+    return _drawing(shapes)
+
+
+def steps_drawing(steps_data):
+    """Column chart of {date: steps} (already in date order) as a Drawing"""
+    steps = list(steps_data.values())
+    return _column_drawing(
+        'Weekly Step Count', 'Steps', [d[5:] for d in steps_data], steps, steps_colors(steps),
+        max(steps) * 1.2 if steps and max(steps) > 0 else 15000, lambda s: f'{int(s):,}')
+
+
+def sleep_drawing(sleep_data):
+    """Column chart of {date: sleep hours} (already in date order) as a Drawing"""
+    hours = list(sleep_data.values())
+    return _column_drawing(
+        'Weekly Sleep Duration', 'Hours', [d[5:] for d in sleep_data], hours, sleep_colors(hours),
+        10, lambda h: f'{h:.1f}h', reference=(7, 'Recommended (7h)'))
+
+
+# ---------------------------------------------------------------------------
+# Raster (matplotlib PNG) charts, the optional fallback
+# ---------------------------------------------------------------------------
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _to_png(plt, fig):
+    from io import BytesIO
+    img_buffer = BytesIO()
+    fig.savefig(img_buffer, format='png', dpi=150, bbox_inches='tight')
+    img_buffer.seek(0)
+    plt.close(fig)
+    return img_buffer
+
+
+def shap_png(age, stopbang_score, neck_cm, ess_score):
+    """Horizontal bar chart of risk factor impact as a PNG buffer"""
+    plt = _pyplot()
+    factors = shap_factors(age, stopbang_score, neck_cm, ess_score)
+
+    fig, ax = plt.subplots(figsize=(8, 5))
+    names = [f[0] for f in factors]
+    values = [f[1] * 100 for f in factors]
+
+    ax.barh(names, values, color=shap_colors(values))
+    ax.set_xlabel('Impact (%)', fontsize=12)
+    ax.set_title('SHAP Analysis - Risk Factor Impact', fontsize=14, fontweight='bold')
+    ax.set_xlim(0, 100)
+
+    for i, v in enumerate(values):
+        ax.text(v + 2, i, f'{v:.0f}%', va='center', fontsize=10)
+
+    fig.tight_layout()
+    return _to_png(plt, fig)
+
+
+def steps_png(steps_data):
+    """Bar chart of {date: steps} (already in date order) as a PNG buffer"""
+    plt = _pyplot()
+    dates = [d[5:] for d in steps_data]  # Extract MM-DD
+    steps = list(steps_data.values())
+
+    fig, ax = plt.subplots(figsize=(8, 5))
+    bars = ax.bar(dates, steps, color=steps_colors(steps))
+
+    ax.set_xlabel('Date', fontsize=12)
+    ax.set_ylabel('Steps', fontsize=12)
+    ax.set_title('Weekly Step Count', fontsize=14, fontweight='bold')
+    ax.set_ylim(0, max(steps) * 1.2 if steps else 15000)
+
+    # Add value labels on bars
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width()/2., height,
+               f'{int(height):,}',
+               ha='center', va='bottom', fontsize=9)
+
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    return _to_png(plt, fig)
+
+
+def sleep_png(sleep_data):
+    """Bar chart of {date: sleep hours} (already in date order) as a PNG buffer"""
+    plt = _pyplot()
+    dates = [d[5:] for d in sleep_data]  # Extract MM-DD
+    hours = list(sleep_data.values())
+
+    fig, ax = plt.subplots(figsize=(8, 5))
+    bars = ax.bar(dates, hours, color=sleep_colors(hours))
+
+    ax.set_xlabel('Date', fontsize=12)
+    ax.set_ylabel('Hours', fontsize=12)
+    ax.set_title('Weekly Sleep Duration', fontsize=14, fontweight='bold')
+    ax.set_ylim(0, 10)
+    ax.axhline(y=7, color='gray', linestyle='--', alpha=0.5, label='Recommended (7h)')
+
+    # Add value labels on bars
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width()/2., height,
+               f'{height:.1f}h',
+               ha='center', va='bottom', fontsize=9)
+
+    ax.legend()
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    return _to_png(plt, fig)
+
+
+# ---------------------------------------------------------------------------
+# Backend selection
+# ---------------------------------------------------------------------------
+
+BACKENDS = {
+    'vector': (shap_drawing, steps_drawing, sleep_drawing),
+    'matplotlib': (shap_png, steps_png, sleep_png),
+}
+
+
+def report_charts(chart_inputs, backend=None):
+    """
+    {'shap_chart', 'weekly_steps_chart', 'weekly_sleep_chart'} for the report,
+    each a Drawing or PNG buffer (None when there is no data for it)
+    """
+    shap, steps, sleep = BACKENDS[backend or CHART_BACKEND]
+    return {
+        'shap_chart': shap(**chart_inputs['shap']) if chart_inputs.get('shap') else None,
+        'weekly_steps_chart': steps(chart_inputs['weekly_steps']) if chart_inputs.get('weekly_steps') else None,
+        'weekly_sleep_chart': sleep(chart_inputs['weekly_sleep']) if chart_inputs.get('weekly_sleep') else None,
+    }
@@ -0,0 +1,300 @@
+"""
+Compiled LightGBM inference engine.
+
+Flattens every tree of a trained LightGBM booster into plain NumPy arrays
+(split feature, threshold, left/right child, leaf value) and evaluates all
+trees for a batch with vectorized traversal. Once compiled and saved to .npz,
+scoring needs neither lightgbm nor scikit-learn at serve time.
+
+Usage (compile, check parity against model.predict_proba, save):
+    python compiled_model.py lightgbm_sleep_apnea_model.pkl lightgbm_sleep_apnea_model.compiled.npz
+"""
+
+import json
+import sys
+from typing import List, Optional
+
+import numpy as np
+
+
+# LightGBM's kZeroThreshold (the float literal 1e-35f): inputs with |x| <= this
+# are read as exactly zero before any split is evaluated
+ZERO_THRESHOLD = float(np.float32(1e-35))
+
+# LightGBM clamps inputs to +-1e300 (Common::AvoidInf), so inf meets a 1e300 threshold
+MAX_VALUE = 1e300
+
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+_MISSING_TYPES = {'None': MISSING_NONE, 'Zero': MISSING_ZERO, 'NaN': MISSING_NAN}
+
+# Rows evaluated per traversal pass (bounds the rows x trees node-index matrix)
+ROW_CHUNK = 2048
+
+
+class CompiledForest:
+    """
+    Flattened tree ensemble. All trees share one set of node arrays;
+    leaves point to themselves so traversal can run a fixed number of steps.
+
+    predict() mirrors lightgbm.Booster.predict (probabilities; 1-D for binary),
+    predict_proba() mirrors LGBMClassifier.predict_proba.
+    """
+
+    def __init__(self, split_feature, threshold, left, right, default_left, missing_type,
+                 leaf_value, roots, tree_class, max_depth, num_class, objective,
+                 sigmoid=1.0, classes=None, feature_names=None):
+        self.split_feature = np.asarray(split_feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.default_left = np.asarray(default_left, dtype=bool)
+        self.missing_type = np.asarray(missing_type, dtype=np.int8)
+        self.leaf_value = np.asarray(leaf_value, dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.tree_class = np.asarray(tree_class, dtype=np.int32)
+        self.max_depth = int(max_depth)
+        self.num_class = int(num_class)
+        self.objective = objective
+        self.sigmoid = float(sigmoid)
+        n_outputs = self.num_class if self.num_class > 1 else 2
+        self.classes_ = np.asarray(classes if classes is not None else np.arange(n_outputs))
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self._has_missing_splits = bool((self.missing_type != MISSING_NONE).any())
+
+    # ------------------------------------------------------------------
+    # Construction
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_model(cls, model) -> 'CompiledForest':
+        """Compile an LGBMClassifier (or a raw lightgbm.Booster)."""
+        booster = getattr(model, 'booster_', model)
+        forest = cls.from_booster(booster)
+        if hasattr(model, 'classes_'):
+            forest.classes_ = np.asarray(model.classes_)
+        return forest
+
+    @classmethod
+    def from_booster(cls, booster) -> 'CompiledForest':
+        """Flatten booster.dump_model() into node arrays."""
+        dump = booster.dump_model()
+        objective = dump.get('objective', '').split()
+        objective_name = objective[0] if objective else ''
+        if objective_name not in ('binary', 'multiclass', 'multiclassova', 'softmax', 'ova'):
+            raise ValueError(f"Unsupported objective for compiled inference: {dump.get('objective')}")
+        sigmoid = 1.0
+        for param in objective[1:]:
+            if param.startswith('sigmoid:'):
+                sigmoid = float(param.split(':', 1)[1])
+
+        num_class = dump['num_class']
+        tree_info = dump['tree_info']
+        best_iteration = getattr(booster, 'best_iteration', 0) or 0
+        if best_iteration > 0:
+            tree_info = tree_info[:best_iteration * num_class]
+
+        split_feature, threshold, left, right = [], [], [], []
+        default_left, missing_type, leaf_value = [], [], []
+        roots, tree_class = [], []
+        max_depth = 0
+
+        def add_node():
+            split_feature.append(0)
+            threshold.append(0.0)
+            left.append(0)
+            right.append(0)
+            default_left.append(False)
+            missing_type.append(MISSING_NONE)
+            leaf_value.append(0.0)
+            return len(split_feature) - 1
+
+        for tree_idx, tree in enumerate(tree_info):
+            if tree.get('is_linear'):
+                raise ValueError('Linear trees are not supported by the compiled engine')
+            roots.append(add_node())
+            tree_class.append(tree_idx % num_class)
+            # Iterative DFS: (json node, flat index, depth)
+            stack = [(tree['tree_structure'], roots[-1], 0)]
+            while stack:
+                node, idx, depth = stack.pop()
+                if 'leaf_value' in node and 'split_feature' not in node:
+                    leaf_value[idx] = node['leaf_value']
+                    left[idx] = right[idx] = idx
+                    max_depth = max(max_depth, depth)
+                    continue
+                if node.get('decision_type', '<=') != '<=':
+                    raise ValueError('Categorical splits are not supported by the compiled engine')
+                split_feature[idx] = node['split_feature']
+                threshold[idx] = node['threshold']
+                default_left[idx] = node.get('default_left', True)
+                missing_type[idx] = _MISSING_TYPES.get(node.get('missing_type', 'None'), MISSING_NONE)
+                left_idx, right_idx = add_node(), add_node()
+                left[idx], right[idx] = left_idx, right_idx
+                stack.append((node['left_child'], left_idx, depth + 1))
+                stack.append((node['right_child'], right_idx, depth + 1))
+
+        return cls(split_feature, threshold, left, right, default_left, missing_type,
+                   leaf_value, roots, tree_class, max_depth, num_class, objective_name,
+                   sigmoid=sigmoid, feature_names=dump.get('feature_names'))
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self, path: str):
+        """Save the flattened arrays to an .npz file."""
+        meta = {
+            'max_depth': self.max_depth,
+            'num_class': self.num_class,
+            'objective': self.objective,
+            'sigmoid': self.sigmoid,
+            'feature_names': self.feature_names,
+        }
+        np.savez(
+            path,
+            split_feature=self.split_feature, threshold=self.threshold,
+            left=self.left, right=self.right, default_left=self.default_left,
+            missing_type=self.missing_type, leaf_value=self.leaf_value,
+            roots=self.roots, tree_class=self.tree_class, classes=self.classes_,
+            meta=np.array(json.dumps(meta))
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'CompiledForest':
+        """Load a forest saved with save() (no lightgbm import needed)."""
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            return cls(
+                data['split_feature'], data['threshold'], data['left'], data['right'],
+                data['default_left'], data['missing_type'], data['leaf_value'],
+                data['roots'], data['tree_class'], meta['max_depth'], meta['num_class'],
+                meta['objective'], sigmoid=meta['sigmoid'], classes=data['classes'],
+                feature_names=meta['feature_names']
+            )
+
+    # ------------------------------------------------------------------
+    # Inference
+    # ------------------------------------------------------------------
+
+    @property
+    def n_features_in_(self) -> int:
+        if self.feature_names is not None:
+            return len(self.feature_names)
+        return int(self.split_feature.max()) + 1
+
+    def raw_score(self, X: np.ndarray) -> np.ndarray:
+        """Summed leaf values per class, shape (n_rows, num_class)."""
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f'Expected input of shape (n, {self.n_features_in_}), got {X.shape}')
+        X = np.where(np.abs(X) <= ZERO_THRESHOLD, 0.0, np.clip(X, -MAX_VALUE, MAX_VALUE))
+        # Missing-value routing only matters if some split tracks it or the input has NaNs
+        check_missing = self._has_missing_splits or bool(np.isnan(X).any())
+
+        out = np.empty((len(X), self.num_class), dtype=np.float64)
+        for start in range(0, len(X), ROW_CHUNK):
+            chunk = X[start:start + ROW_CHUNK]
+            rows = np.arange(len(chunk))[:, None]
+            node = np.broadcast_to(self.roots, (len(chunk), len(self.roots))).copy()
+            for _ in range(self.max_depth):
+                fval = chunk[rows, self.split_feature[node]]
+                if check_missing:
+                    mtype = self.missing_type[node]
+                    is_nan = np.isnan(fval)
+                    # NaN is treated as 0.0 unless the split tracks NaN explicitly
+                    fval = np.where(is_nan & (mtype != MISSING_NAN), 0.0, fval)
+                    use_default = (((mtype == MISSING_ZERO) & (fval == 0.0))
+                                   | ((mtype == MISSING_NAN) & is_nan))
+                    go_left = np.where(use_default, self.default_left[node], fval <= self.threshold[node])
+                else:
+                    go_left = fval <= self.threshold[node]
+                node = np.where(go_left, self.left[node], self.right[node])
+            # Trees are stored class-interleaved (tree i belongs to class i % num_class)
+            values = self.leaf_value[node]
+            out[start:start + len(chunk)] = values.reshape(len(chunk), -1, self.num_class).sum(axis=1)
+        return out
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Probabilities in lightgbm.Booster.predict format."""
+        raw = self.raw_score(X)
+        if self.objective in ('multiclass', 'softmax'):
+            raw = raw - raw.max(axis=1, keepdims=True)
+            exp = np.exp(raw)
+            return exp / exp.sum(axis=1, keepdims=True)
+        proba = 1.0 / (1.0 + np.exp(-self.sigmoid * raw))
+        return proba[:, 0] if self.num_class == 1 else proba
+
+    def predict_proba(self, X) -> np.ndarray:
+        """Class probabilities in LGBMClassifier.predict_proba format."""
+        proba = self.predict(np.asarray(X, dtype=np.float64))
+        if proba.ndim == 1:
+            proba = np.column_stack([1.0 - proba, proba])
+        return proba
+
+
+# ----------------------------------------------------------------------
+# Parity checking
+# ----------------------------------------------------------------------
+
+def parity_grid(forest: CompiledForest, n_rows: int = 512, seed: int = 0) -> np.ndarray:
+    """
+    Fixed, deterministic input grid for parity checks. Feature values are
+    drawn from the model's own split thresholds (exactly on, just below and
+    just above), plus zeros, NaNs and infinities to exercise missing-value
+    routing and input clamping.
+    """
+    rng = np.random.default_rng(seed)
+    n_features = forest.n_features_in_
+    internal = forest.left != np.arange(len(forest.left))
+    candidates: List[np.ndarray] = []
+    for f in range(n_features):
+        t = forest.threshold[internal & (forest.split_feature == f)]
+        t = t[np.isfinite(t)]
+        values = np.concatenate([t, np.nextafter(t, -np.inf), np.nextafter(t, np.inf), t - 1.0, t + 1.0,
+                                 [0.0, 1.0, np.nan, np.inf, -np.inf]])
+        candidates.append(values)
+    X = np.empty((n_rows, n_features), dtype=np.float64)
+    for f, values in enumerate(candidates):
+        X[:, f] = values[rng.integers(0, len(values), n_rows)]
+    return X
+
+
+def check_parity(model, forest: CompiledForest, X: Optional[np.ndarray] = None) -> float:
+    """Max absolute difference between model.predict_proba and the compiled forest."""
+    if X is None:
+        X = parity_grid(forest)
+    booster = getattr(model, 'booster_', None)
+    if booster is not None:
+        expected = booster.predict(X)
+        if expected.ndim == 1:
+            expected = np.column_stack([1.0 - expected, expected])
+    else:
+        expected = model.predict_proba(X)
+    return float(np.max(np.abs(expected - forest.predict_proba(X))))
+
+
+def main(argv):
+    if len(argv) < 2:
+        print(__doc__)
+        return 1
+    import joblib
+
+    model_path = argv[1]
+    out_path = argv[2] if len(argv) > 2 else model_path.rsplit('.', 1)[0] + '.compiled.npz'
+    loaded = joblib.load(model_path)
+    model = loaded.get('model') if isinstance(loaded, dict) else loaded
+
+    forest = CompiledForest.from_model(model)
+    print(f"Compiled {len(forest.roots)} trees, {len(forest.left)} nodes, max depth {forest.max_depth}")
+    max_diff = check_parity(model, forest)
+    print(f"Parity on fixed grid: max |diff| = {max_diff:.3e}")
+    if max_diff > 1e-6:
+        print("❌ Parity check failed, not saving")
+        return 1
+    forest.save(out_path)
+    print(f"✅ Saved compiled model to {out_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
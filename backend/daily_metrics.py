@@ -0,0 +1,197 @@
+"""
+Per-day Google Fit / Health Connect metrics.
+
+Steps and sleep are stored one row per (user_id, date) in daily_metrics instead of
+JSON blobs on each survey, so they can be upserted in bulk and aggregated in SQL.
+Dates are the client's local 'YYYY-MM-DD' strings, which sort chronologically.
+"""
+
+from datetime import date, timedelta
+
+
+# A missing value (NULL) never overwrites a stored one
+UPSERT_SQL = '''
+    INSERT INTO daily_metrics (user_id, date, steps, sleep_hours)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (user_id, date) DO UPDATE SET
+        steps = COALESCE(excluded.steps, daily_metrics.steps),
+        sleep_hours = COALESCE(excluded.sleep_hours, daily_metrics.sleep_hours),
+        updated_at = CURRENT_TIMESTAMP
+'''
+
+EXISTING_DAYS_SQL = '''
+    SELECT date, steps, sleep_hours FROM daily_metrics
+    WHERE user_id = ? AND date BETWEEN ? AND ?
+'''
+
+# Running totals per user, updated by deltas on every write
+ROLLUP_DELTA_SQL = '''
+    INSERT INTO metric_rollups (user_id, steps_sum, steps_days, sleep_sum, sleep_days, latest_date)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id) DO UPDATE SET
+        steps_sum = steps_sum + excluded.steps_sum,
+        steps_days = steps_days + excluded.steps_days,
+        sleep_sum = sleep_sum + excluded.sleep_sum,
+        sleep_days = sleep_days + excluded.sleep_days,
+        latest_date = MAX(COALESCE(latest_date, ''), excluded.latest_date),
+        updated_at = CURRENT_TIMESTAMP
+'''
+
+ROLLUP_SQL = '''
+    SELECT steps_sum, steps_days, sleep_sum, sleep_days, latest_date FROM metric_rollups WHERE user_id = ?
+'''
+
+RECENT_DAYS_SQL = '''
+    SELECT date, steps, sleep_hours FROM daily_metrics
+    WHERE user_id = ?
+    ORDER BY date DESC
+    LIMIT ?
+'''
+
+AGGREGATE_WINDOWS = (7, 30, 90)
+
+# Averages/totals over the last N days ending at as_of (inclusive), in one pass over the 90-day range
+AGGREGATES_SQL = '''
+    SELECT
+        {columns}
+    FROM daily_metrics
+    WHERE user_id = :user_id AND date > date(:as_of, '-{widest} days') AND date <= :as_of
+'''
+_WINDOW_COLUMNS = '''
+        AVG(CASE WHEN date > date(:as_of, '-{n} days') THEN steps END) AS avg_steps_{n}d,
+        SUM(CASE WHEN date > date(:as_of, '-{n} days') THEN steps END) AS total_steps_{n}d,
+        AVG(CASE WHEN date > date(:as_of, '-{n} days') THEN sleep_hours END) AS avg_sleep_{n}d,
+        COUNT(CASE WHEN date > date(:as_of, '-{n} days') THEN 1 END) AS days_{n}d'''
+
+
+def aggregates_sql(windows):
+    return AGGREGATES_SQL.format(
+        columns=','.join(_WINDOW_COLUMNS.format(n=n) for n in windows),
+        widest=max(windows))
+
+
+def normalize_date(value):
+    """'YYYY-MM-DD' (a longer ISO timestamp is truncated to its date); None if unparseable."""
+    try:
+        return date.fromisoformat(str(value)[:10]).isoformat()
+    except ValueError:
+        return None
+
+
+def rows_from_daily_maps(user_id, steps_by_date=None, sleep_by_date=None):
+    """
+    Merge {date: steps} and {date: sleep hours} maps into daily_metrics rows
+    (user_id, date, steps, sleep_hours), skipping unparseable dates.
+    """
+    merged = {}
+    for value_index, by_date in ((0, steps_by_date or {}), (1, sleep_by_date or {})):
+        for day, value in by_date.items():
+            day = normalize_date(day)
+            if day is None or value is None:
+                continue
+            entry = merged.setdefault(day, [None, None])
+            entry[value_index] = int(value) if value_index == 0 else float(value)
+    return [(user_id, day, steps, sleep) for day, (steps, sleep) in sorted(merged.items())]
+
+
+def rows_from_records(user_id, records):
+    """
+    daily_metrics rows from a list of {'date', 'steps', 'sleep_hours'} records.
+    Duplicate dates are merged, later records winning. Returns (rows, rejected records).
+    """
+    steps_by_date, sleep_by_date, rejected = {}, {}, []
+    for record in records:
+        day = normalize_date(record.get('date')) if isinstance(record, dict) else None
+        if day is None:
+            rejected.append(record)
+            continue
+        if record.get('steps') is not None:
+            steps_by_date[day] = record['steps']
+        if record.get('sleep_hours') is not None:
+            sleep_by_date[day] = record['sleep_hours']
+    return rows_from_daily_maps(user_id, steps_by_date, sleep_by_date), rejected
+
+
+def apply_daily_rows(conn, user_id, rows):
+    """
+    Bulk upsert one user's (user_id, date, steps, sleep_hours) rows and fold the
+    changes into metric_rollups as deltas against the stored values, so the
+    running averages never need a full recompute. Rows must have unique dates;
+    caller commits.
+
+    The stored values are read under the write lock: outside a transaction this
+    opens one with BEGIN IMMEDIATE, so two writers for the same day cannot both
+    see it as new and count it twice. Inside one, the caller's earlier write
+    already holds the lock.
+    """
+    if not rows:
+        return 0
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+    days = [row[1] for row in rows]
+    existing = {
+        day: (steps, sleep)
+        for day, steps, sleep in conn.execute(EXISTING_DAYS_SQL, (user_id, min(days), max(days)))
+    }
+    steps_sum = steps_days = sleep_sum = sleep_days = 0
+    for _, day, steps, sleep in rows:
+        old_steps, old_sleep = existing.get(day, (None, None))
+        if steps is not None:
+            steps_sum += steps - (old_steps or 0)
+            steps_days += old_steps is None
+        if sleep is not None:
+            sleep_sum += sleep - (old_sleep or 0)
+            sleep_days += old_sleep is None
+
+    conn.executemany(UPSERT_SQL, rows)
+    conn.execute(ROLLUP_DELTA_SQL, (user_id, steps_sum, steps_days, sleep_sum, sleep_days, max(days)))
+    return len(rows)
+
+
+def rollup(conn, user_id):
+    """All-time running averages from metric_rollups (no scan of daily_metrics)."""
+    row = conn.execute(ROLLUP_SQL, (user_id,)).fetchone()
+    if row is None:
+        return {'average_daily_steps': None, 'average_sleep_hours': None,
+                'days_with_steps': 0, 'days_with_sleep': 0, 'latest_date': None}
+    steps_sum, steps_days, sleep_sum, sleep_days, latest = row
+    return {
+        'average_daily_steps': round(steps_sum / steps_days) if steps_days else None,
+        'average_sleep_hours': round(sleep_sum / sleep_days, 2) if sleep_days else None,
+        'days_with_steps': steps_days,
+        'days_with_sleep': sleep_days,
+        'latest_date': latest
+    }
+
+
+def recent_days(conn, user_id, days=7):
+    """Last `days` recorded days, oldest first: ({date: steps}, {date: sleep_hours})."""
+    rows = conn.execute(RECENT_DAYS_SQL, (user_id, days)).fetchall()
+    steps, sleep = {}, {}
+    for day, day_steps, day_sleep in reversed(rows):
+        if day_steps is not None:
+            steps[day] = day_steps
+        if day_sleep is not None:
+            sleep[day] = day_sleep
+    return steps, sleep
+
+
+def window_aggregates(conn, user_id, as_of=None, windows=AGGREGATE_WINDOWS):
+    """
+    Step/sleep aggregates for each trailing window ending at as_of (default today):
+    {'7d': {'avg_steps', 'total_steps', 'avg_sleep_hours', 'days_recorded'}, ...}
+    """
+    as_of = (as_of or date.today()).isoformat()
+    cursor = conn.execute(aggregates_sql(windows), {'user_id': user_id, 'as_of': as_of})
+    row = dict(zip([c[0] for c in cursor.description], cursor.fetchone()))
+    result = {}
+    for n in windows:
+        avg_steps, avg_sleep = row[f'avg_steps_{n}d'], row[f'avg_sleep_{n}d']
+        result[f'{n}d'] = {
+            'avg_steps': round(avg_steps) if avg_steps is not None else None,
+            'total_steps': row[f'total_steps_{n}d'] or 0,
+            'avg_sleep_hours': round(avg_sleep, 2) if avg_sleep is not None else None,
+            'days_recorded': row[f'days_{n}d'],
+            'since': (date.fromisoformat(as_of) - timedelta(days=n - 1)).isoformat()
+        }
+    return result
@@ -0,0 +1,127 @@
+"""
+SQLite connection pooling for the Flask app.
+
+Connections are opened once and reused instead of a fresh sqlite3.connect() per
+call. Inside a request, get_db() hands out one connection per app context (so the
+auth check and the route share it) and returns it to the pool on teardown.
+Outside a request, close() returns the connection to the pool.
+
+The database runs in WAL mode so readers do not block the writer, and every
+connection waits on busy_timeout instead of failing with "database is locked".
+"""
+
+import queue
+import sqlite3
+import threading
+
+from flask import g, has_app_context
+
+
+# Connection tuning (applied to every pooled connection)
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 8192  # page cache per connection
+POOL_SIZE = 8  # idle connections kept open
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool."""
+
+    pool = None
+    in_app_context = False
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        elif not self.in_app_context:
+            self.pool.release(self)
+        # Connections held by an app context are released on teardown
+
+    def discard(self):
+        """Really close the underlying connection."""
+        super().close()
+
+
+class ConnectionPool:
+    """Thread-safe pool of SQLite connections to one database file."""
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+        # journal_mode is stored in the database file, so it only needs setting once
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        self.release(conn)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000,
+                               factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KB}')
+        conn.pool = self
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def acquire(self):
+        """Take an idle connection, or open a new one if none is free."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+        with self._lock:
+            self.reused += 1
+        return conn
+
+    def release(self, conn):
+        """Return a connection; uncommitted work is rolled back."""
+        conn.in_app_context = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (queue.Full, sqlite3.Error):
+            conn.discard()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().discard()
+            except queue.Empty:
+                return
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'idle': self._idle.qsize(),
+            'size': self.size,
+            'created': self.created,
+            'reused': self.reused
+        }
+
+
+def get_connection(pool):
+    """Connection for the current app context (shared by the whole request), else a pooled one."""
+    if not has_app_context():
+        return pool.acquire()
+    conn = g.get('db_conn')
+    if conn is None:
+        conn = pool.acquire()
+        conn.in_app_context = True
+        g.db_conn = conn
+    return conn
+
+
+def init_app(app, pool):
+    """Release the app context's connection back to the pool on teardown."""
+    @app.teardown_appcontext
+    def release_db(exception=None):
+        conn = g.pop('db_conn', None)
+        if conn is not None:
+            pool.release(conn)
@@ -0,0 +1,295 @@
+"""
+Model feature definitions and the feature-engineering pipeline.
+
+Every scoring path builds its model input through feature_matrix(): the
+/survey/submit payloads (survey_features), /predict and /predict/batch records
+(predict_features) and the Google Fit quick check (google_fit_feature_matrix)
+only differ in how they turn their request format into columns.
+"""
+
+import numpy as np
+
+from survey_scoring import berlin_scores, numeric_column, stopbang_scores
+
+
+# Feature list (must match WakeUpCall_3Class5Fold_Pipeline.pkl training order)
+# Based on new model with 33 engineered features - 27 input features
+# Includes Age_Group, Depression, and individual STOP/BANG items
+FEATURES = [
+    'Age', 'Age_Group', 'Sex', 'Height', 'Weight', 'BMI', 'Neck_Circumference',
+    'Smokes', 'Alcohol', 'Snoring', 'Sleepiness',
+    'Epworth_Score', 'Berlin_Score',
+    'Hypertension', 'Diabetes', 'Depression',
+    'STOP_Snore', 'STOP_Tired', 'STOP_ObsApnea', 'STOP_Pressure',
+    'BANG_Age', 'BANG_BMI', 'BANG_Neck', 'BANG_Gender',
+    'STOPBANG'
+]
+
+# Columns to scale (numerical features) - pipeline handles scaling internally
+NUM_COLS = [
+    'Age', 'Height', 'Weight', 'BMI', 'Neck_Circumference', 'Epworth_Score', 'STOPBANG'
+]
+
+FEATURE_INDEX = {f: i for i, f in enumerate(FEATURES)}
+
+# Boolean inputs accepted by /predict-from-google-fit (all default to False)
+GOOGLE_FIT_FLAGS = [
+    'hypertension', 'diabetes', 'depression', 'smokes', 'alcohol',
+    'snores', 'feels_sleepy', 'observed_apnea'
+]
+
+
+# Measurements are floats; every other feature (age, codes, flags, scores) is a whole number.
+# The matrix itself is float64 throughout, as the model expects; feature_dict() restores the types.
+FLOAT_FEATURES = frozenset({'Height', 'Weight', 'BMI', 'Neck_Circumference'})
+
+# Values for features a record leaves out (the derived ones are filled in by feature_matrix)
+FEATURE_DEFAULTS = {
+    'Height': 170.0,
+    'Weight': 70.0,
+    'Depression': 0.0,
+    'STOP_ObsApnea': 0.0,
+}
+
+# Stand-ins used only to derive features when their source column is missing too
+DERIVATION_DEFAULTS = {
+    'Age': 30.0,
+    'Sex': 0.0,
+    'BMI': 25.0,
+    'Neck_Circumference': 35.0,
+}
+
+
+def _fill(values, fallback):
+    return np.where(np.isnan(values), fallback, values)
+
+
+def age_group(age):
+    """Age group model input (0: under 30, 1: 30-49, 2: 50+) for an array of ages"""
+    return np.where(age < 30, 0.0, np.where(age < 50, 1.0, 2.0))
+
+
+def bang_items(age, bmi, neck_circumference, sex):
+    """
+    The BANG half of STOP-BANG for arrays of inputs (sex 1=male), as 0/1 floats:
+    dict with BANG_Age, BANG_BMI, BANG_Neck, BANG_Gender
+    """
+    return {
+        'BANG_Age': (age > 50).astype(np.float64),
+        'BANG_BMI': (bmi > 35).astype(np.float64),
+        'BANG_Neck': (neck_circumference > 40).astype(np.float64),
+        'BANG_Gender': (sex == 1).astype(np.float64)
+    }
+
+
+def feature_matrix(columns, n):
+    """
+    Build the (n, len(FEATURES)) float64 model input in FEATURES order from a dict
+    of columns keyed by feature name (arrays of length n, or scalars), in one
+    vectorized pass. Missing columns and NaN entries count as not provided:
+    BMI (from height and weight), Age_Group, the BANG items and the STOP items
+    (from Snoring / Sleepiness / Hypertension) are derived, STOPBANG falls back
+    to a legacy STOPBANG_Total column, and FEATURE_DEFAULTS fill the rest where
+    they can. Anything still missing stays NaN (see missing_features).
+    """
+    def column(name):
+        # Scalars (including NaN for an absent column) broadcast on use
+        return np.asarray(columns.get(name, np.nan), dtype=np.float64)
+
+    height = _fill(column('Height'), FEATURE_DEFAULTS['Height'])
+    weight = _fill(column('Weight'), FEATURE_DEFAULTS['Weight'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        derived_bmi = np.where(height > 0, np.round(weight / (height / 100) ** 2, 1), np.nan)
+    bmi = _fill(column('BMI'), derived_bmi)
+    age = column('Age')
+
+    derived = {
+        'Age_Group': age_group(_fill(age, DERIVATION_DEFAULTS['Age'])),
+        'Height': height,
+        'Weight': weight,
+        'BMI': bmi,
+        'STOP_Snore': _fill(column('Snoring'), 0.0),
+        'STOP_Tired': _fill(column('Sleepiness'), 0.0),
+        'STOP_Pressure': _fill(column('Hypertension'), 0.0),
+        'STOPBANG': column('STOPBANG_Total'),
+        'Depression': FEATURE_DEFAULTS['Depression'],
+        'STOP_ObsApnea': FEATURE_DEFAULTS['STOP_ObsApnea'],
+    }
+    derived.update(bang_items(
+        _fill(age, DERIVATION_DEFAULTS['Age']),
+        _fill(bmi, DERIVATION_DEFAULTS['BMI']),
+        _fill(column('Neck_Circumference'), DERIVATION_DEFAULTS['Neck_Circumference']),
+        _fill(column('Sex'), DERIVATION_DEFAULTS['Sex'])
+    ))
+
+    X = np.empty((n, len(FEATURES)), dtype=np.float64)
+    for i, name in enumerate(FEATURES):
+        if name not in derived:
+            X[:, i] = column(name)
+        elif name in columns:
+            X[:, i] = _fill(column(name), derived[name])
+        else:
+            X[:, i] = derived[name]
+    return X
+
+
+def missing_features(X):
+    """Per row, the names of features left missing (NaN) by feature_matrix; {} if none"""
+    rows, cols = np.nonzero(np.isnan(X))
+    missing = {}
+    for row, col in zip(rows.tolist(), cols.tolist()):
+        missing.setdefault(row, []).append(FEATURES[col])
+    return missing
+
+
+def feature_dict(row):
+    """One feature matrix row as {feature: value}, with whole-number features as ints"""
+    return {
+        name: float(value) if name in FLOAT_FEATURES or not value.is_integer() else int(value)
+        for name, value in zip(FEATURES, row.tolist())
+    }
+
+
+def predict_features(records):
+    """
+    Feature matrix for /predict style records (dicts keyed by feature name, derived
+    features optional). Returns (X, errors): X has one row per record and errors
+    maps row index -> message for records that cannot be scored.
+    """
+    errors = {i: 'Record must be a JSON object' for i, r in enumerate(records) if not isinstance(r, dict)}
+    records = [r if isinstance(r, dict) else {} for r in records]
+    columns = {
+        name: numeric_column([r.get(name) for r in records], errors, message='All features must be numeric')
+        for name in FEATURES + ['STOPBANG_Total']
+        if any(name in r for r in records)
+    }
+    X = feature_matrix(columns, len(records))
+    for i, names in missing_features(X).items():
+        errors.setdefault(i, f'Missing required features: {names}')
+    return X, errors
+
+
+def survey_features(payloads):
+    """
+    Feature matrix for raw /survey/submit payloads (demographics, medical_history and
+    survey_responses sections; same defaults as the endpoint). The questionnaire
+    features are scored here: Epworth total, Berlin high risk (2+ positive
+    categories) and the STOP-BANG total.
+    """
+    n = len(payloads)
+    demo = [p.get('demographics', {}) for p in payloads]
+    medical = [p.get('medical_history', {}) for p in payloads]
+    surveys = [p.get('survey_responses', {}) for p in payloads]
+    berlin = [s.get('berlin_responses', {}) for s in surveys]
+    stopbang = [s.get('stopbang_responses', {}) for s in surveys]
+
+    def values(sections, key, default):
+        return np.fromiter((section.get(key, default) for section in sections), dtype=np.float64, count=n)
+
+    def flags(sections, key, default=False):
+        return np.fromiter((bool(section.get(key, default)) for section in sections), dtype=bool, count=n)
+
+    def positive_items(sections, key):
+        return np.fromiter((sum(1 for v in section.get(key, {}).values() if v) for section in sections),
+                           dtype=np.int64, count=n)
+
+    age = values(demo, 'age', 30)
+    sex = np.fromiter((d.get('sex', 'male').lower() == 'male' for d in demo), dtype=bool, count=n)
+    height = values(demo, 'height_cm', 170)
+    weight = values(demo, 'weight_kg', 70)
+    neck = values(demo, 'neck_circumference_cm', 37)
+    hypertension = flags(medical, 'hypertension')
+    bmi = weight / (height / 100) ** 2
+
+    ess = np.fromiter((sum(s.get('ess_responses', [1] * 8)) for s in surveys), dtype=np.float64, count=n)
+    _, berlin_high = berlin_scores(positive_items(berlin, 'category1'), positive_items(berlin, 'category2'),
+                                   flags(berlin, 'category3_sleepy'), bmi)
+    snoring = flags(stopbang, 'snoring')
+    tired = flags(stopbang, 'tired')
+    observed = flags(stopbang, 'observed_apnea')
+    pressure = np.fromiter((bool(sb.get('hypertension', h)) for sb, h in zip(stopbang, hypertension.tolist())),
+                           dtype=bool, count=n)
+    stopbang_total, _ = stopbang_scores(snoring, tired, observed, pressure, age, neck, bmi, sex)
+
+    return feature_matrix({
+        'Age': age,
+        'Sex': sex,
+        'Height': height,
+        'Weight': weight,
+        'Neck_Circumference': neck,
+        'Smokes': flags(medical, 'smokes'),
+        'Alcohol': flags(medical, 'alcohol'),
+        'Snoring': snoring,
+        'Sleepiness': ess > 10,
+        'Epworth_Score': ess,
+        'Berlin_Score': berlin_high,
+        'Hypertension': hypertension,
+        'Diabetes': flags(medical, 'diabetes'),
+        'Depression': flags(medical, 'depression'),
+        'STOP_Snore': snoring,
+        'STOP_Tired': tired,
+        'STOP_ObsApnea': observed,
+        'STOP_Pressure': pressure,
+        **bang_items(age, bmi, neck, sex),
+        'STOPBANG': stopbang_total,
+    }, n)
+
+
+def google_fit_feature_matrix(age, sex, height_cm, weight_kg, neck_cm,
+                              hypertension, diabetes, depression, smokes, alcohol,
+                              snores, feels_sleepy, observed_apnea):
+    """
+    Build the model feature matrix (FEATURES order) for Google Fit quick-check inputs.
+    Every argument is a scalar or array (broadcast together); sex is 1=male, 0=female
+    and the flags are truthy/falsy. Epworth and Berlin scores are estimated from the
+    snoring/sleepiness flags, as the quick check does not ask the full questionnaires.
+    """
+    age, sex, height_cm, weight_kg, neck_cm = np.broadcast_arrays(
+        *(np.asarray(v, dtype=np.float64) for v in (age, sex, height_cm, weight_kg, neck_cm)))
+    flags = {
+        name: np.broadcast_to(np.asarray(v, dtype=bool), age.shape).ravel().astype(np.float64)
+        for name, v in zip(GOOGLE_FIT_FLAGS, (hypertension, diabetes, depression, smokes, alcohol,
+                                              snores, feels_sleepy, observed_apnea))
+    }
+    age, sex, height_cm, weight_kg, neck_cm = (a.ravel() for a in (age, sex, height_cm, weight_kg, neck_cm))
+
+    bmi = weight_kg / (height_cm / 100) ** 2
+    bang = bang_items(age, bmi, neck_cm, sex)
+    snore = flags['snores']
+    tired = flags['feels_sleepy']
+
+    return feature_matrix({
+        'Age': age,
+        'Sex': sex,
+        'Height': height_cm,
+        'Weight': weight_kg,
+        'BMI': np.round(bmi, 1),
+        'Neck_Circumference': neck_cm,
+        'Smokes': flags['smokes'],
+        'Alcohol': flags['alcohol'],
+        'Snoring': snore,
+        'Sleepiness': tired,
+        'Epworth_Score': np.where(tired == 1, 12.0, 6.0),
+        'Berlin_Score': snore * tired,
+        'Hypertension': flags['hypertension'],
+        'Diabetes': flags['diabetes'],
+        'Depression': flags['depression'],
+        'STOP_ObsApnea': flags['observed_apnea'],
+        **bang,
+        'STOPBANG': snore + tired + flags['observed_apnea'] + flags['hypertension'] + sum(bang.values()),
+    }, age.size)
+
+
+def google_fit_features(data):
+    """
+    Feature vector (FEATURES order) for one /predict-from-google-fit request body.
+    Raises KeyError for missing required fields.
+    """
+    return google_fit_feature_matrix(
+        data['age'],
+        1 if data['sex'].lower() == 'male' else 0,
+        data['height_cm'],
+        data['weight_kg'],
+        data['neck_circumference_cm'],
+        *(data.get(flag, False) for flag in GOOGLE_FIT_FLAGS)
+    )[0]
@@ -0,0 +1,30 @@
+"""
+Gunicorn settings for the WakeUp Call API.
+
+Usage (from the backend directory; Linux/macOS, `pip install gunicorn`):
+    gunicorn app:app
+
+The app is imported once in the master (preload_app) and the model is loaded
+there in pre_fork, before the first worker starts. Workers inherit the loaded
+model copy-on-write instead of each unpickling their own, and importing app
+itself stays light (see get_model() in app.py).
+"""
+
+import gc
+import os
+
+bind = os.environ.get('WAKEUPCALL_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WAKEUPCALL_WORKERS', '4'))
+threads = int(os.environ.get('WAKEUPCALL_THREADS', '4'))
+preload_app = True
+
+
+def pre_fork(server, worker):
+    import app
+
+    if app.get_model() is None:
+        server.log.warning("Model not loaded; prediction endpoints will return errors")
+    # SQLite connections must not cross fork(); workers open their own
+    app.db_pool.close_all()
+    # Keep the garbage collector from touching (and so copying) the inherited heap
+    gc.freeze()
@@ -0,0 +1,260 @@
+"""
+Precomputed lookup table for /predict-from-google-fit.
+
+The Google Fit quick check only has five continuous inputs (age, sex, height, weight,
+neck) plus eight yes/no answers; Epworth and Berlin are estimated from the flags.
+This module bins the continuous inputs at clinically meaningful resolution, scores
+every cell of that reduced input space once with the model, and stores the class
+probabilities as a float16 .npy file that the server memory-maps. A request is then
+answered with an index computation instead of a model call.
+
+Bin edges are right-closed and sit exactly on the thresholds of the discrete features:
+BANG_Age (> 50), BANG_BMI (> 35) and BANG_Neck (> 40) at the edge itself, and Age_Group
+(age < 30, age < 50) at the largest float below 30 and 50, so 30 and 50 start new bins.
+Every value in a bin, fractional ages included, therefore derives the same discrete
+features as the bin's representative value; only the continuous inputs are rounded.
+
+The table is tied to the model version it was built from; the build also scores a
+random sample of realistic inputs (to one decimal place) both ways and records the
+maximum probability deviation, the class mismatch rate and the rate of samples whose
+discrete features differ from their cell's (expected to be 0) in the metadata file.
+
+Usage:
+    python lookup_table.py build [--model lightgbm_sleep_apnea_model.pkl] [--out google_fit_table.npy]
+    python lookup_table.py info [--out google_fit_table.npy]
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+from features import FEATURES, FLOAT_FEATURES, GOOGLE_FIT_FLAGS, google_fit_feature_matrix
+
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TABLE_PATH = os.path.join(BACKEND_DIR, 'google_fit_table.npy')
+
+TABLE_FORMAT_VERSION = 1
+
+
+def _below(x):
+    """Largest float below x: as a right-closed edge it puts x itself in the next bin."""
+    return float(np.nextafter(x, -np.inf))
+
+
+# Continuous axes: right-closed bin edges and the value each bin is scored at
+AXES = {
+    'age': {
+        'edges': [24, _below(30), 34, 39, 44, _below(50), 50, 55, 60, 65, 70],
+        'values': [21, 27, 32, 37, 42, 47, 50, 53, 58, 63, 68, 75],
+    },
+    'height_cm': {
+        'edges': [150, 160, 170, 180, 190],
+        'values': [145, 155, 165, 175, 185, 195],
+    },
+    # Weight is binned through BMI, which is what the risk thresholds are defined on
+    'bmi': {
+        'edges': [18.5, 22, 25, 27.5, 30, 32.5, 35, 37.5, 40, 45],
+        'values': [17, 20.3, 23.5, 26.3, 28.8, 31.3, 33.8, 36.3, 38.8, 42.5, 48],
+    },
+    'neck_cm': {
+        'edges': [32, 34, 36, 38, 40, 42, 44],
+        'values': [31, 33, 35, 37, 39, 41, 43, 45],
+    },
+}
+
+# Realistic ranges for the deviation sample
+SAMPLE_RANGES = {
+    'age': (18, 85),
+    'height_cm': (145, 200),
+    'weight_kg': (40, 150),
+    'neck_cm': (28, 50),
+}
+
+# Model inputs that take one value per bin (everything but the continuous inputs)
+DISCRETE_FEATURES = [i for i, f in enumerate(FEATURES) if f not in FLOAT_FEATURES and f != 'Age']
+
+BUILD_CHUNK = 50000
+
+
+def flags_mask(data):
+    """Bitmask of the Google Fit yes/no answers (bit i = GOOGLE_FIT_FLAGS[i])."""
+    mask = 0
+    for bit, flag in enumerate(GOOGLE_FIT_FLAGS):
+        if data.get(flag, False):
+            mask |= 1 << bit
+    return mask
+
+
+def _bin(axis, x):
+    return np.searchsorted(np.asarray(AXES[axis]['edges'], dtype=np.float64), x, side='left')
+
+
+def table_shape():
+    """(sex, flags, age, height, bmi, neck) cells; probabilities are the trailing axis."""
+    return (2, 1 << len(GOOGLE_FIT_FLAGS)) + tuple(len(AXES[a]['values']) for a in AXES)
+
+
+class GoogleFitLookupTable:
+    """Memory-mapped class probabilities over the binned Google Fit input space."""
+
+    def __init__(self, table, meta):
+        self.table = table
+        self.meta = meta
+        self.model_version = meta['model_version']
+
+    @classmethod
+    def load(cls, path=DEFAULT_TABLE_PATH, model_version=None):
+        """
+        Open a built table. Raises ValueError if it was built for a different
+        model version or table format, OSError if the files are missing.
+        """
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        if meta.get('format_version') != TABLE_FORMAT_VERSION or meta.get('axes') != AXES:
+            raise ValueError('lookup table was built with a different layout, rebuild it')
+        if model_version is not None and meta.get('model_version') != model_version:
+            raise ValueError(
+                f"lookup table was built for model {meta.get('model_version')}, loaded model is {model_version}")
+        table = np.load(path, mmap_mode='r')
+        if table.shape[:-1] != table_shape():
+            raise ValueError(f'lookup table has unexpected shape {table.shape}')
+        return cls(table, meta)
+
+    def index(self, age, sex, height_cm, weight_kg, neck_cm, mask):
+        """Table index for scalar or array inputs (sex 1=male, 0=female)."""
+        age, height_cm, weight_kg, neck_cm = (np.asarray(v, dtype=np.float64)
+                                              for v in (age, height_cm, weight_kg, neck_cm))
+        bmi = weight_kg / (height_cm / 100) ** 2
+        return (np.asarray(sex, dtype=np.intp), np.asarray(mask, dtype=np.intp),
+                _bin('age', age), _bin('height_cm', height_cm), _bin('bmi', bmi), _bin('neck_cm', neck_cm))
+
+    def lookup(self, age, sex, height_cm, weight_kg, neck_cm, mask):
+        """Class probabilities for one input (float64 array)."""
+        idx = tuple(int(i) for i in self.index(age, sex, height_cm, weight_kg, neck_cm, mask))
+        return self.table[idx].astype(np.float64)
+
+    def lookup_many(self, age, sex, height_cm, weight_kg, neck_cm, mask):
+        """Class probabilities for arrays of inputs, shape (n, n_classes)."""
+        return self.table[self.index(age, sex, height_cm, weight_kg, neck_cm, mask)].astype(np.float64)
+
+    def info(self):
+        """Build metadata for /metrics."""
+        return {
+            'model_version': self.model_version,
+            'built_at': self.meta.get('built_at'),
+            'cells': int(np.prod(self.table.shape[:-1])),
+            'max_deviation': self.meta.get('max_deviation'),
+            'class_mismatch_rate': self.meta.get('class_mismatch_rate'),
+            'feature_mismatch_rate': self.meta.get('feature_mismatch_rate'),
+            'sample_size': self.meta.get('sample_size'),
+        }
+
+
+def _grid_chunks(shape):
+    """Yield (start, feature matrix) for every table cell in C order."""
+    sex, flags, age, height, bmi, neck = (np.asarray(v) for v in (
+        [0, 1], np.arange(shape[1]),
+        AXES['age']['values'], AXES['height_cm']['values'], AXES['bmi']['values'], AXES['neck_cm']['values']))
+    n = int(np.prod(shape))
+    for start in range(0, n, BUILD_CHUNK):
+        i_sex, i_flags, i_age, i_height, i_bmi, i_neck = np.unravel_index(
+            np.arange(start, min(start + BUILD_CHUNK, n)), shape)
+        h = height[i_height].astype(np.float64)
+        m = flags[i_flags]
+        bits = [(m >> b) & 1 for b in range(len(GOOGLE_FIT_FLAGS))]
+        yield start, google_fit_feature_matrix(
+            age[i_age], sex[i_sex], h, bmi[i_bmi] * (h / 100) ** 2, neck[i_neck], *bits)
+
+
+def evaluate(table, scorer, n=20000, seed=0):
+    """Score n random realistic inputs with the model and the table; return deviation stats."""
+    rng = np.random.default_rng(seed)
+    age, height, weight, neck = (rng.uniform(*SAMPLE_RANGES[axis], size=n).round(1)
+                                 for axis in ('age', 'height_cm', 'weight_kg', 'neck_cm'))
+    sex = rng.integers(0, 2, size=n)
+    mask = rng.integers(0, 1 << len(GOOGLE_FIT_FLAGS), size=n)
+    bits = [(mask >> b) & 1 for b in range(len(GOOGLE_FIT_FLAGS))]
+
+    X = google_fit_feature_matrix(age, sex, height, weight, neck, *bits)
+    exact = scorer.predict_proba(X)
+    approx = table.lookup_many(age, sex, height, weight, neck, mask)
+
+    # The features the table scored each sample's cell with
+    _, _, i_age, i_height, i_bmi, i_neck = table.index(age, sex, height, weight, neck, mask)
+    cell_height = np.asarray(AXES['height_cm']['values'], dtype=np.float64)[i_height]
+    cell_bmi = np.asarray(AXES['bmi']['values'], dtype=np.float64)[i_bmi]
+    X_cell = google_fit_feature_matrix(
+        np.asarray(AXES['age']['values'])[i_age], sex, cell_height, cell_bmi * (cell_height / 100) ** 2,
+        np.asarray(AXES['neck_cm']['values'])[i_neck], *bits)
+    feature_mismatch = (X[:, DISCRETE_FEATURES] != X_cell[:, DISCRETE_FEATURES]).any(axis=1)
+
+    return {
+        'max_deviation': round(float(np.abs(exact - approx).max()), 4),
+        'mean_deviation': round(float(np.abs(exact - approx).mean()), 4),
+        'class_mismatch_rate': round(float(np.mean(exact.argmax(axis=1) != approx.argmax(axis=1))), 4),
+        'feature_mismatch_rate': round(float(feature_mismatch.mean()), 4),
+        'sample_size': n,
+    }
+
+
+def build(scorer, model_version, path=DEFAULT_TABLE_PATH):
+    """Score every cell with `scorer` and write the table plus its metadata file."""
+    shape = table_shape()
+    n_classes = len(scorer.class_labels)
+    tmp_path = path + '.tmp.npy'
+    out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float16, shape=shape + (n_classes,))
+    flat = out.reshape(-1, n_classes)
+    for start, X in _grid_chunks(shape):
+        flat[start:start + len(X)] = scorer.predict_proba(X)
+    out.flush()
+    del flat, out
+    os.replace(tmp_path, path)
+
+    meta = {
+        'format_version': TABLE_FORMAT_VERSION,
+        'model_version': model_version,
+        'built_at': datetime.now().isoformat(),
+        'flags': GOOGLE_FIT_FLAGS,
+        'axes': AXES,
+    }
+    table = GoogleFitLookupTable(np.load(path, mmap_mode='r'), meta)
+    meta.update(evaluate(table, scorer))
+    with open(path + '.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+    table.meta = meta
+    return table
+
+
+def main():
+    from scoring import ModelScorer, file_fingerprint, load_model_file
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('build', help='score every cell and write the table')
+    p.add_argument('--model', default=os.path.join(BACKEND_DIR, 'lightgbm_sleep_apnea_model.pkl'))
+    p.add_argument('--out', default=DEFAULT_TABLE_PATH)
+    p = sub.add_parser('info', help='print the metadata of a built table')
+    p.add_argument('--out', default=DEFAULT_TABLE_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        print(json.dumps(GoogleFitLookupTable.load(args.out).info(), indent=2))
+        return
+
+    scorer = ModelScorer(load_model_file(args.model), FEATURES)
+    start = time.perf_counter()
+    table = build(scorer, file_fingerprint(args.model), args.out)
+    print(f"✅ Built {table.info()['cells']} cells in {time.perf_counter() - start:.1f}s -> {args.out}")
+    print(f"   max deviation {table.meta['max_deviation']}, mean {table.meta['mean_deviation']}, "
+          f"class mismatch rate {table.meta['class_mismatch_rate']}, "
+          f"discrete feature mismatch rate {table.meta['feature_mismatch_rate']} "
+          f"({table.meta['sample_size']} samples)")
+
+
+if __name__ == '__main__':
+    main()
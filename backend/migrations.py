@@ -0,0 +1,308 @@
+"""
+Versioned schema migrations.
+
+Each migration has a version number and is written to be idempotent (CREATE ... IF
+NOT EXISTS, add a column only if it is missing) so databases created by older
+releases - including ones patched by hand with ALTER TABLE - converge on the same
+schema. Pending migrations run in order inside a single BEGIN IMMEDIATE
+transaction; applied versions are recorded in schema_version. When the database
+is already current, startup costs one indexed read.
+
+Usage:
+    python migrations.py [--db wakeup_call.db] [--dry-run]
+    python migrations.py status [--db wakeup_call.db]
+"""
+
+import argparse
+import json
+import sqlite3
+import time
+
+from token_cache import init_revocations
+
+
+SCHEMA_VERSION_TABLE = '''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+def table_columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def add_missing_columns(conn, table, columns):
+    """ALTER TABLE ADD COLUMN for each (name, definition) not already present."""
+    existing = table_columns(conn, table)
+    for name, definition in columns:
+        if name not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+
+
+def m001_base_tables(conn):
+    """users, auth_tokens and user_surveys as created by the original init_db."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            first_name TEXT NOT NULL,
+            last_name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS auth_tokens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            token TEXT UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_surveys (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            ess_score INTEGER,
+            berlin_score INTEGER,
+            stopbang_score INTEGER,
+            osa_probability REAL,
+            risk_level TEXT,
+            completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+
+def m002_survey_demographics(conn):
+    """Demographics, medical history and Google Fit columns on user_surveys."""
+    add_missing_columns(conn, 'user_surveys', [
+        ('age', 'INTEGER'),
+        ('sex', 'TEXT'),
+        ('height_cm', 'REAL'),
+        ('weight_kg', 'REAL'),
+        ('neck_circumference_cm', 'REAL'),
+        ('bmi', 'REAL'),
+        ('hypertension', 'INTEGER'),
+        ('diabetes', 'INTEGER'),
+        ('depression', 'INTEGER DEFAULT 0'),
+        ('smokes', 'INTEGER'),
+        ('alcohol', 'INTEGER'),
+        ('daily_steps', 'INTEGER DEFAULT 5000'),
+        ('average_daily_steps', 'INTEGER DEFAULT 5000'),
+        ('sleep_duration_hours', 'REAL DEFAULT 7.0'),
+        ('weekly_steps_json', "TEXT DEFAULT '{}'"),
+        ('weekly_sleep_json', "TEXT DEFAULT '{}'"),
+    ])
+
+
+def m003_survey_responses(conn):
+    """Individual questionnaire answers written by submit_survey."""
+    add_missing_columns(conn, 'user_surveys', [
+        ('snoring_level', 'TEXT'),
+        ('snoring_frequency', 'TEXT'),
+        ('snoring_bothers_others', 'INTEGER DEFAULT 0'),
+        ('sleep_quality_rating', 'INTEGER'),
+        ('tired_during_day', 'TEXT'),
+        ('tired_after_sleep', 'TEXT'),
+        ('feels_sleepy_daytime', 'INTEGER DEFAULT 0'),
+        ('nodded_off_driving', 'INTEGER DEFAULT 0'),
+        ('physical_activity_time', 'TEXT'),
+        ('ess_sitting_reading', 'INTEGER'),
+        ('ess_watching_tv', 'INTEGER'),
+        ('ess_public_sitting', 'INTEGER'),
+        ('ess_passenger_car', 'INTEGER'),
+        ('ess_lying_down_afternoon', 'INTEGER'),
+        ('ess_talking', 'INTEGER'),
+        ('ess_after_lunch', 'INTEGER'),
+        ('ess_traffic_stop', 'INTEGER'),
+    ])
+
+
+def m004_auth_revocations(conn):
+    """Revocation generation counter for the token cache."""
+    init_revocations(conn)
+
+
+def m005_indexes(conn):
+    """Secondary indexes for the auth and latest-survey lookups."""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_user_surveys_user_completed '
+                 'ON user_surveys (user_id, completed_at DESC)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_auth_tokens_token_expires ON auth_tokens (token, expires_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_auth_tokens_user ON auth_tokens (user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_auth_tokens_expires ON auth_tokens (expires_at)')
+
+
+def m006_survey_history(conn):
+    """
+    user_surveys (one row per user, overwritten) becomes the append-only
+    survey_history, plus a latest_surveys pointer (user_id -> newest survey id).
+    """
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if 'user_surveys' in tables and 'survey_history' not in tables:
+        conn.execute('ALTER TABLE user_surveys RENAME TO survey_history')
+    conn.execute('DROP INDEX IF EXISTS idx_user_surveys_user_completed')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_survey_history_user ON survey_history (user_id, id)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS latest_surveys (
+            user_id INTEGER PRIMARY KEY,
+            survey_id INTEGER NOT NULL,
+            completed_at TIMESTAMP,
+            FOREIGN KEY (survey_id) REFERENCES survey_history (id)
+        )
+    ''')
+    conn.execute('''
+        INSERT OR REPLACE INTO latest_surveys (user_id, survey_id, completed_at)
+        SELECT user_id, id, completed_at FROM survey_history
+        WHERE id IN (SELECT MAX(id) FROM survey_history GROUP BY user_id)
+    ''')
+
+
+def m007_daily_metrics(conn):
+    """daily_metrics table, backfilled from the weekly_*_json blobs on survey_history."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_metrics (
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            steps INTEGER,
+            sleep_hours REAL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, date)
+        ) WITHOUT ROWID
+    ''')
+    upsert = '''
+        INSERT INTO daily_metrics (user_id, date, steps, sleep_hours) VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id, date) DO UPDATE SET
+            steps = COALESCE(excluded.steps, daily_metrics.steps),
+            sleep_hours = COALESCE(excluded.sleep_hours, daily_metrics.sleep_hours)
+    '''
+    # Oldest survey first so newer blobs win
+    surveys = conn.execute('''
+        SELECT user_id, weekly_steps_json, weekly_sleep_json FROM survey_history ORDER BY id
+    ''').fetchall()
+    for user_id, steps_json, sleep_json in surveys:
+        merged = {}
+        for index, blob in ((0, steps_json), (1, sleep_json)):
+            try:
+                by_date = json.loads(blob) if blob else {}
+            except ValueError:
+                continue
+            for day, value in (by_date.items() if isinstance(by_date, dict) else ()):
+                if value is not None and len(str(day)) >= 10:
+                    merged.setdefault(str(day)[:10], [None, None])[index] = value
+        conn.executemany(upsert, [(user_id, day, v[0], v[1]) for day, v in merged.items()])
+
+
+def m008_metric_rollups(conn):
+    """Per-user running step/sleep totals for /metrics/sync, seeded from daily_metrics."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS metric_rollups (
+            user_id INTEGER PRIMARY KEY,
+            steps_sum INTEGER NOT NULL DEFAULT 0,
+            steps_days INTEGER NOT NULL DEFAULT 0,
+            sleep_sum REAL NOT NULL DEFAULT 0,
+            sleep_days INTEGER NOT NULL DEFAULT 0,
+            latest_date TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        INSERT OR REPLACE INTO metric_rollups (user_id, steps_sum, steps_days, sleep_sum, sleep_days, latest_date)
+        SELECT user_id, COALESCE(SUM(steps), 0), COUNT(steps), COALESCE(SUM(sleep_hours), 0), COUNT(sleep_hours),
+               MAX(date)
+        FROM daily_metrics
+        GROUP BY user_id
+    ''')
+
+
+def m009_derived_outputs(conn):
+    """Stored recommendation/risk-factor outputs per survey (see survey_outputs.py); filled lazily on read."""
+    add_missing_columns(conn, 'survey_history', [
+        ('derived_version', 'INTEGER'),
+        ('derived_json', 'TEXT'),
+    ])
+
+
+# Ordered (version, function); never renumber or edit a released migration, add a new one
+MIGRATIONS = [
+    (1, m001_base_tables),
+    (2, m002_survey_demographics),
+    (3, m003_survey_responses),
+    (4, m004_auth_revocations),
+    (5, m005_indexes),
+    (6, m006_survey_history),
+    (7, m007_daily_metrics),
+    (8, m008_metric_rollups),
+    (9, m009_derived_outputs),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    conn.execute(SCHEMA_VERSION_TABLE)
+    return conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] or 0
+
+
+def pending_migrations(conn):
+    version = current_version(conn)
+    return [(v, fn) for v, fn in MIGRATIONS if v > version]
+
+
+def migrate(conn, dry_run=False):
+    """
+    Apply pending migrations in one transaction. Returns the list of
+    (version, name) applied - or, with dry_run, that would be applied; a dry
+    run executes them and rolls back, so errors still surface.
+    """
+    if current_version(conn) >= LATEST_VERSION:
+        return []
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Re-read under the write lock: another worker may have migrated meanwhile
+        pending = pending_migrations(conn)
+        for version, fn in pending:
+            fn(conn)
+            conn.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)', (version, fn.__name__))
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return [(v, fn.__name__) for v, fn in pending]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', nargs='?', choices=['migrate', 'status'], default='migrate')
+    parser.add_argument('--db', default='wakeup_call.db')
+    parser.add_argument('--dry-run', action='store_true', help='run pending migrations, then roll back')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if args.command == 'status':
+        print(f"Schema version {current_version(conn)} (latest {LATEST_VERSION})")
+        for v, fn in pending_migrations(conn):
+            print(f"   pending: {v:03d} {fn.__name__}")
+        return
+
+    start = time.perf_counter()
+    applied = migrate(conn, dry_run=args.dry_run)
+    elapsed = (time.perf_counter() - start) * 1000
+    verb = 'Would apply' if args.dry_run else 'Applied'
+    for v, name in applied:
+        print(f"   {verb.lower()}: {v:03d} {name}")
+    print(f"✅ {verb} {len(applied)} migration(s) in {elapsed:.1f} ms; schema version "
+          f"{current_version(conn)} (latest {LATEST_VERSION})")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,42 @@
+from reportlab import rl_config
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, Flowable
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_LEFT, TA_CENTER
 from typing import Dict
 from io import BytesIO
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')
+import threading
 
-class WakeUpCallPDFGenerator:
+# Page and image streams are Flate-compressed only, without the ASCII85 text
+# encoding on top: without ReportLab's C accelerators that encoding runs in pure
+# Python and was ~10% of a render, and it makes the streams 25% larger.
+rl_config.useA85 = 0
+
+
+class ReportTemplate:
     """
-    Generate Sleep Apnea Report PDF with consistent layout/design
-    Only values change, design stays the same
+    The patient-independent part of the report, built once per process:
+    paragraph styles and table styles. Read-only after construction, so one
+    instance is shared by all renders.
     """
     
+    TITLE = "Sleep Apnea Risk Assessment – Detailed Report by<br/>WakeUpCall"
+    SUBTITLE = (
+        "This detailed report includes patient information, STOP-BANG scoring, Epworth Sleepiness Scale, risk<br/>"
+        "assessment, lifestyle factors, medical history, and SHAP model explanation for physician review."
+    )
+    SHAP_EXPLANATION = (
+        "SHAP values help quantify how much each feature contributed to the final sleep apnea risk prediction. "
+        "Positive values increase risk, while lower values have less influence."
+    )
+    NO_RECOMMENDATIONS = "No specific recommendations available at this time."
+    
     def __init__(self):
         self.styles = getSampleStyleSheet()
         self._setup_custom_styles()
+        self._setup_table_styles()
     
     def _setup_custom_styles(self):
         """Define custom styles for the report"""
@@ -60,6 +78,113 @@ class WakeUpCallPDFGenerator:
             textColor=colors.HexColor('#c0392b'),
             fontName='Helvetica-Bold'
         ))
+        
+        # Recommendation source line
+        self.styles.add(ParagraphStyle(
+            name='SourceStyle',
+            parent=self.styles['Normal'],
+            fontSize=8,
+            textColor=colors.HexColor('#666666'),
+            leftIndent=12
+        ))
+    
+    def _setup_table_styles(self):
+        """Fixed table styles; the assessment table has one variant per risk colour"""
+        assessment_base = [
+            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTNAME', (1, 0), (1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('BOX', (0, 0), (-1, -1), 1, colors.black),
+        ]
+        self.assessment_table_style = {
+            high_risk: TableStyle(assessment_base + [
+                ('TEXTCOLOR', (1, 0), (1, 0), colors.HexColor('#c0392b') if high_risk else colors.black)
+            ])
+            for high_risk in (True, False)
+        }
+        
+        self.patient_table_style = TableStyle([
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('BOX', (0, 0), (-1, -1), 1, colors.black),
+        ])
+        
+        self.stop_bang_table_style = TableStyle([
+            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+            ('ALIGN', (1, 0), (1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+            ('GRID', (0, 0), (-1, -2), 0.5, colors.grey),
+            ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
+        ])
+        
+        self.ess_table_style = TableStyle([
+            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica'),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('BOX', (0, 0), (-1, -1), 1, colors.black),
+            ('LINEABOVE', (0, -1), (-1, -1), 2, colors.black),
+        ])
+        
+        self.lifestyle_table_style = TableStyle([
+            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('BOX', (0, 0), (-1, -1), 1, colors.black),
+        ])
+
+
+_shared_template = None
+_shared_generator = None
+_shared_lock = threading.Lock()
+
+
+def get_template():
+    """The process-wide ReportTemplate"""
+    global _shared_template
+    if _shared_template is None:
+        with _shared_lock:
+            if _shared_template is None:
+                _shared_template = ReportTemplate()
+    return _shared_template
+
+
+def get_generator():
+    """The process-wide WakeUpCallPDFGenerator (safe to use from several threads)"""
+    global _shared_generator
+    if _shared_generator is None:
+        template = get_template()
+        with _shared_lock:
+            if _shared_generator is None:
+                _shared_generator = WakeUpCallPDFGenerator(template)
+    return _shared_generator
+
+
+class WakeUpCallPDFGenerator:
+    """
+    Generate Sleep Apnea Report PDF with consistent layout/design
+    Only values change, design stays the same
+    """
+    
+    def __init__(self, template: ReportTemplate = None):
+        self.template = template or get_template()
+        self.styles = self.template.styles
     
     def generate_pdf(self, data: Dict, output_path: str = None) -> BytesIO:
         """
@@ -68,10 +193,12 @@ class WakeUpCallPDFGenerator:
         Args:
             data: Dictionary containing all report data
             output_path: Optional file path to save PDF. If None, returns BytesIO
-            
+        
         Returns:
             BytesIO object containing the PDF
         """
+        template = self.template
+        
         # Create PDF buffer
         buffer = BytesIO()
         doc = SimpleDocTemplate(
@@ -87,16 +214,8 @@ class WakeUpCallPDFGenerator:
         story = []
         
         # HEADER
-        story.append(Paragraph(
-            "Sleep Apnea Risk Assessment – Detailed Report by<br/>WakeUpCall",
-            self.styles['ReportTitle']
-        ))
-        
-        story.append(Paragraph(
-            "This detailed report includes patient information, STOP-BANG scoring, Epworth Sleepiness Scale, risk<br/>"
-            "assessment, lifestyle factors, medical history, and SHAP model explanation for physician review.",
-            self.styles['Subtitle']
-        ))
+        story.append(Paragraph(template.TITLE, self.styles['ReportTitle']))
+        story.append(Paragraph(template.SUBTITLE, self.styles['Subtitle']))
         
         # ASSESSMENT RESULT SECTION
         story.append(Paragraph("Assessment Result", self.styles['SectionHeader']))
@@ -111,17 +230,7 @@ class WakeUpCallPDFGenerator:
         ]
         
         assessment_table = Table(assessment_data, colWidths=[2*inch, 4*inch])
-        assessment_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTNAME', (1, 0), (1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('TEXTCOLOR', (1, 0), (1, 0), colors.HexColor('#c0392b') if 'HIGH' in risk_level.upper() else colors.black),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('BOX', (0, 0), (-1, -1), 1, colors.black),
-        ]))
+        assessment_table.setStyle(template.assessment_table_style['HIGH' in risk_level.upper()])
         
         story.append(assessment_table)
         story.append(Spacer(1, 0.2*inch))
@@ -141,14 +250,7 @@ class WakeUpCallPDFGenerator:
         ]
         
         patient_table = Table(patient_data, colWidths=[2*inch, 4*inch])
-        patient_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('BOX', (0, 0), (-1, -1), 1, colors.black),
-        ]))
+        patient_table.setStyle(template.patient_table_style)
         
         story.append(patient_table)
         story.append(Spacer(1, 0.2*inch))
@@ -179,16 +281,7 @@ class WakeUpCallPDFGenerator:
         ]
         
         stop_bang_table = Table(stop_bang_data, colWidths=[2.5*inch, 3.5*inch])
-        stop_bang_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-            ('GRID', (0, 0), (-1, -2), 0.5, colors.grey),
-            ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
-        ]))
+        stop_bang_table.setStyle(template.stop_bang_table_style)
         
         story.append(stop_bang_table)
         story.append(Spacer(1, 0.2*inch))
@@ -219,17 +312,7 @@ class WakeUpCallPDFGenerator:
         ]
         
         ess_table = Table(ess_data, colWidths=[2.5*inch, 3.5*inch])
-        ess_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica'),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('BOX', (0, 0), (-1, -1), 1, colors.black),
-            ('LINEABOVE', (0, -1), (-1, -1), 2, colors.black),
-        ]))
+        ess_table.setStyle(template.ess_table_style)
         
         story.append(ess_table)
         story.append(Spacer(1, 0.2*inch))
@@ -248,15 +331,7 @@ class WakeUpCallPDFGenerator:
         ]
         
         lifestyle_table = Table(lifestyle_data, colWidths=[2.5*inch, 3.5*inch])
-        lifestyle_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('BOX', (0, 0), (-1, -1), 1, colors.black),
-        ]))
+        lifestyle_table.setStyle(template.lifestyle_table_style)
         
         story.append(lifestyle_table)
         story.append(Spacer(1, 0.2*inch))
@@ -289,52 +364,32 @@ class WakeUpCallPDFGenerator:
                     source = ""
                 
                 # Add recommendation with proper formatting
-                story.append(Paragraph(
-                    f"<b>{i}. {title}</b>",
-                    self.styles['Normal']
-                ))
+                story.append(Paragraph(f"<b>{i}. {title}</b>", self.styles['Normal']))
                 
                 if description:
-                    story.append(Paragraph(
-                        description,
-                        self.styles['Normal']
-                    ))
+                    story.append(Paragraph(description, self.styles['Normal']))
                 
                 if source:
-                    story.append(Paragraph(
-                        f"<i>Source: {source}</i>",
-                        ParagraphStyle(
-                            name='SourceStyle',
-                            parent=self.styles['Normal'],
-                            fontSize=8,
-                            textColor=colors.HexColor('#666666'),
-                            leftIndent=12
-                        )
-                    ))
+                    story.append(Paragraph(f"<i>Source: {source}</i>", self.styles['SourceStyle']))
                 
                 story.append(Spacer(1, 0.1*inch))
         else:
-            story.append(Paragraph(
-                "No specific recommendations available at this time.",
-                self.styles['Normal']
-            ))
+            story.append(Paragraph(template.NO_RECOMMENDATIONS, self.styles['Normal']))
         
         story.append(Spacer(1, 0.2*inch))
         
         # SHAP MODEL EXPLANATION SECTION
         if 'shap_chart' in data and data['shap_chart']:
             story.append(Paragraph("SHAP Model Explanation", self.styles['SectionHeader']))
-            
-            story.append(Paragraph(
-                "SHAP values help quantify how much each feature contributed to the final sleep apnea risk prediction. "
-                "Positive values increase risk, while lower values have less influence.",
-                self.styles['Normal']
-            ))
+            story.append(Paragraph(template.SHAP_EXPLANATION, self.styles['Normal']))
             
             story.append(Spacer(1, 0.1*inch))
             
-            img = Image(data['shap_chart'], width=5*inch, height=3*inch)
-            story.append(img)
+            chart = data['shap_chart']
+            if not isinstance(chart, Flowable):
+                # PNG buffer from the matplotlib chart backend
+                chart = Image(chart, width=5*inch, height=3*inch)
+            story.append(chart)
             story.append(Spacer(1, 0.2*inch))
         
         # FOOTER
@@ -1,24 +1,344 @@
 """
 Comprehensive recommendation engine for sleep apnea risk assessment.
 Implements evidence-based recommendations based on CDC, AASM, NSF, WHO, and other sources.
+
+The rules are compiled into RULES, a static table of (required predicates,
+Recommendation) pairs. An input is reduced to a bitmask of the predicates it
+satisfies, so the recommendations for a mask - and their API text - are computed
+once and then served from a cache.
 """
 
+import hashlib
+import itertools
+from functools import lru_cache
 from typing import List, Dict, Optional
 
+import numpy as np
+
 
 class Recommendation:
-    """Data class for a single recommendation."""
+    """A single recommendation. Immutable, since one instance is shared by every result."""
+    
+    __slots__ = ('title', 'description', 'source', 'priority')
     
     def __init__(self, title: str, description: str, source: str, priority: int = 0):
-        self.title = title
-        self.description = description
-        self.source = source
-        self.priority = priority
+        object.__setattr__(self, 'title', title)
+        object.__setattr__(self, 'description', description)
+        object.__setattr__(self, 'source', source)
+        object.__setattr__(self, 'priority', priority)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("Recommendation is immutable")
     
     def __repr__(self):
         return f"{self.title}: {self.description} [{self.source}]"
 
 
+# Rule predicates, one bit each
+SHORT_SLEEP = 1 << 0         # sleep_duration < 7
+LONG_SLEEP = 1 << 1          # sleep_duration >= 9
+SNORING = 1 << 2             # stopbang_score >= 1 (snoring implied)
+HIGH_ESS = 1 << 3            # ess_score >= 11
+HIGH_BMI = 1 << 4            # bmi >= 30
+LARGE_NECK = 1 << 5          # neck_cm >= 40
+HYPERTENSION = 1 << 6
+DIABETES = 1 << 7
+ALCOHOL = 1 << 8
+HIGH_STOPBANG = 1 << 9       # stopbang_score >= 5
+LOW_ACTIVITY = 1 << 10       # < 30 activity minutes
+HIGH_ACTIVITY = 1 << 11      # >= 150 activity minutes
+LIGHT_ACTIVITY = 1 << 12     # < 20 activity minutes
+MODERATE_ACTIVITY = 1 << 13  # 20-59 activity minutes
+VIGOROUS_ACTIVITY = 1 << 14  # 60+ activity minutes
+MORNING_EXERCISE = 1 << 15   # always set; activity time is not collected yet
+EVENING_EXERCISE = 1 << 16
+HIGH_RISK = 1 << 17          # model risk level is "High Risk"
+
+
+# (predicates that must all hold, recommendation), in rule order
+RULES = (
+    # 1. SINGLE-FACTOR RULES
+    # Sleep Duration
+    (SHORT_SLEEP, Recommendation(
+        title="Increase Your Total Sleep Time",
+        description="You reported sleeping less than 7 hours per night. Adults typically need 7–9 hours of sleep. Gradually move your bedtime earlier by about 15 minutes every few days to reduce sleep debt.",
+        source="Centers for Disease Control and Prevention (CDC) – Sleep Duration Recommendations; American Academy of Sleep Medicine (AASM).",
+        priority=8
+    )),
+    (LONG_SLEEP, Recommendation(
+        title="Monitor Oversleeping and Sleep Quality",
+        description="You reported sleeping 9 hours or more. Oversleeping can sometimes reflect poor sleep quality or fragmented sleep. Pay attention to how refreshed you feel during the day.",
+        source="American Academy of Sleep Medicine (AASM) – Sleep Quality Guidance.",
+        priority=5
+    )),
+    # Snoring (implied by STOP-BANG >= 1)
+    (SNORING, Recommendation(
+        title="Manage Snoring and Airway Obstruction",
+        description="You reported regular snoring, which can be a sign of partial airway obstruction during sleep. Side-sleeping, using a supportive pillow, and avoiding heavy meals close to bedtime may help reduce snoring.",
+        source="National Sleep Foundation – Snoring and Sleep; American Academy of Sleep Medicine (AASM) – Snoring and OSA.",
+        priority=7
+    )),
+    # Epworth Sleepiness Score
+    (HIGH_ESS, Recommendation(
+        title="Address Excessive Daytime Sleepiness",
+        description="Your Epworth Sleepiness Score is elevated, which suggests excessive daytime sleepiness. This often reflects poor sleep quality or fragmented sleep at night.",
+        source="Johns MW, Epworth Sleepiness Scale (1991); AASM – Daytime Sleepiness Guidance.",
+        priority=9
+    )),
+    # BMI
+    (HIGH_BMI, Recommendation(
+        title="Consider Weight's Impact on Breathing",
+        description="Your BMI falls in a range that can increase narrowing of the upper airway during sleep. Even modest weight changes may help improve breathing and sleep quality over time.",
+        source="World Health Organization (WHO) – BMI Classification; AASM – Obesity and OSA Risk.",
+        priority=8
+    )),
+    # Neck Circumference
+    (LARGE_NECK, Recommendation(
+        title="Neck Size and Airway Narrowing",
+        description="A neck circumference of 40 cm or more is associated with a higher chance of airway narrowing during sleep, which can contribute to snoring or sleep apnea.",
+        source="Chung F. et al., STOP-Bang Questionnaire Guidelines.",
+        priority=7
+    )),
+    # Hypertension
+    (HYPERTENSION, Recommendation(
+        title="Hypertension and Sleep-Disordered Breathing",
+        description="You reported hypertension. High blood pressure is commonly linked with undiagnosed sleep-disordered breathing and may be worsened by poor sleep.",
+        source="American Heart Association (AHA) – OSA and Hypertension.",
+        priority=8
+    )),
+    # Diabetes
+    (DIABETES, Recommendation(
+        title="Diabetes and Sleep Quality",
+        description="You reported diabetes. Blood sugar imbalance is often associated with disrupted sleep patterns, and sleep apnea is more frequent among people with diabetes.",
+        source="American Diabetes Association (ADA); AASM – Sleep and Metabolic Health.",
+        priority=7
+    )),
+    # Alcohol
+    (ALCOHOL, Recommendation(
+        title="Reduce Alcohol Intake Near Bedtime",
+        description="Since you reported alcohol use, especially if taken in the evening, it can relax the upper airway muscles, worsen snoring, and increase breathing pauses during sleep. Try to avoid alcohol at least 3–4 hours before bed.",
+        source="American Academy of Sleep Medicine (AASM) – Alcohol and Sleep Quality.",
+        priority=6
+    )),
+    # STOP-BANG
+    (HIGH_STOPBANG, Recommendation(
+        title="High STOP-Bang Score and OSA Risk",
+        description="Your STOP-Bang score falls in a range associated with higher risk of obstructive sleep apnea. Monitoring your nighttime symptoms and daytime sleepiness is especially important.",
+        source="Chung F. et al., STOP-Bang Questionnaire Validation Studies.",
+        priority=10
+    )),
+    # Physical Activity
+    (LOW_ACTIVITY, Recommendation(
+        title="Increase Daily Physical Activity",
+        description="You reported less than 30 minutes of physical activity per day. Increasing daily movement to at least 30 minutes can help improve sleep quality, reduce sleep latency, and support overall health.",
+        source="CDC Physical Activity Guidelines; Harvard Medical School – Division of Sleep Medicine (Exercise and Sleep).",
+        priority=7
+    )),
+    (HIGH_ACTIVITY, Recommendation(
+        title="You Meet Activity Recommendations",
+        description="Your reported activity matches or exceeds commonly recommended weekly activity levels. Regular movement is associated with deeper sleep and better daytime energy.",
+        source="CDC Physical Activity Guidelines; Sleep Foundation – Exercise and Sleep Quality.",
+        priority=3
+    )),
+    # Activity Type
+    (LIGHT_ACTIVITY, Recommendation(
+        title="Light Activity and Sleep Support",
+        description="You indicated mostly light activity. While light movement supports general health, adding some moderate-intensity exercise may have a stronger positive effect on sleep depth and quality.",
+        source="Sleep Foundation – Exercise Intensity and Sleep.",
+        priority=5
+    )),
+    (MODERATE_ACTIVITY, Recommendation(
+        title="Moderate Exercise and Deeper Sleep",
+        description="Your activity level is in the moderate range. Regular moderate exercise is associated with improved deep sleep and reduced daytime fatigue.",
+        source="American Academy of Sleep Medicine (AASM) – Physical Activity and Sleep.",
+        priority=4
+    )),
+    (VIGOROUS_ACTIVITY, Recommendation(
+        title="Timing Vigorous Exercise Wisely",
+        description="You reported vigorous activity. Vigorous exercise can benefit sleep overall, but if done too close to bedtime, it may temporarily increase alertness and make it harder to fall asleep.",
+        source="National Sleep Foundation – Vigorous Exercise and Sleep Onset.",
+        priority=5
+    )),
+
+    # 2. TWO-FACTOR COMBINATION RULES
+    # Alcohol + Hypertension
+    (ALCOHOL | HYPERTENSION, Recommendation(
+        title="Alcohol and Hypertension During Sleep",
+        description="Combining alcohol use with hypertension can increase cardiovascular strain and contribute to more unstable breathing during sleep. Reducing evening alcohol intake can be especially beneficial for blood pressure and sleep.",
+        source="American Academy of Sleep Medicine (AASM); American Heart Association (AHA).",
+        priority=9
+    )),
+    # Snoring + Hypertension
+    (SNORING | HYPERTENSION, Recommendation(
+        title="Snoring and Blood Pressure Risk",
+        description="Snoring together with high blood pressure may increase strain on your heart and blood vessels during sleep. This pattern is often seen in individuals with undiagnosed sleep apnea.",
+        source="American Heart Association (AHA); AASM – OSA and Cardiovascular Risk.",
+        priority=9
+    )),
+    # Snoring + High BMI
+    (SNORING | HIGH_BMI, Recommendation(
+        title="Snoring and Weight-Related Airway Narrowing",
+        description="Snoring combined with a higher BMI increases the likelihood that your upper airway becomes narrowed or collapses during sleep, contributing to louder snoring or breathing pauses.",
+        source="AASM – Obstructive Sleep Apnea Risk Factors; WHO – Obesity and Respiratory Function.",
+        priority=9
+    )),
+    # Snoring + High ESS
+    (SNORING | HIGH_ESS, Recommendation(
+        title="Snoring and Excessive Daytime Sleepiness",
+        description="Snoring plus significant daytime sleepiness suggests that your sleep may be fragmented or non-restorative, possibly due to repeated airway obstruction during the night.",
+        source="Epworth Sleepiness Scale (Johns, 1991); AASM – Snoring and Sleep Fragmentation.",
+        priority=10
+    )),
+    # High BMI + Large Neck
+    (HIGH_BMI | LARGE_NECK, Recommendation(
+        title="Body Habitus and Airway Structure",
+        description="A combination of higher BMI and larger neck circumference is strongly associated with upper airway narrowing, which increases the risk of obstructed breathing during sleep.",
+        source="STOP-Bang Guidelines (Chung F. et al.); WHO – BMI and OSA.",
+        priority=9
+    )),
+    # Low Sleep + High ESS
+    (SHORT_SLEEP | HIGH_ESS, Recommendation(
+        title="Sleep Debt and Daytime Sleepiness",
+        description="Short sleep combined with elevated daytime sleepiness suggests that you are accumulating sleep debt and your sleep is not fully restorative.",
+        source="CDC – Sleep Duration and Health; Epworth Sleepiness Scale (Johns, 1991).",
+        priority=10
+    )),
+    # High STOP-BANG + Large Neck
+    (HIGH_STOPBANG | LARGE_NECK, Recommendation(
+        title="High-Risk Screening and Neck Anatomy",
+        description="Your screening score and neck circumference together suggest a high likelihood of airway narrowing during sleep, which is characteristic of obstructive sleep apnea.",
+        source="Chung F. et al., STOP-Bang Questionnaire Clinical Pathways.",
+        priority=10
+    )),
+    # Hypertension + Diabetes
+    (HYPERTENSION | DIABETES, Recommendation(
+        title="Metabolic and Blood Pressure Risks During Sleep",
+        description="The combination of hypertension and diabetes is frequently seen in people with sleep-disordered breathing. Improving sleep quality can support overall cardiometabolic health.",
+        source="American Heart Association (AHA); American Diabetes Association (ADA).",
+        priority=9
+    )),
+    # Alcohol + Snoring
+    (ALCOHOL | SNORING, Recommendation(
+        title="Alcohol's Effect on Snoring",
+        description="Alcohol relaxes the muscles in the throat and can significantly worsen snoring intensity and frequency. Avoiding alcohol close to bedtime may reduce snoring.",
+        source="American Academy of Sleep Medicine (AASM) – Alcohol and Airway Tone.",
+        priority=8
+    )),
+    # Low Activity + High ESS
+    (LOW_ACTIVITY | HIGH_ESS, Recommendation(
+        title="Low Movement and Daytime Sleepiness",
+        description="Low daily physical activity combined with significant daytime sleepiness suggests you may benefit from gradually increasing your activity to support better sleep and alertness.",
+        source="CDC Physical Activity Guidelines; ESS Research on Fatigue.",
+        priority=8
+    )),
+    # High BMI + Low Activity
+    (HIGH_BMI | LOW_ACTIVITY, Recommendation(
+        title="Weight and Inactivity Effects on Breathing",
+        description="Higher body weight combined with low activity levels can contribute to reduced respiratory function and airway narrowing during sleep. Gradual increases in movement can be beneficial.",
+        source="World Health Organization (WHO); AASM – Weight, Activity, and OSA.",
+        priority=9
+    )),
+    # Evening Exercise + Short Sleep
+    (EVENING_EXERCISE | SHORT_SLEEP, Recommendation(
+        title="Adjusting Evening Exercise to Improve Sleep",
+        description="Since you are sleeping less than 7 hours and often exercise in the evening, shifting some workouts earlier in the day may help you wind down more easily at night.",
+        source="Harvard Medical School – Division of Sleep Medicine, Exercise Timing and Sleep.",
+        priority=7
+    )),
+
+    # 3. THREE-FACTOR (OR MORE) HIGH-RISK RULES
+    # Snoring + High BMI + High ESS
+    (SNORING | HIGH_BMI | HIGH_ESS, Recommendation(
+        title="Strong Pattern of Possible Sleep-Disordered Breathing",
+        description="The combination of snoring, higher BMI, and significant daytime sleepiness strongly suggests fragmented or disrupted sleep, possibly due to repeated breathing interruptions at night.",
+        source="American Academy of Sleep Medicine (AASM); ESS Research (Johns, 1991).",
+        priority=11
+    )),
+    # Large Neck + High BMI + High STOP-BANG
+    (LARGE_NECK | HIGH_BMI | HIGH_STOPBANG, Recommendation(
+        title="Multiple Anatomical and Screening Indicators of OSA",
+        description="Your neck size, weight, and STOP-Bang score together indicate a high probability of obstructive sleep apnea. This pattern is commonly seen in individuals with significant airway narrowing during sleep.",
+        source="Chung F. et al., STOP-Bang Questionnaire Clinical Validation; WHO – Obesity and OSA.",
+        priority=11
+    )),
+    # Hypertension + Snoring + High ESS
+    (HYPERTENSION | SNORING | HIGH_ESS, Recommendation(
+        title="Cardiovascular Strain from Poor Sleep",
+        description="High blood pressure combined with snoring and daytime sleepiness may indicate that your heart and blood vessels are under extra strain during sleep, often seen in people with sleep apnea.",
+        source="American Heart Association (AHA); AASM – OSA and Cardiovascular Outcomes.",
+        priority=11
+    )),
+    # Short Sleep + High ESS + High STOP-BANG
+    (SHORT_SLEEP | HIGH_ESS | HIGH_STOPBANG, Recommendation(
+        title="Sleep Debt and High Apnea Risk",
+        description="Short sleep, significant daytime sleepiness, and a high STOP-Bang score together suggest that your sleep may be both insufficient and disrupted by breathing problems.",
+        source="CDC – Sleep Duration; Epworth Sleepiness Scale; Chung F. et al., STOP-Bang.",
+        priority=11
+    )),
+    # Diabetes + Hypertension + Snoring
+    (DIABETES | HYPERTENSION | SNORING, Recommendation(
+        title="Metabolic, Blood Pressure, and Airway Red Flags",
+        description="The combination of diabetes, hypertension, and snoring is frequently observed in individuals with underlying sleep apnea. Addressing sleep quality can be an important part of overall health management.",
+        source="American Heart Association (AHA); American Diabetes Association (ADA); AASM – Sleep and Cardiometabolic Health.",
+        priority=11
+    )),
+    # Low Activity + High BMI + Snoring
+    (LOW_ACTIVITY | HIGH_BMI | SNORING, Recommendation(
+        title="Activity, Weight, and Breathing Difficulties",
+        description="Low daily movement combined with higher BMI and snoring may indicate increased airway resistance and reduced respiratory fitness. Gradual increases in physical activity can help support better breathing and sleep.",
+        source="AASM – OSA and Lifestyle; WHO; CDC Physical Activity Guidelines.",
+        priority=10
+    )),
+    # Moderate Morning Exercise + High ESS + Short Sleep
+    (MODERATE_ACTIVITY | MORNING_EXERCISE | HIGH_ESS | SHORT_SLEEP, Recommendation(
+        title="Strengthening Your Sleep-Wake Cycle",
+        description="You already benefit from morning moderate exercise, but your high daytime sleepiness and short sleep duration suggest your sleep-wake cycle may still be disrupted. Extending sleep time and keeping a consistent schedule can help.",
+        source="Sleep Foundation – Morning Exercise; Epworth Sleepiness Scale; CDC – Sleep Duration.",
+        priority=9
+    )),
+    # High STOP-BANG + Low Activity + Hypertension
+    (HIGH_STOPBANG | LOW_ACTIVITY | HYPERTENSION, Recommendation(
+        title="High-Risk Profile with Low Activity",
+        description="A high STOP-Bang score, low physical activity, and hypertension together indicate an increased cardiometabolic and sleep-related risk profile. Improving activity levels and sleep quality may have meaningful health benefits.",
+        source="Chung F. et al., STOP-Bang; American Heart Association; CDC Physical Activity Guidelines.",
+        priority=11
+    )),
+
+    # 4. HIGH RISK: professional consultation at the top
+    (HIGH_RISK, Recommendation(
+        title="High Risk: Professional Sleep Evaluation Recommended",
+        description="Based on your assessment results and machine learning analysis, you show multiple indicators strongly associated with sleep-disordered breathing. We strongly recommend consulting with a sleep specialist or healthcare provider for a comprehensive evaluation. A sleep study (polysomnography) may be necessary for accurate diagnosis and treatment planning.",
+        source="American Academy of Sleep Medicine (AASM); Centers for Disease Control and Prevention (CDC); National Sleep Foundation.",
+        priority=12
+    )),
+)
+
+# Rule ids (positions in RULES), highest priority first; the sort is stable, so rule order breaks ties
+_RULE_IDS_BY_PRIORITY = tuple(sorted(range(len(RULES)), key=lambda i: RULES[i][1].priority, reverse=True))
+
+# Inputs generate_recommendations_batch needs; daily_steps and risk_level have defaults
+BATCH_COLUMNS = ('bmi', 'neck_cm', 'hypertension', 'diabetes', 'alcohol', 'ess_score',
+                 'stopbang_score', 'sleep_duration')
+
+
+@lru_cache(maxsize=None)
+def recommendation_ids_for_mask(mask: int) -> tuple:
+    """Ids of the rules whose predicates are all set in `mask`, highest priority first."""
+    return tuple(i for i in _RULE_IDS_BY_PRIORITY if mask & RULES[i][0] == RULES[i][0])
+
+
+@lru_cache(maxsize=None)
+def recommendations_for_mask(mask: int) -> tuple:
+    """Recommendations whose predicates are all set in `mask`, highest priority first."""
+    return tuple(RULES[i][1] for i in recommendation_ids_for_mask(mask))
+
+
+@lru_cache(maxsize=None)
+def api_text_for_mask(mask: int) -> str:
+    """format_for_api text for a predicate mask, built once per mask."""
+    return RecommendationEngine.format_for_api(recommendations_for_mask(mask))
+
+
 class RecommendationEngine:
     """
     Generates comprehensive, evidence-based recommendations for sleep apnea risk
@@ -27,7 +347,7 @@ class RecommendationEngine:
     """
     
     @staticmethod
-    def generate_recommendations(
+    def rule_mask(
         age: int,
         sex: int,  # 1=male, 0=female
         bmi: float,
@@ -42,356 +362,109 @@ class RecommendationEngine:
         sleep_duration: float,
         daily_steps: int = 5000,
         risk_level: str = "Unknown"
-    ) -> List[Recommendation]:
-        """Generate all applicable recommendations based on user data."""
-        
-        recommendations = []
+    ) -> int:
+        """Bitmask of the rule predicates the user data satisfies."""
         
         # Calculate activity metrics
         physical_activity_minutes = RecommendationEngine._calculate_activity_minutes(daily_steps)
         activity_type = RecommendationEngine._determine_activity_type(physical_activity_minutes)
         activity_time = "morning"  # Default
         
-        # ============================================================
-        # 1. SINGLE-FACTOR RULES
-        # ============================================================
-        
-        # Sleep Duration
-        if sleep_duration < 7:
-            recommendations.append(Recommendation(
-                title="Increase Your Total Sleep Time",
-                description="You reported sleeping less than 7 hours per night. Adults typically need 7–9 hours of sleep. Gradually move your bedtime earlier by about 15 minutes every few days to reduce sleep debt.",
-                source="Centers for Disease Control and Prevention (CDC) – Sleep Duration Recommendations; American Academy of Sleep Medicine (AASM).",
-                priority=8
-            ))
-        
-        if sleep_duration >= 9:
-            recommendations.append(Recommendation(
-                title="Monitor Oversleeping and Sleep Quality",
-                description="You reported sleeping 9 hours or more. Oversleeping can sometimes reflect poor sleep quality or fragmented sleep. Pay attention to how refreshed you feel during the day.",
-                source="American Academy of Sleep Medicine (AASM) – Sleep Quality Guidance.",
-                priority=5
-            ))
-        
-        # Snoring (implied by STOP-BANG >= 1)
-        if stopbang_score >= 1:
-            recommendations.append(Recommendation(
-                title="Manage Snoring and Airway Obstruction",
-                description="You reported regular snoring, which can be a sign of partial airway obstruction during sleep. Side-sleeping, using a supportive pillow, and avoiding heavy meals close to bedtime may help reduce snoring.",
-                source="National Sleep Foundation – Snoring and Sleep; American Academy of Sleep Medicine (AASM) – Snoring and OSA.",
-                priority=7
-            ))
-        
-        # Epworth Sleepiness Score
-        if ess_score >= 11:
-            recommendations.append(Recommendation(
-                title="Address Excessive Daytime Sleepiness",
-                description="Your Epworth Sleepiness Score is elevated, which suggests excessive daytime sleepiness. This often reflects poor sleep quality or fragmented sleep at night.",
-                source="Johns MW, Epworth Sleepiness Scale (1991); AASM – Daytime Sleepiness Guidance.",
-                priority=9
-            ))
-        
-        # BMI
-        if bmi >= 30:
-            recommendations.append(Recommendation(
-                title="Consider Weight's Impact on Breathing",
-                description="Your BMI falls in a range that can increase narrowing of the upper airway during sleep. Even modest weight changes may help improve breathing and sleep quality over time.",
-                source="World Health Organization (WHO) – BMI Classification; AASM – Obesity and OSA Risk.",
-                priority=8
-            ))
-        
-        # Neck Circumference
-        if neck_cm >= 40:
-            recommendations.append(Recommendation(
-                title="Neck Size and Airway Narrowing",
-                description="A neck circumference of 40 cm or more is associated with a higher chance of airway narrowing during sleep, which can contribute to snoring or sleep apnea.",
-                source="Chung F. et al., STOP-Bang Questionnaire Guidelines.",
-                priority=7
-            ))
-        
-        # Hypertension
-        if hypertension:
-            recommendations.append(Recommendation(
-                title="Hypertension and Sleep-Disordered Breathing",
-                description="You reported hypertension. High blood pressure is commonly linked with undiagnosed sleep-disordered breathing and may be worsened by poor sleep.",
-                source="American Heart Association (AHA) – OSA and Hypertension.",
-                priority=8
-            ))
-        
-        # Diabetes
-        if diabetes:
-            recommendations.append(Recommendation(
-                title="Diabetes and Sleep Quality",
-                description="You reported diabetes. Blood sugar imbalance is often associated with disrupted sleep patterns, and sleep apnea is more frequent among people with diabetes.",
-                source="American Diabetes Association (ADA); AASM – Sleep and Metabolic Health.",
-                priority=7
-            ))
-        
-        # Alcohol
-        if alcohol:
-            recommendations.append(Recommendation(
-                title="Reduce Alcohol Intake Near Bedtime",
-                description="Since you reported alcohol use, especially if taken in the evening, it can relax the upper airway muscles, worsen snoring, and increase breathing pauses during sleep. Try to avoid alcohol at least 3–4 hours before bed.",
-                source="American Academy of Sleep Medicine (AASM) – Alcohol and Sleep Quality.",
-                priority=6
-            ))
-        
-        # STOP-BANG
-        if stopbang_score >= 5:
-            recommendations.append(Recommendation(
-                title="High STOP-Bang Score and OSA Risk",
-                description="Your STOP-Bang score falls in a range associated with higher risk of obstructive sleep apnea. Monitoring your nighttime symptoms and daytime sleepiness is especially important.",
-                source="Chung F. et al., STOP-Bang Questionnaire Validation Studies.",
-                priority=10
-            ))
-        
-        # Physical Activity
-        if physical_activity_minutes < 30:
-            recommendations.append(Recommendation(
-                title="Increase Daily Physical Activity",
-                description="You reported less than 30 minutes of physical activity per day. Increasing daily movement to at least 30 minutes can help improve sleep quality, reduce sleep latency, and support overall health.",
-                source="CDC Physical Activity Guidelines; Harvard Medical School – Division of Sleep Medicine (Exercise and Sleep).",
-                priority=7
-            ))
-        
-        if physical_activity_minutes >= 150:
-            recommendations.append(Recommendation(
-                title="You Meet Activity Recommendations",
-                description="Your reported activity matches or exceeds commonly recommended weekly activity levels. Regular movement is associated with deeper sleep and better daytime energy.",
-                source="CDC Physical Activity Guidelines; Sleep Foundation – Exercise and Sleep Quality.",
-                priority=3
-            ))
-        
-        # Activity Type
-        if activity_type == "light":
-            recommendations.append(Recommendation(
-                title="Light Activity and Sleep Support",
-                description="You indicated mostly light activity. While light movement supports general health, adding some moderate-intensity exercise may have a stronger positive effect on sleep depth and quality.",
-                source="Sleep Foundation – Exercise Intensity and Sleep.",
-                priority=5
-            ))
-        elif activity_type == "moderate":
-            recommendations.append(Recommendation(
-                title="Moderate Exercise and Deeper Sleep",
-                description="Your activity level is in the moderate range. Regular moderate exercise is associated with improved deep sleep and reduced daytime fatigue.",
-                source="American Academy of Sleep Medicine (AASM) – Physical Activity and Sleep.",
-                priority=4
-            ))
-        elif activity_type == "vigorous":
-            recommendations.append(Recommendation(
-                title="Timing Vigorous Exercise Wisely",
-                description="You reported vigorous activity. Vigorous exercise can benefit sleep overall, but if done too close to bedtime, it may temporarily increase alertness and make it harder to fall asleep.",
-                source="National Sleep Foundation – Vigorous Exercise and Sleep Onset.",
-                priority=5
-            ))
-        
-        # ============================================================
-        # 2. TWO-FACTOR COMBINATION RULES
-        # ============================================================
-        
-        # Alcohol + Hypertension
-        if alcohol and hypertension:
-            recommendations.append(Recommendation(
-                title="Alcohol and Hypertension During Sleep",
-                description="Combining alcohol use with hypertension can increase cardiovascular strain and contribute to more unstable breathing during sleep. Reducing evening alcohol intake can be especially beneficial for blood pressure and sleep.",
-                source="American Academy of Sleep Medicine (AASM); American Heart Association (AHA).",
-                priority=9
-            ))
-        
-        # Snoring + Hypertension
-        if stopbang_score >= 1 and hypertension:
-            recommendations.append(Recommendation(
-                title="Snoring and Blood Pressure Risk",
-                description="Snoring together with high blood pressure may increase strain on your heart and blood vessels during sleep. This pattern is often seen in individuals with undiagnosed sleep apnea.",
-                source="American Heart Association (AHA); AASM – OSA and Cardiovascular Risk.",
-                priority=9
-            ))
-        
-        # Snoring + High BMI
-        if stopbang_score >= 1 and bmi >= 30:
-            recommendations.append(Recommendation(
-                title="Snoring and Weight-Related Airway Narrowing",
-                description="Snoring combined with a higher BMI increases the likelihood that your upper airway becomes narrowed or collapses during sleep, contributing to louder snoring or breathing pauses.",
-                source="AASM – Obstructive Sleep Apnea Risk Factors; WHO – Obesity and Respiratory Function.",
-                priority=9
-            ))
-        
-        # Snoring + High ESS
-        if stopbang_score >= 1 and ess_score >= 11:
-            recommendations.append(Recommendation(
-                title="Snoring and Excessive Daytime Sleepiness",
-                description="Snoring plus significant daytime sleepiness suggests that your sleep may be fragmented or non-restorative, possibly due to repeated airway obstruction during the night.",
-                source="Epworth Sleepiness Scale (Johns, 1991); AASM – Snoring and Sleep Fragmentation.",
-                priority=10
-            ))
-        
-        # High BMI + Large Neck
-        if bmi >= 30 and neck_cm >= 40:
-            recommendations.append(Recommendation(
-                title="Body Habitus and Airway Structure",
-                description="A combination of higher BMI and larger neck circumference is strongly associated with upper airway narrowing, which increases the risk of obstructed breathing during sleep.",
-                source="STOP-Bang Guidelines (Chung F. et al.); WHO – BMI and OSA.",
-                priority=9
-            ))
-        
-        # Low Sleep + High ESS
-        if sleep_duration < 7 and ess_score >= 11:
-            recommendations.append(Recommendation(
-                title="Sleep Debt and Daytime Sleepiness",
-                description="Short sleep combined with elevated daytime sleepiness suggests that you are accumulating sleep debt and your sleep is not fully restorative.",
-                source="CDC – Sleep Duration and Health; Epworth Sleepiness Scale (Johns, 1991).",
-                priority=10
-            ))
-        
-        # High STOP-BANG + Large Neck
-        if stopbang_score >= 5 and neck_cm >= 40:
-            recommendations.append(Recommendation(
-                title="High-Risk Screening and Neck Anatomy",
-                description="Your screening score and neck circumference together suggest a high likelihood of airway narrowing during sleep, which is characteristic of obstructive sleep apnea.",
-                source="Chung F. et al., STOP-Bang Questionnaire Clinical Pathways.",
-                priority=10
-            ))
-        
-        # Hypertension + Diabetes
-        if hypertension and diabetes:
-            recommendations.append(Recommendation(
-                title="Metabolic and Blood Pressure Risks During Sleep",
-                description="The combination of hypertension and diabetes is frequently seen in people with sleep-disordered breathing. Improving sleep quality can support overall cardiometabolic health.",
-                source="American Heart Association (AHA); American Diabetes Association (ADA).",
-                priority=9
-            ))
-        
-        # Alcohol + Snoring
-        if alcohol and stopbang_score >= 1:
-            recommendations.append(Recommendation(
-                title="Alcohol's Effect on Snoring",
-                description="Alcohol relaxes the muscles in the throat and can significantly worsen snoring intensity and frequency. Avoiding alcohol close to bedtime may reduce snoring.",
-                source="American Academy of Sleep Medicine (AASM) – Alcohol and Airway Tone.",
-                priority=8
-            ))
-        
-        # Low Activity + High ESS
-        if physical_activity_minutes < 30 and ess_score >= 11:
-            recommendations.append(Recommendation(
-                title="Low Movement and Daytime Sleepiness",
-                description="Low daily physical activity combined with significant daytime sleepiness suggests you may benefit from gradually increasing your activity to support better sleep and alertness.",
-                source="CDC Physical Activity Guidelines; ESS Research on Fatigue.",
-                priority=8
-            ))
-        
-        # High BMI + Low Activity
-        if bmi >= 30 and physical_activity_minutes < 30:
-            recommendations.append(Recommendation(
-                title="Weight and Inactivity Effects on Breathing",
-                description="Higher body weight combined with low activity levels can contribute to reduced respiratory function and airway narrowing during sleep. Gradual increases in movement can be beneficial.",
-                source="World Health Organization (WHO); AASM – Weight, Activity, and OSA.",
-                priority=9
-            ))
-        
-        # Evening Exercise + Short Sleep
-        if activity_time == "evening" and sleep_duration < 7:
-            recommendations.append(Recommendation(
-                title="Adjusting Evening Exercise to Improve Sleep",
-                description="Since you are sleeping less than 7 hours and often exercise in the evening, shifting some workouts earlier in the day may help you wind down more easily at night.",
-                source="Harvard Medical School – Division of Sleep Medicine, Exercise Timing and Sleep.",
-                priority=7
-            ))
-        
-        # ============================================================
-        # 3. THREE-FACTOR (OR MORE) HIGH-RISK RULES
-        # ============================================================
-        
-        # Snoring + High BMI + High ESS
-        if stopbang_score >= 1 and bmi >= 30 and ess_score >= 11:
-            recommendations.append(Recommendation(
-                title="Strong Pattern of Possible Sleep-Disordered Breathing",
-                description="The combination of snoring, higher BMI, and significant daytime sleepiness strongly suggests fragmented or disrupted sleep, possibly due to repeated breathing interruptions at night.",
-                source="American Academy of Sleep Medicine (AASM); ESS Research (Johns, 1991).",
-                priority=11
-            ))
-        
-        # Large Neck + High BMI + High STOP-BANG
-        if neck_cm >= 40 and bmi >= 30 and stopbang_score >= 5:
-            recommendations.append(Recommendation(
-                title="Multiple Anatomical and Screening Indicators of OSA",
-                description="Your neck size, weight, and STOP-Bang score together indicate a high probability of obstructive sleep apnea. This pattern is commonly seen in individuals with significant airway narrowing during sleep.",
-                source="Chung F. et al., STOP-Bang Questionnaire Clinical Validation; WHO – Obesity and OSA.",
-                priority=11
-            ))
-        
-        # Hypertension + Snoring + High ESS
-        if hypertension and stopbang_score >= 1 and ess_score >= 11:
-            recommendations.append(Recommendation(
-                title="Cardiovascular Strain from Poor Sleep",
-                description="High blood pressure combined with snoring and daytime sleepiness may indicate that your heart and blood vessels are under extra strain during sleep, often seen in people with sleep apnea.",
-                source="American Heart Association (AHA); AASM – OSA and Cardiovascular Outcomes.",
-                priority=11
-            ))
-        
-        # Short Sleep + High ESS + High STOP-BANG
-        if sleep_duration < 7 and ess_score >= 11 and stopbang_score >= 5:
-            recommendations.append(Recommendation(
-                title="Sleep Debt and High Apnea Risk",
-                description="Short sleep, significant daytime sleepiness, and a high STOP-Bang score together suggest that your sleep may be both insufficient and disrupted by breathing problems.",
-                source="CDC – Sleep Duration; Epworth Sleepiness Scale; Chung F. et al., STOP-Bang.",
-                priority=11
-            ))
-        
-        # Diabetes + Hypertension + Snoring
-        if diabetes and hypertension and stopbang_score >= 1:
-            recommendations.append(Recommendation(
-                title="Metabolic, Blood Pressure, and Airway Red Flags",
-                description="The combination of diabetes, hypertension, and snoring is frequently observed in individuals with underlying sleep apnea. Addressing sleep quality can be an important part of overall health management.",
-                source="American Heart Association (AHA); American Diabetes Association (ADA); AASM – Sleep and Cardiometabolic Health.",
-                priority=11
-            ))
-        
-        # Low Activity + High BMI + Snoring
-        if physical_activity_minutes < 30 and bmi >= 30 and stopbang_score >= 1:
-            recommendations.append(Recommendation(
-                title="Activity, Weight, and Breathing Difficulties",
-                description="Low daily movement combined with higher BMI and snoring may indicate increased airway resistance and reduced respiratory fitness. Gradual increases in physical activity can help support better breathing and sleep.",
-                source="AASM – OSA and Lifestyle; WHO; CDC Physical Activity Guidelines.",
-                priority=10
-            ))
-        
-        # Moderate Morning Exercise + High ESS + Short Sleep
-        if activity_type == "moderate" and activity_time == "morning" and ess_score >= 11 and sleep_duration < 7:
-            recommendations.append(Recommendation(
-                title="Strengthening Your Sleep-Wake Cycle",
-                description="You already benefit from morning moderate exercise, but your high daytime sleepiness and short sleep duration suggest your sleep-wake cycle may still be disrupted. Extending sleep time and keeping a consistent schedule can help.",
-                source="Sleep Foundation – Morning Exercise; Epworth Sleepiness Scale; CDC – Sleep Duration.",
-                priority=9
-            ))
-        
-        # High STOP-BANG + Low Activity + Hypertension
-        if stopbang_score >= 5 and physical_activity_minutes < 30 and hypertension:
-            recommendations.append(Recommendation(
-                title="High-Risk Profile with Low Activity",
-                description="A high STOP-Bang score, low physical activity, and hypertension together indicate an increased cardiometabolic and sleep-related risk profile. Improving activity levels and sleep quality may have meaningful health benefits.",
-                source="Chung F. et al., STOP-Bang; American Heart Association; CDC Physical Activity Guidelines.",
-                priority=11
-            ))
-        
-        # ============================================================
-        # HIGH RISK: Add professional consultation at the top
-        # ============================================================
-        
-        # Use ML model prediction for high risk determination
-        # Only show "High Risk: Professional Sleep Evaluation" if ML model says High Risk
-        is_high_risk = risk_level == "High Risk"
-        
-        if is_high_risk:
-            recommendations.append(Recommendation(
-                title="High Risk: Professional Sleep Evaluation Recommended",
-                description="Based on your assessment results and machine learning analysis, you show multiple indicators strongly associated with sleep-disordered breathing. We strongly recommend consulting with a sleep specialist or healthcare provider for a comprehensive evaluation. A sleep study (polysomnography) may be necessary for accurate diagnosis and treatment planning.",
-                source="American Academy of Sleep Medicine (AASM); Centers for Disease Control and Prevention (CDC); National Sleep Foundation.",
-                priority=12
-            ))
-        
-        # Sort by priority (highest first) and return
-        recommendations.sort(key=lambda r: r.priority, reverse=True)
-        return recommendations
+        return (
+            (SHORT_SLEEP if sleep_duration < 7 else 0)
+            | (LONG_SLEEP if sleep_duration >= 9 else 0)
+            | (SNORING if stopbang_score >= 1 else 0)
+            | (HIGH_ESS if ess_score >= 11 else 0)
+            | (HIGH_BMI if bmi >= 30 else 0)
+            | (LARGE_NECK if neck_cm >= 40 else 0)
+            | (HYPERTENSION if hypertension else 0)
+            | (DIABETES if diabetes else 0)
+            | (ALCOHOL if alcohol else 0)
+            | (HIGH_STOPBANG if stopbang_score >= 5 else 0)
+            | (LOW_ACTIVITY if physical_activity_minutes < 30 else 0)
+            | (HIGH_ACTIVITY if physical_activity_minutes >= 150 else 0)
+            | (LIGHT_ACTIVITY if activity_type == "light" else 0)
+            | (MODERATE_ACTIVITY if activity_type == "moderate" else 0)
+            | (VIGOROUS_ACTIVITY if activity_type == "vigorous" else 0)
+            | (MORNING_EXERCISE if activity_time == "morning" else 0)
+            | (EVENING_EXERCISE if activity_time == "evening" else 0)
+            | (HIGH_RISK if risk_level == "High Risk" else 0)
+        )
+    
+    @staticmethod
+    def generate_recommendations(*args, **kwargs) -> List[Recommendation]:
+        """Generate all applicable recommendations based on user data (see rule_mask for the arguments)."""
+        return list(recommendations_for_mask(RecommendationEngine.rule_mask(*args, **kwargs)))
+    
+    @staticmethod
+    def generate_api_text(*args, **kwargs) -> str:
+        """format_for_api(generate_recommendations(...)), memoized per predicate mask."""
+        return api_text_for_mask(RecommendationEngine.rule_mask(*args, **kwargs))
+    
+    @staticmethod
+    def rule_masks(columns) -> np.ndarray:
+        """
+        rule_mask for every row of a DataFrame or a dict of equal-length column
+        arrays named like the generate_recommendations arguments. daily_steps and
+        risk_level may be omitted or given as scalars; unused inputs are ignored.
+        """
+        missing = [name for name in BATCH_COLUMNS if name not in columns]
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+        
+        def column(name, default=None):
+            return np.asarray(columns[name] if name in columns else default)
+        
+        def flag(values, bit):
+            return np.where(values, bit, 0)
+        
+        # Same activity estimate as _calculate_activity_minutes / _determine_activity_type
+        minutes = np.clip(np.floor_divide(column('daily_steps', 5000), 100), 0, 300)
+        light = minutes < 20
+        moderate = (minutes >= 20) & (minutes < 60)
+        sleep_duration = column('sleep_duration')
+        stopbang_score = column('stopbang_score')
+        
+        masks = np.zeros(len(sleep_duration), dtype=np.int64)
+        masks |= flag(sleep_duration < 7, SHORT_SLEEP)
+        masks |= flag(sleep_duration >= 9, LONG_SLEEP)
+        masks |= flag(stopbang_score >= 1, SNORING)
+        masks |= flag(column('ess_score') >= 11, HIGH_ESS)
+        masks |= flag(column('bmi') >= 30, HIGH_BMI)
+        masks |= flag(column('neck_cm') >= 40, LARGE_NECK)
+        masks |= flag(column('hypertension').astype(bool), HYPERTENSION)
+        masks |= flag(column('diabetes').astype(bool), DIABETES)
+        masks |= flag(column('alcohol').astype(bool), ALCOHOL)
+        masks |= flag(stopbang_score >= 5, HIGH_STOPBANG)
+        masks |= flag(minutes < 30, LOW_ACTIVITY)
+        masks |= flag(minutes >= 150, HIGH_ACTIVITY)
+        masks |= flag(light, LIGHT_ACTIVITY)
+        masks |= flag(moderate, MODERATE_ACTIVITY)
+        masks |= flag(~light & ~moderate, VIGOROUS_ACTIVITY)
+        masks |= MORNING_EXERCISE  # activity time defaults to morning
+        masks |= flag(column('risk_level', "Unknown") == "High Risk", HIGH_RISK)
+        return masks
+    
+    @staticmethod
+    def generate_recommendations_batch(columns, output: str = "masks"):
+        """
+        Recommendations for a whole cohort (see rule_masks for `columns`). Returns
+        the per-row rule masks as an array (output="masks"), or per row a tuple of
+        rule ids ("ids") or the format_for_api text ("text"). Rows sharing a mask
+        share one cached result.
+        """
+        masks = RecommendationEngine.rule_masks(columns)
+        if output == "masks":
+            return masks
+        if output == "ids":
+            lookup = recommendation_ids_for_mask
+        elif output == "text":
+            lookup = api_text_for_mask
+        else:
+            raise ValueError(f"Unknown output: {output}")
+        unique, inverse = np.unique(masks, return_inverse=True)
+        results = [lookup(int(mask)) for mask in unique]
+        return [results[i] for i in inverse]
     
     @staticmethod
     def _calculate_activity_minutes(daily_steps: int) -> int:
@@ -431,3 +504,33 @@ class RecommendationEngine:
             }
             for rec in recommendations[:max_count]
         ]
+
+
+def _rules_version() -> str:
+    """
+    Fingerprint of the rules: RULES (predicates, text, priorities) plus the masks
+    rule_masks gives on either side of every predicate threshold, so editing a
+    rule or moving a threshold changes it.
+    """
+    probes = {
+        'sleep_duration': [6.99, 7, 8.99, 9],
+        'stopbang_score': [0, 1, 4, 5],
+        'ess_score': [10, 11],
+        'bmi': [29.99, 30],
+        'neck_cm': [39.99, 40],
+        'hypertension': [False, True],
+        'diabetes': [False, True],
+        'alcohol': [False, True],
+        'daily_steps': [1999, 2000, 2999, 3000, 5999, 6000, 14999, 15000],
+        'risk_level': ["Low Risk", "High Risk"],
+    }
+    grid = dict(zip(probes, (np.array(column) for column in zip(*itertools.product(*probes.values())))))
+    digest = hashlib.sha256(repr([
+        (mask, rec.title, rec.description, rec.source, rec.priority) for mask, rec in RULES
+    ]).encode())
+    digest.update(RecommendationEngine.rule_masks(grid).tobytes())
+    return digest.hexdigest()[:16]
+
+
+# Changes with any rule or predicate threshold; results stored by mask (survey_outputs) key on it
+RULES_VERSION = _rules_version()
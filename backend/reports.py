@@ -0,0 +1,266 @@
+"""
+Asynchronous PDF report rendering with an on-disk result cache.
+
+generate_pdf_report used to draw three matplotlib charts and build the ReportLab
+document in the request thread, holding a Flask worker for the whole render.
+Now the request only gathers the report data (a plain, picklable dict) and
+ReportJobs hands it to a process pool. Finished PDFs are written to `cache_dir`
+as <job id>.pdf, where the job id is derived from the user, the survey id, a
+hash of the report data, TEMPLATE_VERSION and the chart backend, so asking again for an unchanged
+survey is a file lookup with no rendering. Job state is kept next to the PDF in
+<job id>.json, so any worker process can answer a poll.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait as wait_futures
+from datetime import datetime
+
+
+# Bump whenever pdf_generator.py or charts.py change what a report looks like
+TEMPLATE_VERSION = 2
+
+PENDING = 'pending'
+READY = 'ready'
+FAILED = 'failed'
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def report_job_id(user_id, survey_id, data):
+    """Cache key for one rendering of a survey's report (with this process's chart backend)."""
+    import charts
+
+    data_hash = hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+    key = f'{user_id}:{survey_id}:{data_hash}:{TEMPLATE_VERSION}:{charts.CHART_BACKEND}'
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def render_report(data, output_path):
+    """
+    Charts + ReportLab document for one report, written atomically to
+    output_path. Runs in a pool process; returns the file size.
+    """
+    import charts
+    from pdf_generator import get_generator
+
+    data = dict(data)
+    rendered = charts.report_charts(data.pop('charts', {}))
+    data['shap_chart'] = rendered['shap_chart']
+    data['google_fit'] = dict(
+        data.get('google_fit', {}),
+        weekly_steps_chart=rendered['weekly_steps_chart'],
+        weekly_sleep_chart=rendered['weekly_sleep_chart']
+    )
+    data['generated_date'] = datetime.now().strftime("%Y-%m-%d %H:%M")
+
+    tmp_path = f'{output_path}.{os.getpid()}.tmp'
+    get_generator().generate_pdf(data, tmp_path)
+    os.replace(tmp_path, output_path)
+    return os.path.getsize(output_path)
+
+
+class ReportJobs:
+    """Process-pool report rendering with job state and PDFs cached on disk."""
+
+    def __init__(self, cache_dir, max_workers=2, stale_after=300):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.stale_after = stale_after  # seconds before a pending job from a dead worker is given up on
+        os.makedirs(cache_dir, exist_ok=True)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._finished = {}  # job id -> Future resolved with the final state, for renders started here
+        self.submitted = 0
+        self.cache_hits = 0
+        self.completed = 0
+        self.failed = 0
+
+    def pdf_path(self, job_id):
+        return os.path.join(self.cache_dir, f'{job_id}.pdf')
+
+    def _meta_path(self, job_id):
+        return os.path.join(self.cache_dir, f'{job_id}.json')
+
+    def _write_meta(self, job_id, meta):
+        tmp_path = f'{self._meta_path(job_id)}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path(job_id))
+
+    def _get_executor(self):
+        # Created lazily (and per process) so forked web workers each get their own pool
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def status(self, job_id):
+        """Job state dict ({'job_id', 'user_id', 'status', 'filename', ...}) or None if unknown."""
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        try:
+            with open(self._meta_path(job_id)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta['status'] == READY and not os.path.exists(self.pdf_path(job_id)):
+            return None
+        if meta['status'] == PENDING and time.time() - meta['created_at'] > self.stale_after:
+            meta.update(status=FAILED, error='Report rendering timed out')
+        return meta
+
+    def submit(self, job_id, user_id, data, filename):
+        """Enqueue a render unless the PDF is already cached or being rendered; returns the job state."""
+        return self._enqueue(job_id, user_id, data, filename)[0]
+
+    def _enqueue(self, job_id, user_id, data, filename):
+        """
+        submit() that also returns a Future resolved with the final job state
+        (None when another process is rendering the job).
+        """
+        with self._lock:
+            meta = self.status(job_id)
+            if meta is not None and meta['status'] == READY:
+                self.cache_hits += 1
+                finished = Future()
+                finished.set_result(meta)
+                return meta, finished
+            if meta is not None and meta['status'] == PENDING:
+                return meta, self._finished.get(job_id)
+
+            meta = {
+                'job_id': job_id,
+                'user_id': user_id,
+                'status': PENDING,
+                'filename': filename,
+                'created_at': time.time()
+            }
+            self._write_meta(job_id, meta)
+            future = self._get_executor().submit(render_report, data, self.pdf_path(job_id))
+            finished = self._finished[job_id] = Future()
+            self.submitted += 1
+        future.add_done_callback(lambda f: self._finish(meta, f))
+        return meta, finished
+
+    def _finish(self, meta, future):
+        meta = dict(meta, finished_at=time.time())
+        try:
+            meta.update(status=READY, size=future.result())
+            self.completed += 1
+        except Exception as e:
+            meta.update(status=FAILED, error=str(e))
+            self.failed += 1
+            print(f"❌ Report rendering failed: {e}")
+        self._write_meta(meta['job_id'], meta)
+        with self._lock:
+            finished = self._finished.pop(meta['job_id'], None)
+        if finished is not None:
+            finished.set_result(meta)
+
+    def render_many(self, items, window=None, timeout=None):
+        """
+        Render (job_id, user_id, data, filename) items with at most `window` jobs
+        in flight (default twice the pool size), pulling items lazily. Yields each
+        job's final state as soon as it finishes, so completion order, not input
+        order. Cached reports are yielded without rendering.
+        """
+        window = window or self.max_workers * 2
+        timeout = timeout or self.stale_after
+        items = iter(items)
+        in_flight = {}  # Future -> job id
+        elsewhere = []  # jobs another process is rendering
+        exhausted = False
+        while True:
+            while not exhausted and len(in_flight) + len(elsewhere) < window:
+                item = next(items, None)
+                if item is None:
+                    exhausted = True
+                    break
+                meta, finished = self._enqueue(*item)
+                if finished is not None:
+                    in_flight[finished] = meta['job_id']
+                else:
+                    elsewhere.append(meta['job_id'])
+            if not in_flight and not elsewhere:
+                return
+
+            if in_flight:
+                done, _ = wait_futures(in_flight, timeout=0.5 if elsewhere else timeout,
+                                       return_when=FIRST_COMPLETED)
+                for finished in done:
+                    del in_flight[finished]
+                    yield finished.result()
+            else:
+                time.sleep(0.05)
+            for job_id in list(elsewhere):
+                meta = self.status(job_id)
+                if meta is None or meta['status'] != PENDING:
+                    elsewhere.remove(job_id)
+                    yield meta or {'job_id': job_id, 'status': FAILED, 'error': 'Report disappeared'}
+
+    def wait(self, job_id, timeout, poll_interval=0.05):
+        """Poll until the job is no longer pending or `timeout` seconds pass; returns its state."""
+        deadline = time.monotonic() + timeout
+        meta = self.status(job_id)
+        while meta is not None and meta['status'] == PENDING and time.monotonic() < deadline:
+            time.sleep(poll_interval)
+            meta = self.status(job_id)
+        return meta
+
+    def stats(self):
+        return {
+            'submitted': self.submitted,
+            'cache_hits': self.cache_hits,
+            'completed': self.completed,
+            'failed': self.failed,
+            'max_workers': self.max_workers,
+            'template_version': TEMPLATE_VERSION
+        }
+
+
+class _ZipStream:
+    """Write-only, non-seekable sink for zipfile; drain() hands out what was written so far."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries):
+    """
+    Stream a ZIP archive of (arcname, path or bytes) entries, yielding the archive
+    bytes after each entry is added. Files are copied into the archive in chunks,
+    so memory stays at about one compressed entry whatever the number of entries.
+    """
+    sink = _ZipStream()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for arcname, source in entries:
+            if isinstance(source, bytes):
+                archive.writestr(arcname, source)
+            else:
+                archive.write(source, arcname)
+            yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,137 @@
+"""
+Secondary indexes and query-plan checks for the hot database queries.
+
+Usage:
+    python schema.py indexes [--db wakeup_call.db]   # create missing indexes
+    python schema.py check [--db wakeup_call.db]     # EXPLAIN QUERY PLAN every hot query
+"""
+
+import argparse
+import sqlite3
+import sys
+
+from daily_metrics import AGGREGATE_WINDOWS, EXISTING_DAYS_SQL, RECENT_DAYS_SQL, ROLLUP_SQL, aggregates_sql
+from survey_outputs import SAVE_OUTPUTS_SQL
+from token_sweeper import EXCESS_TOKENS_SQL, EXPIRED_BATCH_SQL
+
+
+INDEXES = {
+    # Survey history per user, newest first: WHERE user_id = ? ORDER BY id DESC
+    'idx_survey_history_user':
+        'CREATE INDEX IF NOT EXISTS idx_survey_history_user ON survey_history (user_id, id)',
+    # Token validation in require_auth: WHERE token = ? AND expires_at > ?
+    'idx_auth_tokens_token_expires':
+        'CREATE INDEX IF NOT EXISTS idx_auth_tokens_token_expires ON auth_tokens (token, expires_at)',
+    # Per-user token lookups (logout everywhere, cleanup)
+    'idx_auth_tokens_user':
+        'CREATE INDEX IF NOT EXISTS idx_auth_tokens_user ON auth_tokens (user_id)',
+    # Expired-token sweeper (token_sweeper.py)
+    'idx_auth_tokens_expires':
+        'CREATE INDEX IF NOT EXISTS idx_auth_tokens_expires ON auth_tokens (expires_at)',
+}
+
+# Token validation (runs on every authenticated request)
+AUTH_USER_BY_TOKEN = '''
+    SELECT u.id, u.email, u.first_name, u.last_name, t.expires_at
+    FROM users u
+    JOIN auth_tokens t ON u.id = t.user_id
+    WHERE t.token = ? AND t.expires_at > ?
+'''
+
+# Latest survey through the latest_surveys pointer (format in the column list)
+LATEST_SURVEY_SQL = '''
+    SELECT {columns}
+    FROM latest_surveys l
+    JOIN survey_history s ON s.id = l.survey_id
+    WHERE l.user_id = ?
+'''
+
+HAS_SURVEY_SQL = 'SELECT COUNT(*) FROM latest_surveys WHERE user_id = ?'
+
+# One page of a user's survey history, newest first (keyset pagination on id)
+SURVEY_HISTORY_SQL = '''
+    SELECT id, completed_at, ess_score, berlin_score, stopbang_score, osa_probability, risk_level, bmi
+    FROM survey_history
+    WHERE user_id = ? AND id < ?
+    ORDER BY id DESC
+    LIMIT ?
+'''
+
+# Append one survey and move the user's latest pointer to it (same transaction)
+LATEST_SURVEY_UPSERT = '''
+    INSERT INTO latest_surveys (user_id, survey_id, completed_at)
+    VALUES (?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT (user_id) DO UPDATE SET survey_id = excluded.survey_id, completed_at = excluded.completed_at
+'''
+
+# Queries that must be served from an index: name -> (sql, sample parameters)
+HOT_QUERIES = {
+    'auth_user_by_token': (AUTH_USER_BY_TOKEN, ('token', '2000-01-01')),
+    'latest_survey': (LATEST_SURVEY_SQL.format(columns='s.*'), (1,)),
+    'has_survey': (HAS_SURVEY_SQL, (1,)),
+    'survey_history_page': (SURVEY_HISTORY_SQL, (1, 2 ** 62, 20)),
+    'user_by_email': ('SELECT id, first_name, last_name, email, password_hash FROM users WHERE email = ?',
+                      ('user@example.com',)),
+    'delete_token': ('DELETE FROM auth_tokens WHERE token = ?', ('token',)),
+    'expired_tokens_batch': (EXPIRED_BATCH_SQL, ('2000-01-01', 500)),
+    'excess_tokens_for_user': (EXCESS_TOKENS_SQL, (1, 10)),
+    'recent_daily_metrics': (RECENT_DAYS_SQL, (1, 7)),
+    'daily_metrics_aggregates': (aggregates_sql(AGGREGATE_WINDOWS), {'user_id': 1, 'as_of': '2024-01-01'}),
+    'daily_metrics_existing_days': (EXISTING_DAYS_SQL, (1, '2024-01-01', '2024-01-07')),
+    'metric_rollup': (ROLLUP_SQL, (1,)),
+    'save_derived_outputs': (SAVE_OUTPUTS_SQL, (1, '{}', 1)),
+}
+
+
+def create_indexes(conn):
+    """Create any missing secondary indexes (idempotent)."""
+    for sql in INDEXES.values():
+        conn.execute(sql)
+
+
+def query_plan(conn, sql, params):
+    """EXPLAIN QUERY PLAN detail lines for one query."""
+    return [row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+
+def plan_problems(plan):
+    """Plan steps that mean a full scan or an unindexed sort."""
+    return [step for step in plan if step.startswith('SCAN') or 'TEMP B-TREE' in step]
+
+
+def check_query_plans(conn):
+    """Returns {query name: (plan, problems)} for every hot query."""
+    results = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = query_plan(conn, sql, params)
+        results[name] = (plan, plan_problems(plan))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['indexes', 'check'])
+    parser.add_argument('--db', default='wakeup_call.db')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if args.command == 'indexes':
+        create_indexes(conn)
+        conn.commit()
+        print(f"✅ Indexes present: {', '.join(INDEXES)}")
+        return
+
+    failed = 0
+    for name, (plan, problems) in check_query_plans(conn).items():
+        print(f"{'❌' if problems else '✅'} {name}")
+        for step in plan:
+            print(f"     {step}")
+        failed += bool(problems)
+    conn.close()
+    if failed:
+        print(f"{failed} hot queries fall back to a table scan or temp sort")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
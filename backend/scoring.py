@@ -0,0 +1,222 @@
+"""
+Shared model scoring for the OSA prediction endpoints.
+Every request runs a single predict_proba pass; the predicted class is the argmax
+of those probabilities instead of a second model.predict() call.
+
+When the model is a bare LightGBM classifier, rows are packed into a preallocated
+NumPy buffer and passed straight to the booster, skipping pandas DataFrame
+construction and column validation. Full sklearn Pipelines still go through a DataFrame.
+
+Results are memoized in a PredictionCache keyed by the model version and the
+quantized feature vector, so repeat submissions skip the model entirely.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from compiled_model import CompiledForest
+
+
+# Risk labels for integer-encoded classes (0=Low, 1=Intermediate, 2=High)
+RISK_LEVELS = ["Low Risk", "Intermediate Risk", "High Risk"]
+
+
+def file_fingerprint(path):
+    """Short content hash of a file (used as the model version)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def load_model_file(path):
+    """Load a pickled model (bare or wrapped in a dict) or a compiled .npz forest."""
+    if path.endswith('.npz'):
+        return CompiledForest.load(path)
+    import joblib
+    loaded = joblib.load(path)
+    return loaded.get('model') if isinstance(loaded, dict) else loaded
+
+
+@dataclass(frozen=True)
+class ScoreResult:
+    """Outcome of scoring one feature vector."""
+    class_index: int
+    risk_level: str
+    osa_probability: float  # High-risk class probability (backwards compatible field)
+    certainty: float  # Probability of the predicted class, 0-1
+    probabilities: Tuple[float, ...]
+
+    def class_probabilities(self) -> Dict[str, float]:
+        """Per-class probabilities in the API response format."""
+        p = self.probabilities
+        return {
+            'low': round(p[0], 4),
+            'intermediate': round(p[1], 4) if len(p) > 1 else 0,
+            'high': round(p[2], 4) if len(p) > 2 else 0
+        }
+
+
+class PredictionCache:
+    """Thread-safe LRU cache with a per-entry TTL, with hit/miss counters."""
+
+    def __init__(self, max_size: int = 4096, ttl_seconds: float = 3600.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, Tuple[float, ScoreResult]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[ScoreResult]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: ScoreResult):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+# Continuous inputs are rounded to this many decimals in cache keys
+CACHE_KEY_DECIMALS = 6
+
+
+class ModelScorer:
+    """
+    Wraps the loaded model for scoring.
+    Class labels are resolved through model.classes_ once, when the scorer is built.
+    A new model means a new ModelScorer, which starts with an empty cache.
+    """
+
+    def __init__(self, model, features: Sequence[str], fast_path: bool = True, dtype=np.float64,
+                 model_version: str = '', cache: Optional[PredictionCache] = None):
+        self.model = model
+        self.features = list(features)
+        self.dtype = dtype
+        self.model_version = model_version
+        self.cache = cache
+        if self.cache is not None:
+            self.cache.clear()
+        self.class_labels: List[str] = [
+            RISK_LEVELS[int(c)] if isinstance(c, (int, np.integer)) else str(c)
+            for c in model.classes_
+        ]
+        self.booster = self._find_booster(model) if fast_path else None
+        self._local = threading.local()
+
+    @staticmethod
+    def _find_booster(model):
+        """Return the LightGBM booster if the model can be scored from raw arrays, else None."""
+        if isinstance(model, CompiledForest):
+            # Same predict() contract as lightgbm.Booster
+            return model
+        if hasattr(model, 'steps'):
+            # sklearn Pipeline - preprocessing steps may select columns by name
+            return None
+        return getattr(model, 'booster_', None)
+
+    @property
+    def uses_fast_path(self) -> bool:
+        return self.booster is not None
+
+    def _row_buffer(self) -> np.ndarray:
+        """Per-thread, preallocated (1, n_features) C-contiguous input row."""
+        buf = getattr(self._local, 'row', None)
+        if buf is None:
+            buf = np.empty((1, len(self.features)), dtype=self.dtype)
+            self._local.row = buf
+        return buf
+
+    def _booster_proba(self, X: np.ndarray) -> np.ndarray:
+        """Class probabilities straight from the booster (same output as predict_proba)."""
+        proba = self.booster.predict(X)
+        if proba.ndim == 1:
+            # Binary objective returns P(class 1) only
+            proba = np.column_stack([1.0 - proba, proba])
+        return proba
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Class probabilities for a 2-D array of rows in feature order."""
+        if self.booster is not None:
+            return self._booster_proba(np.ascontiguousarray(X, dtype=self.dtype))
+        import pandas as pd  # only sklearn Pipelines need it; keeps worker start-up light
+        return self.model.predict_proba(pd.DataFrame(X, columns=self.features))
+
+    def cache_key(self, values: Sequence) -> Tuple:
+        """Canonical key: model version + ordered feature values as rounded floats."""
+        return (self.model_version,) + tuple(round(float(v), CACHE_KEY_DECIMALS) for v in values)
+
+    def score(self, input_features: Dict) -> ScoreResult:
+        """Score a single feature dict (keys must cover all features)."""
+        return self.score_row([input_features[f] for f in self.features])
+
+    def score_row(self, values: Sequence) -> ScoreResult:
+        """Score one row of feature values in feature order (e.g. a feature_matrix row)."""
+        key = None
+        if self.cache is not None:
+            key = self.cache_key(values)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        if self.booster is None:
+            X = np.array([values], dtype=self.dtype)
+            result = self.result_from_proba(self.predict_proba(X)[0])
+        else:
+            buf = self._row_buffer()
+            buf[0, :] = values
+            result = self.result_from_proba(self._booster_proba(buf)[0])
+
+        if key is not None:
+            self.cache.put(key, result)
+        return result
+
+    def result_from_proba(self, proba: np.ndarray) -> ScoreResult:
+        """Build a ScoreResult from one row of class probabilities."""
+        class_idx = int(np.argmax(proba))
+        certainty = float(proba[class_idx])
+        return ScoreResult(
+            class_index=class_idx,
+            risk_level=self.class_labels[class_idx],
+            osa_probability=float(proba[2]) if len(proba) > 2 else certainty,
+            certainty=certainty,
+            probabilities=tuple(float(p) for p in proba)
+        )
@@ -0,0 +1,187 @@
+"""
+Derived survey outputs, computed once per survey instead of on every read.
+
+get_latest_survey and the PDF report used to rerun the recommendation engine and
+rebuild the score categories and top risk factors from the stored survey columns
+on every request, although those only change on submit. derive_outputs now runs
+when the survey is saved and the result is stored on the survey_history row as
+compact JSON (derived_json) tagged with OUTPUTS_VERSION (derived_version), which
+follows the engine's RULES_VERSION, so a rules change needs no manual bump. The
+recommendation is kept as its rule mask; the text comes from the engine's
+per-mask cache. A read that finds no outputs, or outputs from another version,
+recomputes them from the row and tries to save them back, so after a rules
+change each survey is usually recomputed once, on its next read. The save is
+best effort and never fails or stalls the read.
+"""
+
+import hashlib
+import json
+
+from recommendation_engine import RULES_VERSION, RecommendationEngine, api_text_for_mask
+
+
+# Bump whenever the derivations below change; rule changes come in through RULES_VERSION
+DERIVATION_VERSION = 1
+
+# Stored in derived_version (a 60-bit integer, so it fits an SQLite INTEGER)
+OUTPUTS_VERSION = int(hashlib.sha256(f'{DERIVATION_VERSION}:{RULES_VERSION}'.encode()).hexdigest()[:15], 16)
+
+# survey_history columns derive_outputs reads
+INPUT_COLUMNS = ('age', 'bmi', 'neck_circumference_cm', 'hypertension', 'diabetes', 'smokes', 'alcohol',
+                 'ess_score', 'berlin_score', 'stopbang_score', 'risk_level', 'sleep_duration_hours',
+                 'daily_steps')
+
+# Columns a reader selects, next to INPUT_COLUMNS, to use load_outputs
+STORED_COLUMNS = ('id', 'derived_version', 'derived_json')
+
+SAVE_OUTPUTS_SQL = 'UPDATE survey_history SET derived_version = ?, derived_json = ? WHERE id = ?'
+
+# How long a read waits for the write lock when saving refreshed outputs
+SAVE_BUSY_TIMEOUT_MS = 50
+
+
+def score_categories(ess_score, berlin_score, stopbang_score):
+    """Dashboard categories for the stored (ESS total, Berlin 0/1, STOP-BANG) scores."""
+    if ess_score < 8:
+        ess_category = "Normal"
+    elif ess_score < 12:
+        ess_category = "Mild"
+    elif ess_score < 16:
+        ess_category = "Moderate"
+    else:
+        ess_category = "Severe"
+
+    berlin_category = "High Risk" if berlin_score >= 2 else "Low Risk"
+
+    if stopbang_score < 3:
+        stopbang_category = "Low Risk"
+    elif stopbang_score < 5:
+        stopbang_category = "Intermediate Risk"
+    else:
+        stopbang_category = "High Risk"
+
+    return {'ess': ess_category, 'berlin': berlin_category, 'stopbang': stopbang_category}
+
+
+def top_risk_factors(age, bmi, ess_score, stopbang_score, hypertension):
+    """Up to five dashboard risk factors, most important first."""
+    top_factors = []
+    if bmi >= 30:
+        top_factors.append({
+            'factor': f'High BMI ({bmi:.1f})',
+            'detail': 'Obesity significantly increases OSA risk',
+            'impact': 'High',
+            'priority': '1'
+        })
+    if stopbang_score >= 5:
+        top_factors.append({
+            'factor': f'High STOP-BANG Score ({stopbang_score})',
+            'detail': 'Multiple OSA risk factors present',
+            'impact': 'High',
+            'priority': '2'
+        })
+    if ess_score >= 11:
+        top_factors.append({
+            'factor': f'Excessive Daytime Sleepiness (ESS: {ess_score})',
+            'detail': 'Significant sleepiness during daytime',
+            'impact': 'Medium',
+            'priority': '3'
+        })
+    if age >= 50:
+        top_factors.append({
+            'factor': f'Age ({age} years)',
+            'detail': 'OSA risk increases with age',
+            'impact': 'Medium',
+            'priority': '4'
+        })
+    if hypertension:
+        top_factors.append({
+            'factor': 'Hypertension',
+            'detail': 'High blood pressure linked to OSA',
+            'impact': 'Medium',
+            'priority': '5'
+        })
+    return top_factors[:5]
+
+
+def derive_outputs(survey):
+    """Derived outputs for a survey, given a mapping (e.g. a sqlite3.Row) of INPUT_COLUMNS."""
+    rule_mask = RecommendationEngine.rule_mask(
+        age=survey['age'],
+        sex=1,  # Default to male (conservative for OSA risk), as generate_ml_recommendation does
+        bmi=survey['bmi'],
+        neck_cm=survey['neck_circumference_cm'],
+        hypertension=bool(survey['hypertension']),
+        diabetes=bool(survey['diabetes']),
+        smokes=bool(survey['smokes']),
+        alcohol=bool(survey['alcohol']),
+        ess_score=survey['ess_score'],
+        berlin_score=survey['berlin_score'],
+        stopbang_score=survey['stopbang_score'],
+        sleep_duration=survey['sleep_duration_hours'] or 7.0,
+        daily_steps=survey['daily_steps'] or 5000,
+        risk_level=survey['risk_level']
+    )
+    return {
+        'rule_mask': rule_mask,
+        'categories': score_categories(survey['ess_score'], survey['berlin_score'], survey['stopbang_score']),
+        'top_risk_factors': top_risk_factors(survey['age'], survey['bmi'], survey['ess_score'],
+                                             survey['stopbang_score'], survey['hypertension'])
+    }
+
+
+def serialize(outputs):
+    return json.dumps(outputs, separators=(',', ':'))
+
+
+def recommendation_text(outputs):
+    """Pipe-separated recommendation text (format_for_api) for derived outputs."""
+    return api_text_for_mask(outputs['rule_mask'])
+
+
+def stored_outputs(survey):
+    """Outputs saved on a survey row, or None if missing, unreadable or from another OUTPUTS_VERSION."""
+    if survey['derived_version'] != OUTPUTS_VERSION or not survey['derived_json']:
+        return None
+    try:
+        return json.loads(survey['derived_json'])
+    except ValueError:
+        return None
+
+
+def save_outputs(conn, survey_id, outputs):
+    """
+    Best-effort save of outputs recomputed on a read. Skipped if `conn` has
+    uncommitted work (which must not be committed on the caller's behalf); waits
+    at most SAVE_BUSY_TIMEOUT_MS for the write lock and never raises. Returns
+    whether the outputs were saved.
+    """
+    if conn.in_transaction:
+        return False
+    try:
+        busy_timeout = conn.execute('PRAGMA busy_timeout').fetchone()[0]
+        conn.execute(f'PRAGMA busy_timeout={SAVE_BUSY_TIMEOUT_MS}')
+        try:
+            with conn:
+                conn.execute(SAVE_OUTPUTS_SQL, (OUTPUTS_VERSION, serialize(outputs), survey_id))
+        finally:
+            conn.execute(f'PRAGMA busy_timeout={int(busy_timeout)}')
+        return True
+    except Exception as e:
+        print(f"⚠️ Could not save derived outputs for survey {survey_id}: {e}")
+        return False
+
+
+def load_outputs(conn, survey):
+    """
+    Outputs for a survey row holding INPUT_COLUMNS and STORED_COLUMNS; stale
+    ones are recomputed and saved back with save_outputs (a failed save only
+    means the next read recomputes again).
+    """
+    outputs = stored_outputs(survey)
+    if outputs is not None:
+        return outputs
+
+    outputs = derive_outputs(survey)
+    save_outputs(conn, survey['id'], outputs)
+    return outputs
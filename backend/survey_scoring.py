@@ -0,0 +1,417 @@
+"""
+ESS, Berlin and STOP-BANG questionnaire scoring, one respondent or whole columns.
+
+The scalar calculate_* functions score one survey (/survey/submit, /survey/calculate).
+The *_scores functions score NumPy arrays of respondents in one pass and return
+score arrays plus category codes (indexes into the *_CATEGORIES lists) for
+/survey/calculate/batch, research exports and backfills. tests/test_survey_scoring.py
+compares the two on random and boundary inputs.
+
+Usage:
+    python survey_scoring.py score responses.jsonl [-o scores.csv] [--chunk 100000]
+    python survey_scoring.py score responses.csv [-o scores.csv] [--chunk 100000]
+
+`score` reads one /survey/calculate record per line (JSON), or a flat CSV export
+(see _csv_chunks), and writes one CSV row per record.
+"""
+
+import argparse
+import csv
+import json
+import sys
+import time
+
+import numpy as np
+
+
+# Category labels, indexed by the category codes the array functions return
+ESS_CATEGORIES = [
+    "Low daytime sleepiness (normal)",
+    "High daytime sleepiness (normal)",
+    "Mild excessive daytime sleepiness",
+    "Moderate excessive daytime sleepiness",
+    "Severe excessive daytime sleepiness",
+    "Invalid",
+]
+BERLIN_CATEGORIES = ["Low Risk", "High Risk"]
+STOPBANG_CATEGORIES = ["Low Risk", "Intermediate Risk", "High Risk"]
+OVERALL_RISK_LEVELS = ["Low", "Moderate", "High"]
+
+# /survey/calculate inputs and their defaults
+CALCULATE_NUMBERS = {'bmi': 25.0, 'age': 30, 'neck_circumference': 37.0}
+CALCULATE_FLAGS = {
+    'berlin_category3_sleepy': False, 'male': True, 'snoring': False,
+    'tired': False, 'observed_apnea': False, 'hypertension': False
+}
+
+
+def calculate_ess_score(responses):
+    """
+    Calculate Epworth Sleepiness Scale (ESS) score from survey responses.
+    responses: list of 8 integers (0-3 for each question)
+    Returns: (score, category)
+    """
+    score = sum(responses)
+    
+    if score <= 5:
+        category = "Low daytime sleepiness (normal)"
+    elif score <= 10:
+        category = "High daytime sleepiness (normal)"
+    elif score in [11, 12]:
+        category = "Mild excessive daytime sleepiness"
+    elif score in range(13, 16):
+        category = "Moderate excessive daytime sleepiness"
+    elif score in range(16, 25):
+        category = "Severe excessive daytime sleepiness"
+    else:
+        category = "Invalid"
+    
+    return score, category
+
+
+def calculate_berlin_score(category1_items, category2_items, category3_sleepy, bmi):
+    """
+    Calculate Berlin Questionnaire score.
+    Returns: (positive_categories_count, risk_category)
+    """
+    positive_categories = 0
+    
+    # Category 1: Snoring and breathing (items 2-6)
+    cat1_score = sum(1 for v in category1_items.values() if v)
+    if cat1_score >= 2:
+        positive_categories += 1
+    
+    # Category 2: Daytime sleepiness (items 7-9)
+    cat2_score = sum(1 for v in category2_items.values() if v)
+    if cat2_score >= 2:
+        positive_categories += 1
+    
+    # Category 3: Sleepiness or BMI > 30
+    if category3_sleepy or bmi > 30:
+        positive_categories += 1
+    
+    risk_category = "High Risk" if positive_categories >= 2 else "Low Risk"
+    
+    return positive_categories, risk_category
+
+
+def calculate_stopbang_score(snoring, tired, observed, pressure, age, neck_circumference, bmi, male):
+    """
+    Calculate STOP-BANG score.
+    Returns: (total_score, risk_category)
+    """
+    total_score = 0
+    stop_score = 0
+    
+    # STOP questions
+    if snoring:
+        total_score += 1
+        stop_score += 1
+    if tired:
+        total_score += 1
+        stop_score += 1
+    if observed:
+        total_score += 1
+        stop_score += 1
+    if pressure:
+        total_score += 1
+        stop_score += 1
+    
+    # BANG questions
+    if age > 50:
+        total_score += 1
+    if neck_circumference >= 40.0:
+        total_score += 1
+    if bmi > 35:
+        total_score += 1
+    if male:
+        total_score += 1
+    
+    # Determine risk level according to README.md
+    if total_score >= 5:
+        risk_category = "High Risk"
+    elif stop_score >= 2 and (male or bmi > 35 or neck_circumference >= 40.0):
+        risk_category = "High Risk"
+    elif total_score in range(3, 5):
+        risk_category = "Intermediate Risk"
+    else:
+        risk_category = "Low Risk"
+    
+    return total_score, risk_category
+
+
+def overall_risk_level(ess_category, berlin_category, stopbang_category):
+    """Overall risk from the three questionnaire categories: High if 2+ are high, Moderate if 1"""
+    high_risk_count = 0
+    if "Severe" in ess_category or "Moderate" in ess_category:
+        high_risk_count += 1
+    if berlin_category == "High Risk":
+        high_risk_count += 1
+    if stopbang_category == "High Risk":
+        high_risk_count += 1
+    
+    return "High" if high_risk_count >= 2 else ("Moderate" if high_risk_count >= 1 else "Low")
+
+
+def ess_scores(responses):
+    """
+    ESS for an (n, items) array of answers (0-3 each, pad unanswered items with 0).
+    Returns (scores, category codes into ESS_CATEGORIES).
+    """
+    score = np.asarray(responses, dtype=np.float64).sum(axis=1)
+    # The scalar version only puts whole scores into the upper bands
+    whole = score == np.floor(score)
+    code = np.select(
+        [score <= 5, score <= 10,
+         whole & (score >= 11) & (score <= 12),
+         whole & (score >= 13) & (score <= 15),
+         whole & (score >= 16) & (score <= 24)],
+        [0, 1, 2, 3, 4], default=5)
+    return score, code.astype(np.int8)
+
+
+def berlin_scores(category1_positive, category2_positive, category3_sleepy, bmi):
+    """
+    Berlin Questionnaire for arrays: positive item counts in categories 1 and 2,
+    the category 3 sleepiness flag and BMI. Returns (positive category counts,
+    category codes into BERLIN_CATEGORIES).
+    """
+    positive = ((np.asarray(category1_positive) >= 2).astype(np.int8)
+                + (np.asarray(category2_positive) >= 2)
+                + (np.asarray(category3_sleepy, dtype=bool) | (np.asarray(bmi) > 30)))
+    return positive, (positive >= 2).astype(np.int8)
+
+
+def stopbang_scores(snoring, tired, observed, pressure, age, neck_circumference, bmi, male):
+    """
+    STOP-BANG for arrays (flags as bools). Returns (total scores, category codes
+    into STOPBANG_CATEGORIES).
+    """
+    snoring, tired, observed, pressure, male = (
+        np.asarray(v, dtype=bool) for v in (snoring, tired, observed, pressure, male))
+    age, neck_circumference, bmi = (np.asarray(v, dtype=np.float64) for v in (age, neck_circumference, bmi))
+
+    stop = snoring.astype(np.int8) + tired + observed + pressure
+    large_neck = neck_circumference >= 40.0
+    obese = bmi > 35
+    total = stop + (age > 50) + large_neck + obese + male
+    code = np.select(
+        [total >= 5, (stop >= 2) & (male | obese | large_neck), (total >= 3) & (total <= 4)],
+        [2, 2, 1], default=0)
+    return total, code.astype(np.int8)
+
+
+def overall_risk_codes(ess_code, berlin_code, stopbang_code):
+    """overall_risk_level() for arrays of category codes; codes into OVERALL_RISK_LEVELS"""
+    high_risk_count = (np.isin(ess_code, (3, 4)).astype(np.int8)
+                       + (np.asarray(berlin_code) == 1) + (np.asarray(stopbang_code) == 2))
+    return np.minimum(high_risk_count, 2).astype(np.int8)
+
+
+def numeric_column(values, errors, default=np.nan, message='All values must be numeric'):
+    """
+    float64 array of record values (None for missing, replaced by `default`);
+    rows holding something non-numeric are added to errors with `message`.
+    """
+    try:
+        column = np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        column = np.full(len(values), np.nan)
+        for i, value in enumerate(values):
+            try:
+                column[i] = np.float64(value if value is not None else np.nan)
+            except (TypeError, ValueError):
+                errors.setdefault(i, message)
+    return np.where(np.isnan(column), default, column)
+
+
+def _positive_items(records, key, errors):
+    counts = np.fromiter(
+        (sum(map(bool, items.values())) if isinstance(items, dict) else -1
+         for items in (record.get(key, {}) for record in records)),
+        dtype=np.int64, count=len(records))
+    for i in np.flatnonzero(counts < 0).tolist():
+        errors.setdefault(i, f'{key} must be an object')
+        counts[i] = 0
+    return counts
+
+
+def _ess_matrix(records, errors):
+    answers = [record.get('ess_responses', []) for record in records]
+    try:
+        responses = np.array(answers, dtype=np.float64)
+        if responses.ndim == 2:
+            return responses
+    except (TypeError, ValueError):
+        pass
+    # Ragged or malformed: pad row by row
+    width = max((len(a) for a in answers if isinstance(a, list)), default=0)
+    responses = np.zeros((len(answers), width))
+    for i, items in enumerate(answers):
+        try:
+            responses[i, :len(items)] = items
+        except (TypeError, ValueError):
+            errors.setdefault(i, 'ess_responses must be a list of numbers')
+    return responses
+
+
+def score_records(records):
+    """
+    Score /survey/calculate style records (same fields and defaults) in one pass.
+    Returns (scores, errors): a dict of arrays (ess_score, ess_category, berlin_score,
+    berlin_category, stopbang_score, stopbang_category, overall_risk - categories as
+    codes) with one entry per record, and row index -> message for bad records.
+    """
+    errors = {i: 'Record must be a JSON object' for i, r in enumerate(records) if not isinstance(r, dict)}
+    records = [r if isinstance(r, dict) else {} for r in records]
+    n = len(records)
+
+    numbers = {
+        key: numeric_column([r.get(key) for r in records], errors, default)
+        for key, default in CALCULATE_NUMBERS.items()
+    }
+    flags = {
+        key: np.fromiter((bool(r.get(key, default)) for r in records), dtype=bool, count=n)
+        for key, default in CALCULATE_FLAGS.items()
+    }
+
+    scores = score_columns(
+        _ess_matrix(records, errors),
+        _positive_items(records, 'berlin_category1', errors),
+        _positive_items(records, 'berlin_category2', errors),
+        **numbers, **flags)
+    return scores, errors
+
+
+def score_columns(ess_responses, berlin_category1, berlin_category2, berlin_category3_sleepy,
+                  bmi, age, neck_circumference, male, snoring, tired, observed_apnea, hypertension):
+    """
+    Score surveys given as columns: an (n, items) ESS answer array, positive item
+    counts for Berlin categories 1 and 2, and one array per other /survey/calculate
+    input. Returns the score_records() dict of arrays.
+    """
+    ess_score, ess_category = ess_scores(ess_responses)
+    berlin_score, berlin_category = berlin_scores(berlin_category1, berlin_category2,
+                                                  berlin_category3_sleepy, bmi)
+    stopbang_score, stopbang_category = stopbang_scores(snoring, tired, observed_apnea, hypertension,
+                                                        age, neck_circumference, bmi, male)
+    return {
+        'ess_score': ess_score,
+        'ess_category': ess_category,
+        'berlin_score': berlin_score,
+        'berlin_category': berlin_category,
+        'stopbang_score': stopbang_score,
+        'stopbang_category': stopbang_category,
+        'overall_risk': overall_risk_codes(ess_category, berlin_category, stopbang_category)
+    }
+
+
+def score_rows(scores):
+    """Per-record results of score_records() in the /survey/calculate response format"""
+    ess_score = [int(s) if s.is_integer() else s for s in scores['ess_score'].tolist()]
+    return [
+        {
+            'ess': {'score': ess, 'category': ESS_CATEGORIES[ess_code]},
+            'berlin': {'score': berlin, 'category': BERLIN_CATEGORIES[berlin_code]},
+            'stopbang': {'score': stopbang, 'category': STOPBANG_CATEGORIES[stopbang_code]},
+            'overall_risk_level': OVERALL_RISK_LEVELS[overall]
+        }
+        for ess, ess_code, berlin, berlin_code, stopbang, stopbang_code, overall in zip(
+            ess_score, scores['ess_category'].tolist(),
+            scores['berlin_score'].tolist(), scores['berlin_category'].tolist(),
+            scores['stopbang_score'].tolist(), scores['stopbang_category'].tolist(),
+            scores['overall_risk'].tolist())
+    ]
+
+
+def _jsonl_chunks(path, chunk_size):
+    """(scores, errors) per chunk of a JSONL file of /survey/calculate records"""
+    with (sys.stdin if path == '-' else open(path)) as source:
+        chunk = []
+        for line in source:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                chunk.append(json.loads(line))
+            except ValueError:
+                chunk.append(None)
+            if len(chunk) == chunk_size:
+                yield score_records(chunk)
+                chunk = []
+        if chunk:
+            yield score_records(chunk)
+
+
+def _csv_chunks(path, chunk_size):
+    """
+    (scores, errors) per chunk of a flat CSV export: ess_1 ... ess_8 answer columns,
+    berlin_category1 / berlin_category2 as positive item counts, and the other
+    /survey/calculate inputs by name (0/1 for flags). Missing columns take the defaults.
+    """
+    import pandas as pd  # only needed for CSV input
+
+    for frame in pd.read_csv(sys.stdin if path == '-' else path, chunksize=chunk_size):
+        ess_columns = sorted((c for c in frame.columns if c.startswith('ess_')), key=lambda c: int(c[4:]))
+
+        def column(name, default, dtype=np.float64):
+            return frame[name].fillna(default).to_numpy(dtype=dtype) if name in frame else default
+
+        yield score_columns(
+            frame[ess_columns].fillna(0).to_numpy(dtype=np.float64).reshape(len(frame), len(ess_columns)),
+            column('berlin_category1', 0),
+            column('berlin_category2', 0),
+            **{key: column(key, default) for key, default in CALCULATE_NUMBERS.items()},
+            **{key: column(key, default, bool) for key, default in CALCULATE_FLAGS.items()}
+        ), {}
+
+
+def score_file(args):
+    """Score a JSONL or CSV file chunk by chunk, writing one CSV row per record"""
+    chunks = (_csv_chunks if args.input.endswith('.csv') else _jsonl_chunks)(args.input, args.chunk)
+    labels = {
+        'ess_category': np.array(ESS_CATEGORIES),
+        'berlin_category': np.array(BERLIN_CATEGORIES),
+        'stopbang_category': np.array(STOPBANG_CATEGORIES),
+        'overall_risk': np.array(OVERALL_RISK_LEVELS)
+    }
+    target = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    writer = csv.writer(target)
+    writer.writerow(['index', 'ess_score', 'ess_category', 'berlin_score', 'berlin_category',
+                     'stopbang_score', 'stopbang_category', 'overall_risk_level', 'error'])
+    index = failed = 0
+    start = time.perf_counter()
+    with target:
+        for scores, errors in chunks:
+            n = len(scores['ess_score'])
+            columns = [
+                scores[name] if name not in labels else labels[name][scores[name]]
+                for name in ('ess_score', 'ess_category', 'berlin_score', 'berlin_category',
+                             'stopbang_score', 'stopbang_category', 'overall_risk')
+            ]
+            columns = [column.tolist() for column in columns]
+            columns[0] = [int(s) if s.is_integer() else s for s in columns[0]]
+            writer.writerows(
+                [i] + [''] * 7 + [errors[i - index]] if i - index in errors else (i, *row, '')
+                for i, *row in zip(range(index, index + n), *columns))
+            index += n
+            failed += len(errors)
+    elapsed = time.perf_counter() - start
+    print(f"✅ Scored {index - failed} records ({failed} failed) in {elapsed:.1f}s "
+          f"({index / max(elapsed, 1e-9):,.0f} records/s)", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('score', help='score a JSONL file of survey records into CSV')
+    p.add_argument('input', help="JSONL or .csv file, or - for JSONL on stdin")
+    p.add_argument('-o', '--output', default='-')
+    p.add_argument('--chunk', type=int, default=100000)
+    p.set_defaults(func=score_file)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
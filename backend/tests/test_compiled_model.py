@@ -0,0 +1,37 @@
+"""CompiledForest must reproduce LightGBM's predict_proba."""
+
+import numpy as np
+import pytest
+
+lightgbm = pytest.importorskip('lightgbm')
+
+from compiled_model import CompiledForest, check_parity, parity_grid
+
+
+def train_classifier(n_classes, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(600, 8))
+    X[:, 3] = rng.integers(0, 2, 600)  # binary column, like the survey flags
+    X[rng.random(X.shape) < 0.05] = np.nan  # exercise missing-value routing
+    score = np.nan_to_num(X[:, 0] + X[:, 1] * X[:, 3] - X[:, 2])
+    y = np.digitize(score, np.quantile(score, np.linspace(0, 1, n_classes + 1)[1:-1]))
+    model = lightgbm.LGBMClassifier(n_estimators=25, num_leaves=15, min_child_samples=5, verbose=-1)
+    return model.fit(X, y), X
+
+
+@pytest.mark.parametrize('n_classes', [2, 3])
+def test_predict_proba_parity(n_classes):
+    model, X = train_classifier(n_classes)
+    forest = CompiledForest.from_model(model)
+
+    assert forest.predict_proba(X) == pytest.approx(model.predict_proba(X), abs=1e-9)
+    assert check_parity(model, forest, parity_grid(forest)) < 1e-9
+    assert list(forest.classes_) == list(model.classes_)
+
+
+def test_saved_forest_matches(tmp_path):
+    model, X = train_classifier(3, seed=1)
+    path = str(tmp_path / 'model.npz')
+    CompiledForest.from_model(model).save(path)
+
+    assert CompiledForest.load(path).predict_proba(X) == pytest.approx(model.predict_proba(X), abs=1e-9)
@@ -0,0 +1,52 @@
+"""metric_rollups must count each day once, however many writers apply it."""
+
+import sqlite3
+import threading
+
+import pytest
+
+import daily_metrics
+import migrations
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'metrics.db')
+    conn = sqlite3.connect(path)
+    migrations.migrate(conn)
+    conn.close()
+    return path
+
+
+def connect(path):
+    return sqlite3.connect(path, timeout=5, check_same_thread=False)
+
+
+def test_same_day_from_two_connections_counts_once(db_path):
+    first, second = connect(db_path), connect(db_path)
+    rows = [(1, '2026-10-01', 8000, 7.5)]
+
+    # The first sync is mid-transaction when the second one starts
+    daily_metrics.apply_daily_rows(first, 1, rows)
+    other = threading.Thread(target=lambda: (daily_metrics.apply_daily_rows(second, 1, rows), second.commit()))
+    other.start()
+    other.join(timeout=0.2)  # let it read (or wait for the write lock) before the first commits
+    first.commit()
+    other.join()
+
+    assert daily_metrics.rollup(first, 1) == {
+        'average_daily_steps': 8000, 'average_sleep_hours': 7.5,
+        'days_with_steps': 1, 'days_with_sleep': 1, 'latest_date': '2026-10-01'
+    }
+
+
+def test_updated_day_replaces_its_value(db_path):
+    conn = connect(db_path)
+    daily_metrics.apply_daily_rows(conn, 1, [(1, '2026-10-01', 8000, None), (1, '2026-10-02', 4000, 6.0)])
+    conn.commit()
+    daily_metrics.apply_daily_rows(conn, 1, [(1, '2026-10-02', 6000, None)])
+    conn.commit()
+
+    rollup = daily_metrics.rollup(conn, 1)
+    assert (rollup['average_daily_steps'], rollup['days_with_steps']) == (7000, 2)
+    assert (rollup['average_sleep_hours'], rollup['days_with_sleep']) == (6.0, 1)
@@ -0,0 +1,66 @@
+"""A /survey/submit payload must score end to end: survey_features -> ModelScorer."""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+lightgbm = pytest.importorskip('lightgbm')
+
+from features import FEATURES, survey_features
+from scoring import ModelScorer, load_model_file
+
+SHIPPED_MODEL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'lightgbm_sleep_apnea_model.pkl')
+
+PAYLOAD = {
+    'demographics': {'age': 52, 'sex': 'male', 'height_cm': 175, 'weight_kg': 98, 'neck_circumference_cm': 43},
+    'medical_history': {'hypertension': True, 'diabetes': False, 'smokes': False, 'alcohol': True},
+    'survey_responses': {
+        'ess_responses': [2, 3, 1, 2, 1, 0, 2, 1],
+        'berlin_responses': {'category1': {'snoring': True, 'loud': True}, 'category2': {'tired': True}},
+        'stopbang_responses': {'snoring': True, 'tired': True, 'observed_apnea': False, 'hypertension': True},
+    },
+}
+
+
+def train_classifier(seed=0):
+    """A small 3-class model over FEATURES, trained on survey-shaped rows."""
+    rng = np.random.default_rng(seed)
+    payloads = [{
+        'demographics': {'age': int(rng.integers(18, 85)), 'sex': 'male' if rng.random() < 0.5 else 'female',
+                         'height_cm': float(rng.uniform(150, 195)), 'weight_kg': float(rng.uniform(45, 140)),
+                         'neck_circumference_cm': float(rng.uniform(30, 48))},
+        'medical_history': {'hypertension': bool(rng.random() < 0.3)},
+        'survey_responses': {'ess_responses': rng.integers(0, 4, 8).tolist()},
+    } for _ in range(400)]
+    X = pd.DataFrame(survey_features(payloads), columns=FEATURES)
+    y = np.digitize(X['BMI'], [25, 32])
+    model = lightgbm.LGBMClassifier(n_estimators=20, num_leaves=7, min_child_samples=5, verbose=-1)
+    return model.fit(X, y)
+
+
+@pytest.mark.parametrize('fast_path', [True, False])
+def test_survey_payload_scores(fast_path):
+    model = train_classifier()
+    scorer = ModelScorer(model, FEATURES, fast_path=fast_path)
+    X = survey_features([PAYLOAD])
+
+    assert X.shape == (1, len(FEATURES))
+    result = scorer.score_row(X[0])
+    expected = model.predict_proba(pd.DataFrame(X, columns=FEATURES))[0]
+    assert result.probabilities == pytest.approx(expected, abs=1e-12)
+    assert result.risk_level == scorer.class_labels[int(np.argmax(result.probabilities))]
+
+
+@pytest.mark.xfail(strict=True, raises=lightgbm.basic.LightGBMError,
+                   reason='the shipped model was trained on 33 features (feature_list.pkl) but FEATURES '
+                          'has 25; Airway_Composite and the Age_Group bins cannot be recovered from the '
+                          'artifacts, so /survey/submit scoring fails until the model is retrained')
+def test_survey_payload_scores_with_shipped_model():
+    if not os.path.exists(SHIPPED_MODEL):
+        pytest.skip('shipped model not present')
+    scorer = ModelScorer(load_model_file(SHIPPED_MODEL), FEATURES)
+    result = scorer.score_row(survey_features([PAYLOAD])[0])
+    assert sum(result.probabilities) == pytest.approx(1.0)
@@ -0,0 +1,62 @@
+"""Outputs recomputed on a read are saved back best effort: a failed save never fails the read."""
+
+import sqlite3
+
+import pytest
+
+import survey_outputs
+
+SURVEY = {
+    'id': 1, 'age': 55, 'bmi': 32.7, 'neck_circumference_cm': 43, 'hypertension': 1, 'diabetes': 0,
+    'smokes': 0, 'alcohol': 1, 'ess_score': 14, 'berlin_score': 1, 'stopbang_score': 5,
+    'risk_level': 'High Risk', 'sleep_duration_hours': 6.0, 'daily_steps': 2500,
+    'derived_version': None, 'derived_json': None,
+}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'surveys.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE survey_history (id INTEGER PRIMARY KEY, derived_version INTEGER, derived_json TEXT)')
+    conn.execute('INSERT INTO survey_history (id) VALUES (1)')
+    conn.commit()
+    conn.close()
+    return path
+
+
+def stored(path):
+    conn = sqlite3.connect(path)
+    row = conn.execute('SELECT derived_version, derived_json FROM survey_history WHERE id = 1').fetchone()
+    conn.close()
+    return row
+
+
+def test_stale_outputs_are_saved_back(db_path):
+    conn = sqlite3.connect(db_path)
+    outputs = survey_outputs.load_outputs(conn, SURVEY)
+
+    assert outputs == survey_outputs.derive_outputs(SURVEY)
+    assert stored(db_path) == (survey_outputs.OUTPUTS_VERSION, survey_outputs.serialize(outputs))
+
+
+def test_locked_database_does_not_fail_the_read(db_path):
+    writer = sqlite3.connect(db_path, isolation_level=None)
+    writer.execute('BEGIN IMMEDIATE')
+    conn = sqlite3.connect(db_path, timeout=5)
+    try:
+        assert survey_outputs.load_outputs(conn, SURVEY) == survey_outputs.derive_outputs(SURVEY)
+        assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 5000
+    finally:
+        writer.execute('ROLLBACK')
+    assert stored(db_path) == (None, None)
+
+
+def test_callers_transaction_is_not_committed(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE survey_history SET derived_json = 'pending' WHERE id = 1")
+
+    assert survey_outputs.load_outputs(conn, SURVEY) == survey_outputs.derive_outputs(SURVEY)
+    assert conn.in_transaction
+    conn.rollback()
+    assert stored(db_path) == (None, None)
@@ -0,0 +1,71 @@
+"""Array scoring (score_records and the *_scores functions) must match the scalar calculate_* functions."""
+
+import numpy as np
+import pytest
+
+from survey_scoring import (calculate_berlin_score, calculate_ess_score, calculate_stopbang_score,
+                            overall_risk_level, score_records, score_rows)
+
+
+def random_records(rows, seed):
+    """Random /survey/calculate records, concentrated around every threshold"""
+    rng = np.random.default_rng(seed)
+    items = lambda prefix, count: {f'{prefix}{k}': bool(v) for k, v in enumerate(rng.integers(0, 2, count))}
+    records = []
+    for _ in range(rows):
+        records.append({
+            'ess_responses': rng.integers(0, 4, int(rng.integers(0, 10))).tolist(),
+            'berlin_category1': items('item', int(rng.integers(0, 6))),
+            'berlin_category2': items('item', int(rng.integers(0, 4))),
+            'berlin_category3_sleepy': bool(rng.integers(0, 2)),
+            'bmi': float(rng.choice([29.9, 30, 30.1, 34.9, 35, 35.1, rng.uniform(15, 50)])),
+            'age': int(rng.choice([49, 50, 51, rng.integers(18, 90)])),
+            'neck_circumference': float(rng.choice([39.9, 40, 40.1, rng.uniform(28, 50)])),
+            'male': bool(rng.integers(0, 2)),
+            'snoring': bool(rng.integers(0, 2)),
+            'tired': bool(rng.integers(0, 2)),
+            'observed_apnea': bool(rng.integers(0, 2)),
+            'hypertension': bool(rng.integers(0, 2))
+        })
+    # Fractional and out-of-range ESS totals exercise the "Invalid" band
+    for record, extra in zip(records[:60], np.arange(-2, 28, 0.5)):
+        record['ess_responses'] = [float(extra)]
+    return records
+
+
+def scalar_row(record):
+    """The /survey/calculate result for one record, from the scalar functions"""
+    ess = calculate_ess_score(record['ess_responses'])
+    berlin = calculate_berlin_score(record['berlin_category1'], record['berlin_category2'],
+                                    record['berlin_category3_sleepy'], record['bmi'])
+    stopbang = calculate_stopbang_score(record['snoring'], record['tired'], record['observed_apnea'],
+                                        record['hypertension'], record['age'],
+                                        record['neck_circumference'], record['bmi'], record['male'])
+    return {
+        'ess': {'score': ess[0], 'category': ess[1]},
+        'berlin': {'score': berlin[0], 'category': berlin[1]},
+        'stopbang': {'score': stopbang[0], 'category': stopbang[1]},
+        'overall_risk_level': overall_risk_level(ess[1], berlin[1], stopbang[1])
+    }
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_array_scoring_matches_scalar(seed):
+    records = random_records(4000, seed)
+    scores, errors = score_records(records)
+
+    assert errors == {}
+    for record, row in zip(records, score_rows(scores)):
+        assert row == scalar_row(record), record
+
+
+def test_bad_records_are_reported_per_row():
+    records = [{'bmi': 'heavy'}, 'not a record', {}]
+    scores, errors = score_records(records)
+
+    assert set(errors) == {0, 1}
+    assert score_rows(scores)[2] == scalar_row({
+        'ess_responses': [], 'berlin_category1': {}, 'berlin_category2': {},
+        'berlin_category3_sleepy': False, 'bmi': 25.0, 'age': 30, 'neck_circumference': 37.0,
+        'male': True, 'snoring': False, 'tired': False, 'observed_apnea': False, 'hypertension': False
+    })
@@ -0,0 +1,36 @@
+"""TokenCache must not cache a token revoked while require_auth was reading it."""
+
+from datetime import datetime, timedelta
+
+from token_cache import TokenCache
+
+USER = {'id': 1, 'email': 'a@example.com', 'first_name': 'A', 'last_name': 'B', 'is_guest': False}
+
+
+def expiry():
+    return datetime.now() + timedelta(hours=1)
+
+
+def test_put_caches_token():
+    cache = TokenCache()
+    epoch = cache.epoch()
+    assert cache.put('t', USER, expiry(), epoch=epoch)
+    assert cache.get('t') == USER
+
+
+def test_logout_during_read_is_not_undone():
+    cache = TokenCache()
+    epoch = cache.epoch()  # require_auth misses and reads the token row...
+    cache.evict('t', generation=1)  # ...a logout deletes it and evicts...
+    assert not cache.put('t', USER, expiry(), epoch=epoch)  # ...so the stale row is dropped
+    assert cache.get('t') is None
+
+
+def test_poll_clear_during_read_drops_put():
+    generation = [0]
+    cache = TokenCache(generation_source=lambda: generation[0], poll_interval=0)
+    epoch = cache.epoch()
+    cache.get('other')  # first poll records generation 0
+    generation[0] += 1  # another worker revokes tokens
+    cache.get('other')
+    assert not cache.put('t', USER, expiry(), epoch=epoch)
@@ -0,0 +1,147 @@
+"""
+In-process cache of validated auth tokens for require_auth.
+
+A hit skips the users JOIN auth_tokens query. Entries expire at the token's own
+expires_at and the cache is bounded (LRU). Revocations are tracked by a
+generation counter stored in SQLite (auth_revocations): every logout or forced
+token removal bumps it in the same transaction, and each worker polls it at most
+every `poll_interval` seconds, dropping its whole cache when it has moved. A
+worker's own logouts evict locally straight away.
+
+A miss reads the token row before caching it, so a logout can land in between. The
+cache keeps a local epoch, advanced by every eviction or clear; callers take
+`epoch()` before the database read and pass it to `put`, which drops the entry if
+the epoch has moved since, so a token revoked mid-read is never cached.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+REVOCATIONS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS auth_revocations (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        generation INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+
+def init_revocations(cursor):
+    """Create the single-row revocation generation counter."""
+    cursor.execute(REVOCATIONS_TABLE)
+    cursor.execute('INSERT OR IGNORE INTO auth_revocations (id, generation) VALUES (1, 0)')
+
+
+def read_generation(conn):
+    row = conn.execute('SELECT generation FROM auth_revocations WHERE id = 1').fetchone()
+    return row[0] if row else 0
+
+
+def bump_generation(conn):
+    """Increment the revocation generation (caller commits); returns the new value."""
+    conn.execute('UPDATE auth_revocations SET generation = generation + 1 WHERE id = 1')
+    return read_generation(conn)
+
+
+def parse_expiry(value):
+    """expires_at as stored by sqlite3 (datetime or ISO string) -> datetime."""
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+class TokenCache:
+    """Thread-safe bounded LRU of token -> user context, expiring at each token's expires_at."""
+
+    def __init__(self, max_size=10000, generation_source=None, poll_interval=2.0):
+        self.max_size = max_size
+        self.generation_source = generation_source
+        self.poll_interval = poll_interval
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+        self._next_poll = 0.0
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _sync_generation(self):
+        """Poll the shared revocation counter; clear everything if another worker revoked tokens."""
+        if self.generation_source is None or time.monotonic() < self._next_poll:
+            return
+        self._next_poll = time.monotonic() + self.poll_interval
+        generation = self.generation_source()
+        with self._lock:
+            if generation != self._generation:
+                if self._generation is not None:
+                    self._data.clear()
+                    self._epoch += 1
+                    self.invalidations += 1
+                self._generation = generation
+
+    def get(self, token):
+        """Cached user context for a token, or None."""
+        self._sync_generation()
+        with self._lock:
+            entry = self._data.get(token)
+            if entry is None or entry[0] <= datetime.now():
+                if entry is not None:
+                    del self._data[token]
+                self.misses += 1
+                return None
+            self._data.move_to_end(token)
+            self.hits += 1
+            return dict(entry[1])
+
+    def epoch(self):
+        """Local eviction counter; take it before reading a token from the database."""
+        with self._lock:
+            return self._epoch
+
+    def put(self, token, user, expires_at, epoch=None):
+        """
+        Cache a token read from the database. With `epoch` (from `epoch()` before the
+        read) the entry is dropped if anything was evicted or cleared since.
+        """
+        with self._lock:
+            if epoch is not None and epoch != self._epoch:
+                return False
+            self._data[token] = (parse_expiry(expires_at), dict(user))
+            self._data.move_to_end(token)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+            return True
+
+    def evict(self, *tokens, generation=None):
+        """
+        Drop tokens revoked by this worker. `generation` is the counter value after
+        our own bump; if it is exactly one ahead we adopt it instead of clearing the
+        whole cache on the next poll.
+        """
+        with self._lock:
+            for token in tokens:
+                self._data.pop(token, None)
+            self._epoch += 1
+            if generation is not None and self._generation is not None and generation == self._generation + 1:
+                self._generation = generation
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._epoch += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'generation': self._generation
+            }
@@ -0,0 +1,135 @@
+"""
+Background cleanup for auth_tokens.
+
+Every login inserts a token and nothing removed expired ones, so the table grew
+without bound. TokenSweeper runs on a daemon thread, off the request path:
+
+- after a login it trims that user's tokens to the newest `max_tokens_per_user`
+  (oldest first), revoking the evicted ones through the token cache;
+- at most every `interval` seconds it deletes expired tokens in batches of
+  `batch_size`, committing between batches so writers are never held up for long.
+
+login only records the user id and wakes the thread.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+from token_cache import bump_generation
+
+
+EXPIRED_BATCH_SQL = '''
+    DELETE FROM auth_tokens WHERE id IN (
+        SELECT id FROM auth_tokens WHERE expires_at <= ? LIMIT ?
+    )
+'''
+
+# Tokens beyond the newest N for one user (id order == creation order)
+EXCESS_TOKENS_SQL = '''
+    SELECT id, token FROM auth_tokens
+    WHERE user_id = ?
+    ORDER BY id DESC
+    LIMIT -1 OFFSET ?
+'''
+
+
+class TokenSweeper:
+    """Amortized expired-token deletion and per-user token cap on a background thread."""
+
+    def __init__(self, pool, interval=3600, batch_size=500, max_tokens_per_user=10, on_revoke=None):
+        self.pool = pool
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_tokens_per_user = max_tokens_per_user
+        self.on_revoke = on_revoke  # called with (tokens, generation) after capped tokens are deleted
+        self._pending_users = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._next_sweep = 0.0
+        self.expired_deleted = 0
+        self.capped_deleted = 0
+        self.sweeps = 0
+        self.last_sweep_at = None
+        self.last_sweep_ms = None
+        self.errors = 0
+
+    def after_login(self, user_id):
+        """Queue the user for the token cap and wake the sweeper (non-blocking)."""
+        with self._lock:
+            self._pending_users.add(user_id)
+            if self._thread is None or not self._thread.is_alive():
+                # Started lazily so forked workers each get their own thread
+                self._thread = threading.Thread(target=self._run, name='token-sweeper', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(timeout=self.interval)
+            self._wake.clear()
+            try:
+                self.run_once()
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Token sweeper error: {e}")
+
+    def run_once(self, force=False):
+        """Apply pending per-user caps, then sweep expired tokens if the interval has elapsed."""
+        with self._lock:
+            users, self._pending_users = self._pending_users, set()
+        for user_id in users:
+            self.enforce_cap(user_id)
+        if force or time.monotonic() >= self._next_sweep:
+            self._next_sweep = time.monotonic() + self.interval
+            self.sweep_expired()
+
+    def enforce_cap(self, user_id):
+        """Delete a user's oldest tokens beyond the cap; returns how many were removed."""
+        conn = self.pool.acquire()
+        try:
+            excess = conn.execute(EXCESS_TOKENS_SQL, (user_id, self.max_tokens_per_user)).fetchall()
+            if not excess:
+                return 0
+            conn.executemany('DELETE FROM auth_tokens WHERE id = ?', [(row[0],) for row in excess])
+            generation = bump_generation(conn)
+            conn.commit()
+        finally:
+            self.pool.release(conn)
+        self.capped_deleted += len(excess)
+        if self.on_revoke is not None:
+            self.on_revoke([row[1] for row in excess], generation)
+        return len(excess)
+
+    def sweep_expired(self):
+        """Delete expired tokens in batches; returns how many were removed."""
+        start = time.perf_counter()
+        deleted = 0
+        now = datetime.now()
+        conn = self.pool.acquire()
+        try:
+            while True:
+                cursor = conn.execute(EXPIRED_BATCH_SQL, (now, self.batch_size))
+                conn.commit()
+                deleted += cursor.rowcount
+                if cursor.rowcount < self.batch_size:
+                    break
+        finally:
+            self.pool.release(conn)
+        self.expired_deleted += deleted
+        self.sweeps += 1
+        self.last_sweep_at = datetime.now().isoformat()
+        self.last_sweep_ms = round((time.perf_counter() - start) * 1000, 2)
+        return deleted
+
+    def stats(self):
+        return {
+            'expired_deleted': self.expired_deleted,
+            'capped_deleted': self.capped_deleted,
+            'sweeps': self.sweeps,
+            'last_sweep_at': self.last_sweep_at,
+            'last_sweep_ms': self.last_sweep_ms,
+            'max_tokens_per_user': self.max_tokens_per_user,
+            'errors': self.errors
+        }